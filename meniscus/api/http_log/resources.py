@@ -1,12 +1,94 @@
 import falcon
 
+from oslo.config import cfg
+
 from meniscus.api.tenant.resources import MESSAGE_TOKEN
-from meniscus.api import (ApiResource, handle_api_exception)
+from meniscus.api import (abort, ApiResource, format_response_body,
+                          handle_api_exception)
+from meniscus.correlation.batcher import QueueUnavailableError
+from meniscus.correlation.batcher import TaskBatcher
 from meniscus.correlation import correlator
+from meniscus.api.validator_init import get_schema_validator
 from meniscus.api.validator_init import get_validator
+import meniscus.config as config
+from meniscus import env
+from meniscus.openstack.common import jsonutils
+from meniscus import proxy
+
+
+_LOG = env.get_logger(__name__)
+
+# Publish configuration options
+_PUBLISH_GROUP = cfg.OptGroup(name='publish', title='Publish Options')
+config.get_config().register_group(_PUBLISH_GROUP)
+
+_PUBLISH_OPTIONS = [
+    cfg.IntOpt('max_batch_size',
+               default=1000,
+               help="""maximum number of messages accepted in one batch"""
+               ),
+    cfg.IntOpt('task_batch_size',
+               default=1,
+               help="""number of messages posted to the publish endpoint
+                    that are queued for correlation as one task, 1 queues a
+                    task for each message. Batches are queued by a thread, so
+                    under uWSGI this requires enable-threads, and a task is
+                    queued for each message without it"""
+               ),
+    cfg.IntOpt('task_batch_linger_ms',
+               default=20,
+               help="""longest time in milliseconds a posted message waits
+                    for a correlation task batch to fill"""
+               )
+]
+
+config.get_config().register_opts(_PUBLISH_OPTIONS, group=_PUBLISH_GROUP)
+
+try:
+    config.init_config()
+except config.cfg.ConfigFilesNotFoundError as ex:
+    _LOG.exception(ex.message)
+
+MAX_BATCH_SIZE = config.get_config().publish.max_batch_size
+TASK_BATCH_SIZE = config.get_config().publish.task_batch_size
+TASK_BATCH_LINGER_MS = config.get_config().publish.task_batch_linger_ms
+
+JSON_CONTENT_TYPE = 'application/json'
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/x-ldjson')
+
+
+def _threads_enabled():
+    """
+    Returns False when running under uWSGI without threads enabled, where
+    threads started by the application never run
+    """
+    if not proxy.UWSGI:
+        return True
+    return bool(proxy.uwsgi.opt.get('enable-threads') or
+                proxy.uwsgi.opt.get('threads'))
 
 
 class PublishMessageResource(ApiResource):
+    """
+    Accepts a single log message for a tenant. When task_batch_size is
+    greater than 1, messages from concurrent requests are queued for
+    correlation together instead of as a task each. An accepted message then
+    waits in the memory of the process for up to task_batch_linger_ms before
+    it is queued, and messages are refused with a 503 while a batch can not
+    be queued.
+    """
+
+    def __init__(self, task_batch_size=TASK_BATCH_SIZE,
+                 task_batch_linger_ms=TASK_BATCH_LINGER_MS):
+        self.batcher = None
+        if task_batch_size > 1 and not _threads_enabled():
+            _LOG.warning('publish.task_batch_size is ignored because uWSGI '
+                         'runs without enable-threads, a task is queued '
+                         'for each message')
+        elif task_batch_size > 1:
+            self.batcher = TaskBatcher(
+                correlator.correlate_http_message_entries,
+                task_batch_size, task_batch_linger_ms)
 
     @handle_api_exception(operation_name='Publish Message POST')
     @falcon.before(get_validator('correlation'))
@@ -24,8 +106,105 @@ class PublishMessageResource(ApiResource):
         message_token = req.get_header(MESSAGE_TOKEN, required=True)
 
         # Queue the message for correlation
-        correlator.correlate_http_message.delay(tenant_id,
-                                                message_token,
-                                                message)
+        if self.batcher:
+            try:
+                self.batcher.add([tenant_id, message_token, message])
+            except QueueUnavailableError:
+                abort(falcon.HTTP_503, 'Unable to queue the message')
+        else:
+            correlator.correlate_http_message.delay(tenant_id,
+                                                    message_token,
+                                                    message)
 
         resp.status = falcon.HTTP_202
+
+
+def _load_batch_body(req):
+    """
+    Reads a batch of log messages from the request body. The body may be a
+    JSON array of messages, or newline delimited JSON with one message per
+    line.
+    """
+    content_type = (req.content_type or '').split(';')[0].strip().lower()
+
+    if content_type not in (JSON_CONTENT_TYPE,) + NDJSON_CONTENT_TYPES:
+        abort(falcon.HTTP_415, 'Unsupported Media Type')
+
+    try:
+        raw_body = req.stream.read()
+    except Exception as ex:
+        _LOG.debug(ex)
+        abort(falcon.HTTP_500, 'Read Error')
+
+    try:
+        if content_type == JSON_CONTENT_TYPE:
+            messages = jsonutils.loads(raw_body)
+        else:
+            messages = [jsonutils.loads(line)
+                        for line in raw_body.splitlines() if line.strip()]
+    except ValueError:
+        _LOG.debug('Malformed JSON: {0}'.format(raw_body))
+        abort(falcon.HTTP_400, 'Malformed JSON')
+
+    if not isinstance(messages, list):
+        abort(falcon.HTTP_400, 'A batch must be a list of log messages')
+
+    if not messages:
+        abort(falcon.HTTP_400, 'A batch must contain at least one message')
+
+    if len(messages) > MAX_BATCH_SIZE:
+        abort(falcon.HTTP_413,
+              'A batch may contain at most {0} messages'.format(
+                  MAX_BATCH_SIZE))
+
+    return messages
+
+
+class PublishBatchResource(ApiResource):
+    """
+    Accepts a batch of log messages for a tenant in a single request. Each
+    message is validated against the correlation schema, and all valid
+    messages are queued for correlation as one task.
+    """
+
+    def __init__(self):
+        self.validator = get_schema_validator('correlation')
+
+    @handle_api_exception(operation_name='Publish Batch POST')
+    def on_post(self, req, resp, tenant_id):
+        """
+        Validates and queues a batch of log messages. The response body
+        reports whether each message, by its position in the batch, was
+        accepted or rejected.
+        """
+        #read message token from header
+        message_token = req.get_header(MESSAGE_TOKEN, required=True)
+
+        messages = _load_batch_body(req)
+
+        accepted = list()
+        results = list()
+        for index, message in enumerate(messages):
+            validation_result = self.validator.validate(
+                {'log_message': message})
+
+            if validation_result.valid:
+                accepted.append(message)
+                results.append({'index': index, 'accepted': True})
+            else:
+                results.append({'index': index, 'accepted': False,
+                                'error': validation_result.error.message})
+
+        if accepted:
+            # Queue the valid messages for correlation as a single task
+            correlator.correlate_http_messages.delay(tenant_id,
+                                                     message_token,
+                                                     accepted)
+            resp.status = falcon.HTTP_202
+        else:
+            resp.status = falcon.HTTP_400
+
+        resp.body = format_response_body({
+            'accepted': len(accepted),
+            'rejected': len(messages) - len(accepted),
+            'results': results})
@@ -15,6 +15,8 @@ from meniscus.openstack.common.timeutils import isotime
 
 MESSAGE_TOKEN = 'MESSAGE-TOKEN'
 MIN_TOKEN_TIME_LIMIT_HRS = 3
+DEFAULT_CHANGES_LIMIT = 100
+MAX_CHANGES_LIMIT = 1000
 
 
 def _tenant_not_found():
@@ -235,7 +237,7 @@ class EventProducerResource(api.ApiResource):
                     'EventProducer with name {0} already exists with id={1}.'
                     .format(duplicate_producer.name,
                             duplicate_producer.get_id()))
-            event_producer.name = body['name']
+            tenant.rename_event_producer(event_producer, body['name'])
 
         if 'pattern' in body:
             event_producer.pattern = str(body['pattern'])
@@ -371,3 +373,82 @@ class TokenResource(api.ApiResource):
 
         resp.status = falcon.HTTP_203
         resp.set_header('Location', '/v1/{0}/token'.format(tenant_id))
+
+
+class TenantValidationResource(api.ApiResource):
+    """
+    The Tenant Validation Resource validates a message token and returns the
+    tenant in a single call, so that a worker can correlate messages for a
+    tenant it has not cached with one request to the coordinator.
+    """
+
+    @api.handle_api_exception(operation_name='Tenant Validation GET')
+    def on_get(self, req, resp, tenant_id):
+        """
+        Validates the message token for a specified tenant and returns the
+        tenant when an HTTP GET is received. The response carries an ETag for
+        the tenant, and a 304 is returned when the If-None-Match header
+        matches it.
+        """
+
+        #get message token, or abort if token is not in header
+        message_token = req.get_header(MESSAGE_TOKEN, required=True)
+
+        #verify the tenant exists
+        tenant = tenant_util.find_tenant(tenant_id=tenant_id)
+
+        if not tenant:
+            _tenant_not_found()
+
+        if not tenant.token.validate_token(message_token):
+            _message_token_is_invalid()
+
+        etag = tenant_util.generate_etag(tenant)
+        resp.etag = '"{0}"'.format(etag)
+
+        if req.if_none_match:
+            matching_etags = [
+                tag.strip().strip('"')
+                for tag in req.if_none_match.split(',')]
+            if etag in matching_etags:
+                resp.status = falcon.HTTP_304
+                return
+
+        resp.status = falcon.HTTP_200
+        resp.body = api.format_response_body({'tenant': tenant.format()})
+
+
+class TenantChangesResource(api.ApiResource):
+    """
+    The Tenant Changes Resource pages through tenants, with their tokens and
+    event producers, in the order they were last changed. Workers use it to
+    load every tenant into their caches at start up, and then to apply only
+    the changes made since the last page they received.
+
+    The tenants carry their message tokens, so the resource is only routed
+    by the coordinator persona that workers talk to, and never by the public
+    tenant persona.
+    """
+
+    @api.handle_api_exception(operation_name='Tenant Changes GET')
+    def on_get(self, req, resp):
+        """
+        Returns the tenants changed after the change sequence number given by
+        the "since" query parameter. The response includes the cursor to pass
+        as "since" for the next page, and whether more changes remain.
+        """
+        since = req.get_param_as_int('since', min=0) or 0
+        limit = req.get_param_as_int(
+            'limit', min=1, max=MAX_CHANGES_LIMIT) or DEFAULT_CHANGES_LIMIT
+
+        tenants = tenant_util.retrieve_tenant_changes(since=since, limit=limit)
+
+        next_cursor = since
+        if tenants:
+            next_cursor = tenants[-1].change_seq
+
+        resp.status = falcon.HTTP_200
+        resp.body = api.format_response_body({
+            'tenants': [tenant.format() for tenant in tenants],
+            'next': next_cursor,
+            'more': len(tenants) == limit})
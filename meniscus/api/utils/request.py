@@ -1,10 +1,53 @@
+import os
+import threading
+import time
+import urlparse
+
+from oslo.config import cfg
 import requests
+from requests.adapters import HTTPAdapter
 
+import meniscus.config as config
 from meniscus import env
 
 
 _LOG = env.get_logger(__name__)
 
+# HTTP client configuration options
+_HTTP_CLIENT_GROUP = cfg.OptGroup(
+    name='http_client', title='HTTP Client Options')
+config.get_config().register_group(_HTTP_CLIENT_GROUP)
+
+_HTTP_CLIENT_OPTIONS = [
+    cfg.IntOpt('pool_maxsize',
+               default=10,
+               help="""maximum number of kept alive connections per host"""
+               ),
+    cfg.FloatOpt('timeout',
+                 default=1.0,
+                 help="""default time in seconds to wait for a response"""
+                 ),
+    cfg.IntOpt('retries',
+               default=2,
+               help="""number of times an idempotent request is retried
+                    after a connection error or timeout"""
+               ),
+    cfg.FloatOpt('retry_backoff',
+                 default=0.1,
+                 help="""time in seconds to wait before the first retry,
+                    doubled for each following retry"""
+                 )
+]
+
+config.get_config().register_opts(
+    _HTTP_CLIENT_OPTIONS, group=_HTTP_CLIENT_GROUP)
+
+try:
+    config.init_config()
+except config.cfg.ConfigFilesNotFoundError as ex:
+    _LOG.exception(ex.message)
+
+_CONF = config.get_config()
 
 HTTP_VERBS = (
     'GET',
@@ -14,9 +57,133 @@ HTTP_VERBS = (
     'HEAD'
 )
 
+#verbs that are safe to send again when a request fails to complete
+IDEMPOTENT_HTTP_VERBS = (
+    'GET',
+    'DELETE',
+    'PUT',
+    'HEAD'
+)
+
+
+class HostStats(object):
+    """
+    Request counts and latencies for a single host
+    """
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds, error=False):
+        self.requests += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        if error:
+            self.errors += 1
+
+    def format(self):
+        average_ms = 0.0
+        if self.requests:
+            average_ms = self.total_seconds * 1000 / self.requests
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'average_ms': average_ms,
+            'max_ms': self.max_seconds * 1000
+        }
+
+
+class HttpClient(object):
+    """
+    An HTTP client that keeps connections alive between requests. Requests
+    are sent through a single requests.Session with a bounded connection pool
+    for each host. Idempotent requests that fail with a connection error or
+    timeout are retried with exponential backoff, and request latencies are
+    recorded for each host.
+    """
+
+    def __init__(self, pool_maxsize=_CONF.http_client.pool_maxsize,
+                 timeout=_CONF.http_client.timeout,
+                 retries=_CONF.http_client.retries,
+                 retry_backoff=_CONF.http_client.retry_backoff):
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.session = requests.Session()
+
+        adapter = HTTPAdapter(pool_maxsize=pool_maxsize, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._host_stats = dict()
+        self._stats_lock = threading.Lock()
+
+    def request(self, http_verb, url, headers=None, data=None, timeout=None):
+        """
+        Sends a request and returns the response
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        retries = 0
+        if http_verb in IDEMPOTENT_HTTP_VERBS:
+            retries = self.retries
+
+        attempt = 0
+        while True:
+            start = time.time()
+            try:
+                response = self.session.request(
+                    http_verb, url, headers=headers, data=data,
+                    timeout=timeout, allow_redirects=(http_verb != 'HEAD'))
+                self._record(url, time.time() - start)
+                return response
+
+            except (requests.ConnectionError, requests.Timeout):
+                self._record(url, time.time() - start, error=True)
+                if attempt >= retries:
+                    raise
+
+            time.sleep(self.retry_backoff * (2 ** attempt))
+            attempt += 1
+
+    def _record(self, url, seconds, error=False):
+        host = urlparse.urlparse(url).netloc
+        with self._stats_lock:
+            if host not in self._host_stats:
+                self._host_stats[host] = HostStats()
+            self._host_stats[host].record(seconds, error)
+
+    def stats(self):
+        """
+        Returns request counts and latencies for each host
+        """
+        with self._stats_lock:
+            return dict(
+                (host, host_stats.format())
+                for host, host_stats in self._host_stats.iteritems())
+
+
+_client = None
+_client_pid = None
+
+
+def get_client():
+    """
+    Returns the HttpClient for the current process. Connections can not be
+    shared with a forked process, so a new client is created after a fork.
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        _client = HttpClient()
+        _client_pid = os.getpid()
+    return _client
+
 
 def http_request(url, add_headers=None, json_payload='{}', http_verb='GET',
-                 request_timeout=1.0):
+                 request_timeout=None):
     headers = {'content-type': 'application/json'}
 
     if add_headers:
@@ -27,20 +194,15 @@ def http_request(url, add_headers=None, json_payload='{}', http_verb='GET',
         raise ValueError(
             'Invalid HTTP verb supplied: {0}'.format(http_verb))
 
+    #only requests that carry a body send the payload
+    data = None
+    if http_verb in ('POST', 'DELETE', 'PUT'):
+        data = json_payload
+
     try:
-        if http_verb == 'GET':
-            return requests.get(url, headers=headers, timeout=request_timeout)
-        elif http_verb == 'POST':
-            return requests.post(url, data=json_payload, headers=headers,
-                                 timeout=request_timeout)
-        elif http_verb == 'DELETE':
-            return requests.delete(url, data=json_payload, headers=headers,
-                                   timeout=request_timeout)
-        elif http_verb == 'PUT':
-            return requests.put(url, data=json_payload, headers=headers,
-                                timeout=request_timeout)
-        elif http_verb == 'HEAD':
-            return requests.head(url, headers=headers, timeout=request_timeout)
+        return get_client().request(
+            http_verb, url, headers=headers, data=data,
+            timeout=request_timeout)
 
     except requests.ConnectionError as conn_err:
         _LOG.exception(conn_err.message)
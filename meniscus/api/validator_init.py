@@ -41,3 +41,11 @@ _validation_factory = jsonv.JsonSchemaValidatorFactory(_schema_loader)
 
 def get_validator(schema_name):
     return validation_hook(_validation_factory.get_validator(schema_name))
+
+
+def get_schema_validator(schema_name):
+    """
+    Returns the underlying schema validator rather than a falcon hook, for
+    resources that need to validate documents outside of the request body
+    """
+    return _validation_factory.get_validator(schema_name)
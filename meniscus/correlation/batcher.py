@@ -0,0 +1,126 @@
+"""
+The batcher module collects the arguments of individual messages and queues
+them as a single batch task, so that entry points which receive one message
+at a time can still use the batch variants of the correlation tasks.
+
+Entries are held in the memory of the process until their batch is queued,
+which is at most linger_ms after the first entry of the batch was added. An
+entry that was added is lost if the process exits before then. A batch that
+can not be queued, for instance while the broker is unreachable, is kept and
+queued again, and the batcher refuses new entries until it succeeds so that
+callers can reject messages instead of accepting them and dropping them.
+"""
+
+import os
+import threading
+
+from meniscus import env
+
+
+_LOG = env.get_logger(__name__)
+
+
+class QueueUnavailableError(Exception):
+    pass
+
+
+class TaskBatcher(object):
+    """
+    Collects entries and queues them with task.delay(entries) once the batch
+    is full, or once the first entry of the batch has waited for linger_ms
+    milliseconds. A full batch is queued by the caller that filled it. When
+    queueing fails the entries are queued again after linger_ms, and add
+    raises QueueUnavailableError until they have been queued.
+    """
+
+    def __init__(self, task, batch_size, linger_ms):
+        """
+        :param task: the celery task that accepts a list of entries
+        :param batch_size: number of entries queued as one task
+        :param linger_ms: longest time in milliseconds an entry waits for
+        the batch to fill, and the time between attempts to queue a batch
+        that failed
+        """
+        self.task = task
+        self.batch_size = batch_size
+        self.linger_ms = linger_ms
+        self._entries = list()
+        self._timer = None
+        self._failing = False
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _reset_after_fork(self):
+        #a forked process does not inherit the parent's timer thread, and
+        #the parent's pending entries are queued by the parent
+        if self._pid != os.getpid():
+            self._entries = list()
+            self._timer = None
+            self._failing = False
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+
+    def add(self, entry):
+        """
+        Adds an entry to the current batch, queueing the batch if it is full.
+        Raises QueueUnavailableError without adding the entry while a batch
+        that failed to queue is waiting to be queued again.
+        """
+        self._reset_after_fork()
+        batch = None
+
+        with self._lock:
+            if self._failing:
+                raise QueueUnavailableError(
+                    'unable to queue messages for correlation')
+
+            self._entries.append(entry)
+
+            if len(self._entries) >= self.batch_size:
+                batch = self._take_batch()
+            else:
+                self._start_timer()
+
+        if batch:
+            self._queue(batch)
+
+    def flush(self):
+        """
+        Queues the current batch, however many entries it holds
+        """
+        self._reset_after_fork()
+
+        with self._lock:
+            batch = self._take_batch()
+
+        if batch:
+            self._queue(batch)
+
+    def _start_timer(self):
+        if self._timer is None:
+            self._timer = threading.Timer(
+                self.linger_ms / 1000.0, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _take_batch(self):
+        batch = self._entries
+        self._entries = list()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def _queue(self, batch):
+        try:
+            self.task.delay(batch)
+        except Exception:
+            _LOG.exception(
+                'unable to queue a batch of {0} messages'.format(len(batch)))
+            with self._lock:
+                self._entries[0:0] = batch
+                self._failing = True
+                self._start_timer()
+        else:
+            with self._lock:
+                self._failing = False
@@ -0,0 +1,114 @@
+"""
+The coalesce module provides request coalescing for the correlation pipeline.
+When several messages need the same resource at the same time, only the first
+caller performs the lookup and the others wait for and share its result.
+
+Calls made by threads of a process are coalesced in memory. Calls made by
+different processes, such as the processes of the prefork pool of a celery
+worker, are coalesced through a marker in the shared cache: the process that
+holds the marker makes the lookup and caches its result, while the other
+processes wait for the marker to be released and read the result from the
+cache.
+"""
+
+import threading
+import time
+
+
+class _Call(object):
+    """
+    Tracks a lookup that is in flight and the result it produced
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Ensures that only one call is in flight for a given key. Callers that ask
+    for a key while a call for it is in flight block until that call finishes,
+    then receive its result or have its exception raised.
+
+    When markers and lookup are given, calls are also coalesced with the
+    other processes sharing the markers' cache. Only the process holding the
+    marker for a key calls func, which must cache its result, and the other
+    processes poll lookup(key) for that result until the marker is released.
+    A process that waits for longer than the markers expire calls func itself.
+    """
+
+    def __init__(self, markers=None, lookup=None, poll_seconds=0.05):
+        """
+        :param markers: an InFlightCache holding the keys in flight in every
+        process
+        :param lookup: a function that returns the cached result of the call
+        for a key, or None
+        :param poll_seconds: time between reads of the cached result while
+        another process holds the marker
+        """
+        self.markers = markers
+        self.lookup = lookup
+        self.poll_seconds = poll_seconds
+        self._calls = dict()
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Calls func with the given arguments, unless a call for the key is
+        already in flight, in which case the result of that call is returned
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._call(key, func, args, kwargs)
+            return call.result
+        except Exception as ex:
+            call.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _call(self, key, func, args, kwargs):
+        """
+        Calls func once the marker for the key is held, or returns the result
+        another process cached while it held the marker
+        """
+        if self.markers is None:
+            return func(*args, **kwargs)
+
+        deadline = time.time() + self.markers.expires
+        waited = False
+        while not self.markers.acquire(key):
+            if time.time() >= deadline:
+                return func(*args, **kwargs)
+
+            time.sleep(self.poll_seconds)
+            waited = True
+            result = self.lookup(key)
+            if result is not None:
+                return result
+
+        try:
+            #the previous holder may have cached its result just before it
+            #released the marker
+            if waited:
+                result = self.lookup(key)
+                if result is not None:
+                    return result
+            return func(*args, **kwargs)
+        finally:
+            self.markers.release(key)
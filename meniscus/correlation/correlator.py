@@ -7,12 +7,19 @@ persisted in case of a service restart.
 
 There are 2 entry points into the pipeline, one for messages that are received
 from a syslog parser, and another entry point for messages posted to the
-http_log endpoint.
+http_log endpoint. Messages posted to the http_log batch endpoint enter the
+pipeline through a batch variant of the http entry point.
+
+The batch variants group their messages by tenant and message token, so that
+each token is validated once per batch rather than once per message. Only the
+messages of groups that could not be validated because the coordinator was
+unreachable are retried.
 
 Case 1 - Syslog: Entry point - correlate_src_syslog_message
 
     calls method to format syslog message to CEE
-    before following the same pipeline as the HTTP entry point
+    before following the same pipeline as the HTTP entry point. Batches of
+    syslog messages received together enter through a batch variant.
 
 Case 2 - HTTP: Entry point - correlate_src_http_message
 
@@ -21,8 +28,9 @@ Case 2 - HTTP: Entry point - correlate_src_http_message
     a local cache for faster processing. Message validation is first attempted
     by looking up information in the local cache. If the cache does not contain
     the necessary information to validate the message, the the message
-    validation is attempted by making http calls to the Tenant API hosted on
-    the coordinator.
+    validation is attempted by making an http call to the Tenant API hosted on
+    the coordinator, which validates the token and returns the tenant in a
+    single request.
 
     Add Tenant Data to Message - After validating the message, configuration
     data from the tenant used for processing the message are added to the
@@ -30,14 +38,25 @@ Case 2 - HTTP: Entry point - correlate_src_http_message
 
     Normalization or Storage - The data added to the message is used to decide
     whether the message should be queued for normalization or for storage.
+    When fused execution is enabled, normalization is performed in the same
+    process that correlated the message. When the transient_non_durable
+    option is set, messages from event producers that are not durable take
+    the same in process path, and are sent to a transient queue for storage,
+    so that only durable producers pay for persistent queues.
 """
 
+from collections import OrderedDict
 import httplib
+
+from oslo.config import cfg
 import requests
 
+from meniscus.config import get_config
+from meniscus.config import init_config
 from meniscus import env
 from meniscus.api.tenant.resources import MESSAGE_TOKEN
 from meniscus.api.utils.request import http_request
+from meniscus.correlation import coalesce
 from meniscus.correlation import errors
 from meniscus.data import cache_handler
 from meniscus.data.model.tenant import EventProducer
@@ -45,13 +64,54 @@ from meniscus.data.model import tenant_util
 from meniscus.normalization import normalizer
 from meniscus.openstack.common import timeutils
 from meniscus.queue import celery
+from meniscus.queue import TASK_COMPRESSION
+from meniscus.queue import TASK_SERIALIZER
+from meniscus.queue import TRANSIENT_NON_DURABLE
 from meniscus import sinks
 
 _LOG = env.get_logger(__name__)
 
-
-@celery.task(acks_late=True, max_retries=None,
-             ignore_result=True, serializer="json")
+# pipeline configuration options
+_PIPELINE_GROUP = cfg.OptGroup(
+    name='pipeline', title='Correlation Pipeline Options')
+get_config().register_group(_PIPELINE_GROUP)
+
+_PIPELINE_OPTIONS = [
+    cfg.BoolOpt('fused_execution',
+                default=False,
+                help="""normalize and route correlated messages in the same
+                    process instead of queueing a task for each step"""
+                )
+]
+
+get_config().register_opts(_PIPELINE_OPTIONS, group=_PIPELINE_GROUP)
+try:
+    init_config()
+    conf = get_config()
+except cfg.ConfigFilesNotFoundError:
+    conf = get_config()
+
+FUSED_EXECUTION = conf.pipeline.fused_execution
+
+#coordinator lookups in flight, shared by concurrent messages of every
+#process sharing the cache, which wait for the tenant to be cached
+_coordinator_calls = coalesce.SingleFlight(
+    markers=cache_handler.InFlightCache(),
+    lookup=lambda key: _get_cached_tenant(*key))
+
+#compiled correlation templates, keyed by tenant id, change sequence number
+#and producer name, so that a tenant changed by the change feed is compiled
+#again however long an older copy of it stays cached
+_correlation_templates = cache_handler.LocalCache()
+
+#unknown tenants and rejected tokens, so that invalid traffic is rejected
+#without calling the coordinator
+_negative_cache = cache_handler.LocalCache(
+    expires=cache_handler.NEGATIVE_CACHE_EXPIRES)
+
+
+@celery.task(acks_late=True, max_retries=None, ignore_result=True,
+             serializer=TASK_SERIALIZER, compression=TASK_COMPRESSION)
 def correlate_syslog_message(message):
     """
     Entry point into correlation pipeline for messages received from the
@@ -74,8 +134,41 @@ def correlate_syslog_message(message):
         raise correlate_syslog_message.retry()
 
 
-@celery.task(acks_late=True, max_retries=None,
-             ignore_result=True, serializer="json")
+@celery.task(acks_late=True, max_retries=None, ignore_result=True,
+             serializer=TASK_SERIALIZER, compression=TASK_COMPRESSION)
+def correlate_syslog_messages(messages):
+    """
+    Entry point into correlation pipeline for a batch of messages received
+    from the syslog parser. Each message is converted into CEE format, and the
+    messages are then validated once for each tenant and token in the batch.
+
+    Messages that fail because the coordinator could not be reached are
+    collected and the task is retried with only those messages. Messages that
+    fail validation are dropped.
+    """
+    entries = list()
+
+    for message in messages:
+        try:
+            tenant_id, message_token, cee_message = _convert_message_cee(
+                message)
+        except errors.PublishMessageError as ex:
+            _LOG.debug('Message correlation failed: {0}'.format(ex.msg))
+            continue
+        except Exception:
+            _LOG.exception('Dropped a malformed syslog message')
+            continue
+
+        entries.append((tenant_id, message_token, cee_message, message))
+
+    failed_messages = _correlate_batch(entries)
+
+    if failed_messages:
+        raise correlate_syslog_messages.retry(args=[failed_messages])
+
+
+@celery.task(acks_late=True, max_retries=None, ignore_result=True,
+             serializer=TASK_SERIALIZER, compression=TASK_COMPRESSION)
 def correlate_http_message(tenant_id, message_token, message):
     """
     Entry point into correlation pipeline for messages received from the
@@ -99,9 +192,115 @@ def correlate_http_message(tenant_id, message_token, message):
         raise correlate_http_message.retry()
 
 
+@celery.task(acks_late=True, max_retries=None, ignore_result=True,
+             serializer=TASK_SERIALIZER, compression=TASK_COMPRESSION)
+def correlate_http_messages(tenant_id, message_token, messages):
+    """
+    Entry point into correlation pipeline for a batch of messages received
+    from the PublishBatch resource. All messages in a batch belong to the same
+    tenant and are published with the same message token, so the token is
+    validated once for the whole batch.
+
+    If the coordinator could not be reached the task is retried. Messages
+    that fail validation are dropped.
+    """
+    failed_messages = _correlate_batch(
+        [(tenant_id, message_token, message, message)
+         for message in messages])
+
+    if failed_messages:
+        raise correlate_http_messages.retry(
+            args=[tenant_id, message_token, failed_messages])
+
+
+@celery.task(acks_late=True, max_retries=None, ignore_result=True,
+             serializer=TASK_SERIALIZER, compression=TASK_COMPRESSION)
+def correlate_http_message_entries(entries):
+    """
+    Entry point into correlation pipeline for messages received from the
+    PublishMessage resource and queued together. Each entry is a list of
+    [tenant_id, message_token, message], and entries may belong to different
+    tenants.
+
+    Messages that fail because the coordinator could not be reached are
+    collected and the task is retried with only those entries. Messages that
+    fail validation and malformed entries are dropped.
+    """
+    batch = list()
+
+    for entry in entries:
+        try:
+            tenant_id, message_token, message = entry
+        except (TypeError, ValueError):
+            _LOG.warning('Dropped a malformed message entry')
+            continue
+
+        batch.append((tenant_id, message_token, message, entry))
+
+    failed_entries = _correlate_batch(batch)
+
+    if failed_entries:
+        raise correlate_http_message_entries.retry(args=[failed_entries])
+
+
+def _correlate_batch(entries):
+    """
+    Correlates a batch of messages. Each entry is a tuple of (tenant_id,
+    message_token, message, source), where source is what the task should be
+    retried with if the message can not be correlated yet.
+
+    Messages are grouped by tenant and message token so that each token is
+    validated once. Returns the sources of the messages whose token could not
+    be validated because the coordinator was unreachable. Any other error is
+    logged and drops only the messages it occurred for, so that the rest of
+    the batch is still correlated.
+    """
+    groups = OrderedDict()
+    for tenant_id, message_token, message, source in entries:
+        groups.setdefault(
+            (tenant_id, message_token), list()).append((message, source))
+
+    failed_sources = list()
+
+    for (tenant_id, message_token), group in groups.iteritems():
+        try:
+            tenant = _get_validated_tenant(tenant_id, message_token)
+        except errors.CoordinatorCommunicationError as ex:
+            _LOG.exception(ex.message)
+            failed_sources.extend(source for message, source in group)
+            continue
+        except errors.PublishMessageError as ex:
+            _LOG.debug('Message correlation failed for {0} messages: '
+                       '{1}'.format(len(group), ex.msg))
+            continue
+        except Exception:
+            _LOG.exception('Message correlation failed for {0} '
+                           'messages'.format(len(group)))
+            continue
+
+        for message, source in group:
+            try:
+                _add_correlation_info_to_message(tenant, message)
+            except Exception:
+                _LOG.exception('Message correlation failed')
+
+    return failed_sources
+
+
 def _format_message_cee(message):
     """
-    Format message as CEE and begin message validation. The incoming message
+    Format message as CEE and begin message validation.
+    """
+    tenant_id, message_token, cee_message = _convert_message_cee(message)
+
+    #send the new cee_message to be validated
+    _validate_token_from_cache(tenant_id, message_token, cee_message)
+
+
+def _convert_message_cee(message):
+    """
+    Format message as CEE and return it with the tenant id and message token
+    it was sent with. The incoming message
     originates a syslog message (RFC 5424) that has been received on the syslog
     endpoint and parsed into the following JSON format:
 
@@ -162,8 +361,7 @@ def _format_message_cee(message):
     cee_message['msg'] = message.get('MESSAGE', '-')
     cee_message['native'] = message.get('_SDATA', {})
 
-    #send the new cee_message to be validated
-    _validate_token_from_cache(tenant_id, message_token, cee_message)
+    return tenant_id, message_token, cee_message
 
 
 def _validate_token_from_cache(tenant_id, message_token, message):
@@ -171,8 +369,8 @@ def _validate_token_from_cache(tenant_id, message_token, message):
     validate token from cache:
         Attempt to validate the message against the local cache.
         If successful, send off to retrieve the tenant information.
-        If the token does not exist in the cache, send off to validate with
-        the coordinator.
+        If the token does not exist in the cache, send off to validate the
+        token and retrieve the tenant from the coordinator.
     """
 
     token_cache = cache_handler.TokenCache()
@@ -189,7 +387,39 @@ def _validate_token_from_cache(tenant_id, message_token, message):
         _get_tenant_from_cache(tenant_id, message_token, message)
     else:
         # hand off the message to validate the token with the coordinator
-        _validate_token_with_coordinator(tenant_id, message_token, message)
+        _get_tenant_from_coordinator(tenant_id, message_token, message)
+
+
+def _get_cached_tenant(tenant_id, message_token):
+    """
+    Validates a message token against the cached token and returns the
+    cached tenant, or None when either the token or the tenant is not cached
+    """
+    token = cache_handler.TokenCache().get_token(tenant_id)
+    if not token:
+        return None
+
+    if not token.validate_token(message_token):
+        raise errors.MessageAuthenticationError(
+            'Message not authenticated, check your tenant id '
+            'and or message token for validity')
+
+    return cache_handler.TenantCache().get_tenant(tenant_id)
+
+
+def _get_validated_tenant(tenant_id, message_token):
+    """
+    Validates a message token and returns the tenant it belongs to. The token
+    and tenant are looked up in the cache first, and retrieved from the
+    coordinator when either is missing.
+    """
+    tenant = _get_cached_tenant(tenant_id, message_token)
+    if tenant:
+        return tenant
+
+    return _coordinator_calls.do(
+        (tenant_id, message_token),
+        _request_validated_tenant, tenant_id, message_token)
 
 
 def _get_tenant_from_cache(tenant_id, message_token, message):
@@ -209,46 +439,55 @@ def _get_tenant_from_cache(tenant_id, message_token, message):
         _add_correlation_info_to_message(tenant, message)
 
 
-def _validate_token_with_coordinator(tenant_id, message_token, message):
+def _get_tenant_from_coordinator(tenant_id, message_token, message):
     """
-    Call coordinator to validate the message token. If token is validated,
-    persist the token in the local cache for future lookups, and hand off
-    message to retrieve tenant information.
+    This method validates the message token and retrieves tenant data from
+    the coordinator in a single request, and persists the tenant data in the
+    local cache for future lookups. The message is then handed off to be
+    packed with correlation data.
+
+    Concurrent retrievals of the same tenant and token by the threads and
+    processes sharing the cache are coalesced into a single call to the
+    coordinator.
     """
+    tenant = _coordinator_calls.do(
+        (tenant_id, message_token),
+        _request_validated_tenant, tenant_id, message_token)
 
-    config = _get_config_from_cache()
-    try:
-        resp = http_request(
-            '{0}/tenant/{1}/token'.format(config.coordinator_uri, tenant_id),
-            {MESSAGE_TOKEN: message_token, 'hostname': config.hostname},
-            http_verb='HEAD')
+    # add correlation to message
+    _add_correlation_info_to_message(tenant, message)
 
-    except requests.RequestException as ex:
-        _LOG.exception(ex.message)
-        raise errors.CoordinatorCommunicationError
 
-    if resp.status_code != httplib.OK:
+def _request_validated_tenant(tenant_id, message_token):
+    """
+    Validates a message token and retrieves the tenant from the coordinator,
+    then saves the tenant to the cache. When an expired copy of the tenant is
+    still held locally its entity tag is sent with the request, and the
+    coordinator answers with a 304 instead of the tenant if it has not
+    changed.
+
+    Unknown tenants and rejected tokens are remembered for a short time, so
+    that repeated messages with bad credentials do not reach the coordinator.
+    """
+    negative_key = (tenant_id, message_token)
+    if _negative_cache.get(negative_key):
         raise errors.MessageAuthenticationError(
             'Message not authenticated, check your tenant id '
             'and or message token for validity')
 
-    # hand off the message to validate the tenant with the coordinator
-    _get_tenant_from_coordinator(tenant_id, message_token, message)
-
-
-def _get_tenant_from_coordinator(tenant_id, message_token, message):
-    """
-    This method retrieves tenant data from the coordinator, and persists the
-    tenant data in the local cache for future lookups. The message is then
-    handed off to be packed with correlation data.
-    """
-
     config = _get_config_from_cache()
+    headers = {MESSAGE_TOKEN: message_token, 'hostname': config.hostname}
+
+    stale_tenant = cache_handler.TenantCache().get_stale_tenant(tenant_id)
+    if stale_tenant:
+        headers['If-None-Match'] = '"{0}"'.format(
+            tenant_util.generate_etag(stale_tenant))
 
     try:
         resp = http_request(
-            '{0}/tenant/{1}'.format(config.coordinator_uri, tenant_id),
-            {MESSAGE_TOKEN: message_token, 'hostname': config.hostname},
+            '{0}/tenant/{1}/validation'.format(
+                config.coordinator_uri, tenant_id),
+            headers,
             http_verb='GET')
 
     except requests.RequestException as ex:
@@ -261,51 +500,86 @@ def _get_tenant_from_coordinator(tenant_id, message_token, message):
         #load new tenant data from response body
         tenant = tenant_util.load_tenant_from_dict(response_body['tenant'])
 
-        # update the cache with new tenant info
-        _save_tenant_to_cache(tenant_id, tenant)
-
-        # add correlation to message
-        _add_correlation_info_to_message(tenant, message)
+    elif resp.status_code == httplib.NOT_MODIFIED and stale_tenant:
+        #the expired copy of the tenant is still current
+        tenant = stale_tenant
 
     elif resp.status_code == httplib.NOT_FOUND:
-        error_message = 'unable to locate tenant.'
-        _LOG.debug(error_message)
-        raise errors.ResourceNotFoundError(error_message)
+        _negative_cache.set(negative_key, True)
+        _LOG.debug('unable to validate message token for tenant.')
+        raise errors.MessageAuthenticationError(
+            'Message not authenticated, check your tenant id '
+            'and or message token for validity')
     else:
         #coordinator responds, but coordinator datasink could be unreachable
         raise errors.CoordinatorCommunicationError
 
+    # update the cache with the validated tenant info
+    _save_tenant_to_cache(tenant_id, tenant)
 
-def _add_correlation_info_to_message(tenant, message):
+    return tenant
+
+
+def _get_correlation_template(tenant, producer_name):
     """
-    Pack the message with correlation data. The message will be update by
-    adding a dictionary named "meniscus" that contains tenant specific
-    information used in processing the message.
+    Returns the correlation data for messages from the named producer. The
+    template is compiled the first time it is needed for a version of the
+    tenant and kept by the process, so a cached tenant does not rebuild it
+    for each message. The version of a tenant is its change sequence, or its
+    entity tag when the tenant was received without one. Producer names that
+    do not match a producer share the template of the default producer.
+
+    The values in a template are shared by every message it is applied to
+    and must be treated as read only.
     """
     #match the producer by the message pname
     producer = tenant_util.find_event_producer(tenant,
-                                               producer_name=message['pname'])
+                                               producer_name=producer_name)
+    version = tenant.change_seq
+    if version is None:
+        version = tenant_util.generate_etag(tenant)
+    template_key = (tenant.tenant_id, version,
+                    producer.name if producer else None)
+
+    template = _correlation_templates.get(template_key)
+    if template is not None:
+        return template
 
     #if the producer is not found, create a default producer
     if not producer:
         producer = EventProducer(_id=None, name="default", pattern="default")
 
-    #create correlation dictionary
-    correlation_dict = {
+    template = {
         'tenant_name': tenant.tenant_name,
         'ep_id': producer.get_id(),
         'pattern': producer.pattern,
         'durable': producer.durable,
         'encrypted': producer.encrypted,
-        '@timestamp': timeutils.utcnow(),
         'sinks': producer.sinks,
+        'dedicated_index': tenant.dedicated_index,
         "destinations": dict()
     }
 
     #configure sink dispatch
     for sink in producer.sinks:
-        correlation_dict["destinations"][sink] = {'transaction_id': None,
-                                                  'transaction_time': None}
+        template["destinations"][sink] = {'transaction_id': None,
+                                          'transaction_time': None}
+
+    _correlation_templates.set(template_key, template)
+    return template
+
+
+def _add_correlation_info_to_message(tenant, message):
+    """
+    Pack the message with correlation data. The message will be update by
+    adding a dictionary named "meniscus" that contains tenant specific
+    information used in processing the message.
+    """
+    #create correlation dictionary from the producer's compiled template
+    correlation_dict = dict(
+        _get_correlation_template(tenant, message['pname']))
+    #an ISO 8601 string rather than a datetime, which msgpack can not encode
+    correlation_dict['@timestamp'] = timeutils.utcnow().isoformat()
 
     # After successful correlation remove meniscus information from structured
     # data so that the client's token is scrubbed form the message.
@@ -313,14 +587,23 @@ def _add_correlation_info_to_message(tenant, message):
     message.update({'meniscus': {'tenant': tenant.tenant_id,
                                  'correlation': correlation_dict}})
 
+    # Messages that may be lost are not queued between pipeline steps
+    in_process = FUSED_EXECUTION or (
+        TRANSIENT_NON_DURABLE and not correlation_dict['durable'])
+
     # If the message data indicates that the message has normalization rules
     # that apply, Queue the message for normalization processing
     if normalizer.should_normalize(message):
-        # send the message to normalization then route to sink
-        normalizer.normalize_message.delay(message)
-    else:
-        # Queue the message for indexing/storage
-        sinks.route_message(message)
+        if in_process:
+            # normalize the message in this process, then route to sink
+            normalizer.normalize(message)
+        else:
+            # send the message to normalization then route to sink
+            normalizer.normalize_message.delay(message)
+            return
+
+    # Queue the message for indexing/storage
+    sinks.route_message(message)
 
 
 def _save_tenant_to_cache(tenant_id, tenant):
@@ -337,5 +620,4 @@ def _save_tenant_to_cache(tenant_id, tenant):
 
 
 def _get_config_from_cache():
-    config_cache = cache_handler.ConfigCache()
-    return config_cache.get_config()
+    return cache_handler.get_worker_config()
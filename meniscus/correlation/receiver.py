@@ -18,11 +18,38 @@ class CorrelationInputServer(transport.ZeroMQInputServer):
         except Exception:
             _LOG.exception('unable to place persist_message task on queue')
 
+    def process_batch(self):
+        msgs = self._get_batch()
 
-def new_correlation_input_server():
+        if not msgs:
+            return
+
+        try:
+            #Queue the batch for correlation as a single task
+            correlator.correlate_syslog_messages.delay(msgs)
+        except Exception:
+            _LOG.exception('unable to place correlation task on queue')
+
+
+def new_correlation_input_server(stop_event=None, message_counter=None):
     """
     Create a correlation input server for receiving json messages form the
     syslog parser of ZeroMQ
     """
     zmq_receiver = transport.new_zmq_receiver()
-    return CorrelationInputServer(zmq_receiver)
+    return CorrelationInputServer(
+        zmq_receiver,
+        batch_size=transport.BATCH_SIZE,
+        batch_linger_ms=transport.BATCH_LINGER_MS,
+        stop_event=stop_event,
+        message_counter=message_counter)
+
+
+def run_correlation_input_server(stop_event, message_counter):
+    """
+    Runs a correlation input server until the stop event is set. This is the
+    target of each process in the worker's receiver pool, so that every
+    process creates its own zmq context and socket.
+    """
+    server = new_correlation_input_server(stop_event, message_counter)
+    server.start()
@@ -1,3 +1,9 @@
+from collections import OrderedDict
+import os
+import threading
+import time
+from uuid import uuid4
+
 from oslo.config import cfg
 
 from meniscus.config import get_config
@@ -6,6 +12,7 @@ from meniscus.data.model.tenant import (
     load_tenant_from_dict, load_token_from_dict)
 from meniscus.data.model.worker import WorkerConfiguration
 from meniscus.openstack.common import jsonutils
+from meniscus.proxy import enable_shared_memory_cache
 from meniscus.proxy import NativeProxy
 
 
@@ -33,7 +40,37 @@ _CACHE_OPTIONS = [
     cfg.StrOpt('cache_token',
                default='cache-token',
                help="""The name of the cache to store worker config values"""
-               )
+               ),
+    cfg.StrOpt('cache_inflight',
+               default='cache-inflight',
+               help="""The name of the cache that marks the lookups a
+                    process has in flight"""
+               ),
+    cfg.IntOpt('inflight_expires',
+               default=10,
+               help="""Longest time other processes wait for a lookup in
+                    flight before making the lookup themselves"""
+               ),
+    cfg.IntOpt('local_cache_size',
+               default=1000,
+               help="""Maximum number of tenants and tokens each process
+                    keeps in its local cache"""
+               ),
+    cfg.IntOpt('local_cache_expires',
+               default=300,
+               help="""Time to keep tenants and tokens in the local
+                    process cache"""
+               ),
+    cfg.IntOpt('negative_cache_expires',
+               default=30,
+               help="""Time to remember unknown tenants and rejected
+                    message tokens"""
+               ),
+    cfg.BoolOpt('shared_memory_cache',
+                default=False,
+                help="""Share cached values between processes with a pure
+                    python cache when not running under uWSGI"""
+                )
 ]
 
 get_config().register_opts(_CACHE_OPTIONS, group=_cache_group)
@@ -48,6 +85,126 @@ CONFIG_EXPIRES = conf.cache.config_expires
 CACHE_CONFIG = conf.cache.cache_config
 CACHE_TENANT = conf.cache.cache_tenant
 CACHE_TOKEN = conf.cache.cache_token
+CACHE_INFLIGHT = conf.cache.cache_inflight
+INFLIGHT_EXPIRES = conf.cache.inflight_expires
+CONFIG_KEY = 'worker_configuration'
+CONFIG_GENERATION_KEY = 'worker_configuration_generation'
+TENANT_CHANGES_CURSOR_KEY = 'tenant_changes_cursor'
+LOCAL_CACHE_SIZE = conf.cache.local_cache_size
+LOCAL_CACHE_EXPIRES = conf.cache.local_cache_expires
+NEGATIVE_CACHE_EXPIRES = conf.cache.negative_cache_expires
+#longest time in seconds a process uses its local tenants and tokens before
+#checking whether the tenant change feed has moved
+LOCAL_GENERATION_CHECK_SECONDS = 1
+
+if conf.cache.shared_memory_cache:
+    enable_shared_memory_cache()
+
+
+class LocalCache(object):
+    """
+    A size bounded, least recently used cache that lives in the memory of a
+    single process. Values are stored as python objects so that reads do not
+    pay any decoding cost. Entries expire after a time to live, and the least
+    recently used entry is evicted when the cache is full.
+    """
+
+    def __init__(self, max_size=LOCAL_CACHE_SIZE,
+                 expires=LOCAL_CACHE_EXPIRES):
+        self.max_size = max_size
+        self.expires = expires
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the value stored for a key, or None if the key is not cached
+        or has expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry[0] < time.time():
+                self.misses += 1
+                return None
+
+            #re-insert the entry to mark it as the most recently used
+            del self._entries[key]
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def get_stale(self, key):
+        """
+        Returns the value stored for a key even if it has expired, or None if
+        the key is not cached. Expired entries are kept until they are
+        evicted, so that they can be revalidated instead of fetched again.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return None
+
+            return entry[1]
+
+    def set(self, key, value, expires=None):
+        """
+        Stores a value for a key, evicting the least recently used entry if
+        the cache is full
+        """
+        if self.max_size < 1:
+            return
+
+        if expires is None:
+            expires = self.expires
+
+        with self._lock:
+            self._entries.pop(key, None)
+
+            while len(self._entries) >= self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+            self._entries[key] = (time.time() + expires, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns the hit, miss and eviction counters for the cache
+        """
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+#per process caches of decoded Tenant and Token objects
+_local_tenants = LocalCache()
+_local_tokens = LocalCache()
+
+
+def local_cache_stats():
+    """
+    Returns the counters for the local tenant and token caches of the
+    current process
+    """
+    return {
+        'tenant': _local_tenants.stats(),
+        'token': _local_tokens.stats()
+    }
 
 
 class Cache(object):
@@ -59,85 +216,249 @@ class Cache(object):
 
 
 class ConfigCache(Cache):
+    """
+    Caches the worker configuration. Each time the configuration is set a new
+    generation stamp is stored with it, so that processes holding a decoded
+    copy of the configuration can tell when it has changed.
+    """
     def clear(self):
         self.cache.cache_clear(CACHE_CONFIG)
 
     def set_config(self, worker_config):
-        if self.cache.cache_exists('worker_configuration', CACHE_CONFIG):
-            self.cache.cache_update(
-                'worker_configuration',
-                jsonutils.dumps(worker_config.format()),
-                CONFIG_EXPIRES, CACHE_CONFIG)
-        else:
-            self.cache.cache_set(
-                'worker_configuration',
-                jsonutils.dumps(worker_config.format()),
-                CONFIG_EXPIRES, CACHE_CONFIG)
+        self.cache.cache_upsert(
+            CONFIG_KEY,
+            jsonutils.dumps(worker_config.format()),
+            CONFIG_EXPIRES, CACHE_CONFIG)
+        #the generation is written after the config so that a reader never
+        #pairs a new generation with the previous config
+        self.cache.cache_upsert(
+            CONFIG_GENERATION_KEY, str(uuid4()),
+            CONFIG_EXPIRES, CACHE_CONFIG)
 
     def get_config(self):
-        if self.cache.cache_exists('worker_configuration', CACHE_CONFIG):
-            config = jsonutils.loads(
-                self.cache.cache_get('worker_configuration', CACHE_CONFIG))
-            worker_config = WorkerConfiguration(**config)
+        config = self.cache.cache_get(CONFIG_KEY, CACHE_CONFIG)
+        if config:
+            worker_config = WorkerConfiguration(**jsonutils.loads(config))
             return worker_config
         return None
 
+    def get_generation(self):
+        return self.cache.cache_get(CONFIG_GENERATION_KEY, CACHE_CONFIG)
+
     def delete_config(self):
-        if self.cache.cache_exists('worker_configuration', CACHE_CONFIG):
-            self.cache.cache_del('worker_configuration', CACHE_CONFIG)
+        self.cache.cache_del(CONFIG_KEY, CACHE_CONFIG)
+        self.cache.cache_del(CONFIG_GENERATION_KEY, CACHE_CONFIG)
+
+    def set_tenant_changes_cursor(self, cursor):
+        self.cache.cache_upsert(
+            TENANT_CHANGES_CURSOR_KEY, str(cursor),
+            CONFIG_EXPIRES, CACHE_CONFIG)
+
+    def get_tenant_changes_cursor(self):
+        cursor = self.cache.cache_get(TENANT_CHANGES_CURSOR_KEY, CACHE_CONFIG)
+        if cursor is not None:
+            return int(cursor)
+        return None
+
+
+class ConfigSnapshot(object):
+    """
+    Holds a decoded copy of the worker configuration for the life of a
+    process. The configuration is only read and decoded from the cache again
+    when its generation stamp changes.
+    """
+    def __init__(self):
+        self.generation = None
+        self.config = None
+        self._lock = threading.Lock()
+
+    def get_config(self):
+        config_cache = ConfigCache()
+        generation = config_cache.get_generation()
+
+        with self._lock:
+            #without a generation stamp there is nothing to compare against,
+            #so the configuration is not memoized
+            if (generation is None or self.config is None
+                    or generation != self.generation):
+                self.config = config_cache.get_config()
+                self.generation = generation
+            return self.config
+
+
+_config_snapshot = ConfigSnapshot()
+
+
+class LocalCacheGeneration(object):
+    """
+    Drops the local tenants and tokens of a process when the cursor of the
+    tenant change feed moves. The feed is applied to the shared cache by a
+    single process, which stores the cursor after the changed tenants, so a
+    process that finds a new cursor reads the changed tenants from the shared
+    cache again instead of using its own stale copies. The cursor is read at
+    most once every LOCAL_GENERATION_CHECK_SECONDS.
+    """
+    def __init__(self):
+        self.cursor = None
+        self.checked_at = 0
+        self._lock = threading.Lock()
+
+    def check(self):
+        now = time.time()
+        if now - self.checked_at < LOCAL_GENERATION_CHECK_SECONDS:
+            return
+        self.checked_at = now
+
+        cursor = ConfigCache().get_tenant_changes_cursor()
+        with self._lock:
+            if cursor != self.cursor:
+                _local_tenants.clear()
+                _local_tokens.clear()
+                self.cursor = cursor
+
+
+_local_generation = LocalCacheGeneration()
+
+
+def get_worker_config():
+    """
+    Returns the worker configuration for the current process, only decoding
+    it from the cache when it has changed
+    """
+    return _config_snapshot.get_config()
+
+
+class InFlightCache(Cache):
+    """
+    Marks the lookups that processes have in flight in the shared cache, so
+    that the other processes sharing the cache can wait for the result of a
+    lookup instead of making it again. A marker expires after expires
+    seconds, so that a process that dies while holding one does not hold up
+    the lookup for longer than that.
+    """
+    def __init__(self):
+        super(InFlightCache, self).__init__()
+        self.expires = INFLIGHT_EXPIRES
+
+    def clear(self):
+        self.cache.cache_clear(CACHE_INFLIGHT)
+
+    def _marker_key(self, key):
+        return jsonutils.dumps(key)
+
+    def acquire(self, key):
+        """
+        Marks a lookup as in flight, and returns False if another process
+        already holds the marker
+        """
+        return self.cache.cache_add(
+            self._marker_key(key), str(os.getpid()),
+            self.expires, CACHE_INFLIGHT)
+
+    def release(self, key):
+        self.cache.cache_del(self._marker_key(key), CACHE_INFLIGHT)
 
 
 class TenantCache(Cache):
+    """
+    Caches tenants in a local process cache in front of the shared cache.
+    """
     def clear(self):
+        _local_tenants.clear()
         self.cache.cache_clear(CACHE_TENANT)
 
     def set_tenant(self, tenant):
-        if self.cache.cache_exists(tenant.tenant_id, CACHE_TENANT):
-            self.cache.cache_update(
-                tenant.tenant_id, jsonutils.dumps(tenant.format()),
-                DEFAULT_EXPIRES, CACHE_TENANT)
-        else:
-            self.cache.cache_set(
-                tenant.tenant_id, jsonutils.dumps(tenant.format()),
-                DEFAULT_EXPIRES, CACHE_TENANT)
+        _local_tenants.set(tenant.tenant_id, tenant)
+        self.cache.cache_upsert(
+            tenant.tenant_id, jsonutils.dumps(tenant.format()),
+            DEFAULT_EXPIRES, CACHE_TENANT)
+
+    def set_tenants(self, tenants):
+        """
+        Stores a list of tenants in the shared cache in one call, and drops
+        any copies of them held in the local process cache
+        """
+        for tenant in tenants:
+            _local_tenants.delete(tenant.tenant_id)
+
+        self.cache.cache_set_many(
+            dict((tenant.tenant_id, jsonutils.dumps(tenant.format()))
+                 for tenant in tenants),
+            DEFAULT_EXPIRES, CACHE_TENANT)
 
     def get_tenant(self, tenant_id):
-        if self.cache.cache_exists(tenant_id, CACHE_TENANT):
-            tenant_dict = jsonutils.loads(
-                self.cache.cache_get(tenant_id, CACHE_TENANT))
-            tenant = load_tenant_from_dict(tenant_dict)
+        _local_generation.check()
+        tenant = _local_tenants.get(tenant_id)
+        if tenant:
+            return tenant
+
+        tenant_json = self.cache.cache_get(tenant_id, CACHE_TENANT)
+        if tenant_json:
+            tenant = load_tenant_from_dict(jsonutils.loads(tenant_json))
+            _local_tenants.set(tenant_id, tenant)
             return tenant
 
         return None
 
+    def get_stale_tenant(self, tenant_id):
+        """
+        Returns the locally cached tenant even if it has expired, so that it
+        can be revalidated with the coordinator
+        """
+        return _local_tenants.get_stale(tenant_id)
+
     def delete_tenant(self, tenant_id):
-        if self.cache.cache_exists(tenant_id, CACHE_TENANT):
-            self.cache.cache_del(tenant_id, CACHE_TENANT)
+        _local_tenants.delete(tenant_id)
+        self.cache.cache_del(tenant_id, CACHE_TENANT)
 
 
 class TokenCache(Cache):
+    """
+    Caches tokens in a local process cache in front of the shared cache.
+    """
     def clear(self):
+        _local_tokens.clear()
         self.cache.cache_clear(CACHE_TOKEN)
 
     def set_token(self, tenant_id, token):
+        #a changed token means the token was reset, so the locally cached
+        #tenant holds a stale token and is dropped
+        cached_token = _local_tokens.get(tenant_id)
+        if cached_token and cached_token.valid != token.valid:
+            _local_tenants.delete(tenant_id)
+        _local_tokens.set(tenant_id, token)
 
-        if self.cache.cache_exists(tenant_id, CACHE_TOKEN):
-            self.cache.cache_update(
-                tenant_id, jsonutils.dumps(token.format()),
-                DEFAULT_EXPIRES, CACHE_TOKEN)
-        else:
-            self.cache.cache_set(
-                tenant_id, jsonutils.dumps(token.format()),
-                DEFAULT_EXPIRES, CACHE_TOKEN)
+        self.cache.cache_upsert(
+            tenant_id, jsonutils.dumps(token.format()),
+            DEFAULT_EXPIRES, CACHE_TOKEN)
+
+    def set_tokens(self, tokens):
+        """
+        Stores a dictionary of tokens keyed by tenant id in the shared cache
+        in one call, and drops any copies of them held in the local process
+        cache
+        """
+        for tenant_id in tokens:
+            _local_tokens.delete(tenant_id)
+
+        self.cache.cache_set_many(
+            dict((tenant_id, jsonutils.dumps(token.format()))
+                 for tenant_id, token in tokens.iteritems()),
+            DEFAULT_EXPIRES, CACHE_TOKEN)
 
     def get_token(self, tenant_id):
-        if self.cache.cache_exists(tenant_id, CACHE_TOKEN):
-            token_dict = jsonutils.loads(
-                self.cache.cache_get(tenant_id, CACHE_TOKEN))
-            token = load_token_from_dict(token_dict)
+        _local_generation.check()
+        token = _local_tokens.get(tenant_id)
+        if token:
+            return token
+
+        token_json = self.cache.cache_get(tenant_id, CACHE_TOKEN)
+        if token_json:
+            token = load_token_from_dict(jsonutils.loads(token_json))
+            _local_tokens.set(tenant_id, token)
             return token
         return None
 
     def delete_token(self, tenant_id):
-        if self.cache.cache_exists(tenant_id, CACHE_TOKEN):
-            self.cache.cache_del(tenant_id, CACHE_TOKEN)
+        _local_tokens.delete(tenant_id)
+        self.cache.cache_del(tenant_id, CACHE_TOKEN)
@@ -1,4 +1,5 @@
 from elasticsearch import Elasticsearch, ElasticsearchException
+from elasticsearch import NotFoundError
 from oslo.config import cfg
 from meniscus.data.handlers import base
 from meniscus import config
@@ -26,10 +27,60 @@ elasticsearch_options = [
                help="""Amount of records to transmit in bulk
                     """
                ),
-    cfg.StrOpt('ttl',
-               default="30d",
-               help="""default time to live for documents
-                    inserted into the default store
+    cfg.IntOpt('bulk_max_bytes',
+               default=5242880,
+               help="""size in bytes of the encoded records that triggers
+                    a bulk transmission before bulk_size is reached
+                    """
+               ),
+    cfg.IntOpt('bulk_linger_ms',
+               default=1000,
+               help="""longest time in milliseconds a record waits for a
+                    bulk transmission
+                    """
+               ),
+    cfg.IntOpt('bulk_max_retries',
+               default=5,
+               help="""times a record that failed to index is retried
+                    before it is moved to the dead letter queue
+                    """
+               ),
+    cfg.IntOpt('bulk_retry_backoff_ms',
+               default=1000,
+               help="""time in milliseconds before the first retry of a
+                    record that failed to index, doubled for each retry
+                    """
+               ),
+    cfg.IntOpt('flusher_processes',
+               default=0,
+               help="""number of processes bulk flushing each queue to
+                    elasticsearch, 0 runs one process per core
+                    """
+               ),
+    cfg.IntOpt('shared_indices',
+               default=8,
+               help="""number of daily indices shared by the tenants that
+                    do not have dedicated indices, 0 gives every tenant
+                    dedicated indices
+                    """
+               ),
+    cfg.IntOpt('dedicated_index_min_docs',
+               default=1000000,
+               help="""number of messages a tenant sends in a day that
+                    promotes the tenant from the shared indices to
+                    dedicated indices
+                    """
+               ),
+    cfg.IntOpt('retention_days',
+               default=30,
+               help="""number of daily indices kept for each tenant, older
+                    indices are deleted by the retention task
+                    """
+               ),
+    cfg.StrOpt('alias_cache',
+               default='cache-alias',
+               help="""name of the cache that records the tenant aliases
+                    the flushers have added to daily indices
                     """
                )
 ]
@@ -56,7 +107,16 @@ class ElasticsearchHandler(base.DataHandlerBase):
         es_servers: a list[] of {"host": "hostname", "port": "port"} for
         elasticsearch servers
         bulk_size: hom may records are held before performing a bulk flush
-        ttl: the default length of time a document should live when indexed
+        bulk_max_bytes: size of the held records that triggers a bulk flush
+        bulk_linger_ms: longest time a record is held before a bulk flush
+        bulk_max_retries: times a record that failed to index is retried
+        bulk_retry_backoff_ms: delay before the first retry of a record
+        flusher_processes: processes bulk flushing each queue
+        shared_indices: number of daily indices shared by small tenants
+        dedicated_index_min_docs: daily messages that promote a tenant to
+        dedicated indices
+        retention_days: number of daily indices kept for each tenant
+        alias_cache: name of the cache of added tenant aliases
         status: the status of the current es connection
         """
         self.es_servers = [{
@@ -71,8 +131,16 @@ class ElasticsearchHandler(base.DataHandlerBase):
                     conf.bulk_size)
             )
         self.bulk_size = conf.bulk_size
+        self.bulk_max_bytes = conf.bulk_max_bytes
+        self.bulk_linger_ms = conf.bulk_linger_ms
+        self.bulk_max_retries = conf.bulk_max_retries
+        self.bulk_retry_backoff_ms = conf.bulk_retry_backoff_ms
+        self.flusher_processes = conf.flusher_processes
 
-        self.ttl = conf.ttl
+        self.shared_indices = conf.shared_indices
+        self.dedicated_index_min_docs = conf.dedicated_index_min_docs
+        self.retention_days = conf.retention_days
+        self.alias_cache = conf.alias_cache
         self.status = ElasticsearchHandler.STATUS_NEW
 
     def _check_connection(self):
@@ -114,6 +182,69 @@ class ElasticsearchHandler(base.DataHandlerBase):
         self.connection.indices.put_mapping(
             index=index, doc_type=doc_type, body=mapping)
 
+    def put_template(self, name, template):
+        """
+        Creates or replaces an index template, which is applied to indices
+        created with a name that matches the template's pattern
+        """
+        self._check_connection()
+        self.connection.indices.put_template(name=name, body=template)
+
+    def get_template(self, name):
+        """
+        Returns an index template, or None if there is no template by that
+        name
+        """
+        self._check_connection()
+        try:
+            return self.connection.indices.get_template(name=name).get(name)
+        except NotFoundError:
+            return None
+
+    def put_alias(self, index, alias, body=None):
+        """
+        Adds an alias to an index. The body may hold the filter and routing
+        of the alias.
+        """
+        self._check_connection()
+        self.connection.indices.put_alias(index=index, name=alias, body=body)
+
+    def count_terms(self, index, field, size):
+        """
+        Returns a dictionary of the size most frequent values of a field in
+        an index, or in the indices matching an index pattern, and the number
+        of documents holding each value
+        """
+        self._check_connection()
+        body = {
+            'query': {'match_all': {}},
+            'facets': {
+                'terms': {'terms': {'field': field, 'size': size}}
+            }
+        }
+        try:
+            resp = self.connection.search(
+                index=index, body=body, search_type='count')
+        except NotFoundError:
+            return dict()
+
+        return dict((term['term'], term['count'])
+                    for term in resp['facets']['terms']['terms'])
+
+    def get_indices(self):
+        """
+        Returns the names of every index on the elasticsearch cluster
+        """
+        self._check_connection()
+        return self.connection.indices.get_aliases().keys()
+
+    def delete_indices(self, indices):
+        """
+        Deletes a list of indices
+        """
+        self._check_connection()
+        self.connection.indices.delete(index=','.join(indices))
+
 
 def get_handler():
     """
@@ -1,10 +1,36 @@
 """
 The mapping_tasks module is used for configuring elasticsearch indexes and
-doc_types with field mappings using async tasks that retry on failure
+doc_types with field mappings using async tasks that retry on failure.
+
+Field mappings are installed once for every tenant as a versioned index
+template. A node only replaces the installed template with a newer version,
+so that nodes still running an older release do not undo a migration.
+
+Messages of a tenant are indexed into daily indices named
+meniscus-{tenant_id}-{YYYY.MM.DD}, which are created from an index template
+as messages arrive and which carry an alias named meniscus-{tenant_id} so
+that the tenant's messages can be searched as one index. The meniscus- prefix
+keeps the template and the retention task away from the indices of other
+applications that share the cluster, and keeps the alias from colliding with
+the index named after the tenant by earlier versions, which
+tools/migrate_legacy_indices.py adds to the alias.
+
+Most tenants send too few messages to be worth the shards of their own
+indices, so tenants share a fixed number of daily indices instead, named
+meniscus-shared_{n}-{YYYY.MM.DD}. Their messages are routed to one shard by
+tenant id, and the tenant's alias filters the shared index down to the
+tenant's messages. The placement_tasks module promotes heavy tenants to
+dedicated daily indices. Expired messages are removed by a scheduled task
+that deletes whole daily indices once they are older than the retention
+period.
 """
+import datetime
+import re
+import zlib
 
 from meniscus.data.handlers import elasticsearch
 from meniscus import env
+from meniscus.openstack.common import timeutils
 from meniscus.queue import celery
 
 
@@ -12,118 +38,260 @@ _LOG = env.get_logger(__name__)
 
 _es_handler = elasticsearch.get_handler()
 
+RETENTION_DAYS = _es_handler.retention_days
+#time in seconds between runs of the retention task
+RETENTION_INTERVAL = 3600
+#most indices deleted by one request, so that the request line stays well
+#below the 4KB elasticsearch allows by default
+RETENTION_DELETE_CHUNK = 20
+SHARED_INDICES = _es_handler.shared_indices
+
+INDEX_DATE_FORMAT = '%Y.%m.%d'
+#prefix of the name of every index meniscus creates
+INDEX_PREFIX = 'meniscus-'
+#pattern that matches the names of daily indices in an index template
+TIME_INDEX_PATTERN = INDEX_PREFIX + '*'
+TIME_INDEX_RE = re.compile(
+    r'^{0}(?P<tenant_id>.+)-(?P<date>\d{{4}}\.\d{{2}}\.\d{{2}})$'.format(
+        re.escape(INDEX_PREFIX)))
+SHARED_INDEX_PREFIX = 'shared_'
+TENANT_FIELD = 'meniscus.tenant'
+LOG_TEMPLATE_NAME = 'meniscus_logs'
+#version of LOG_TEMPLATE, increment it whenever the template is changed
+LOG_TEMPLATE_VERSION = 3
+
+
+def time_index(tenant_id, when=None):
+    """
+    Returns the name of the daily index that holds the messages a tenant
+    sends at a given time, which defaults to now
+    """
+    when = when or timeutils.utcnow()
+    return '{0}{1}-{2}'.format(
+        INDEX_PREFIX, tenant_id, when.strftime(INDEX_DATE_FORMAT))
+
+
+def shared_index(tenant_id, when=None):
+    """
+    Returns the name of the shared daily index that holds the messages a
+    tenant without dedicated indices sends at a given time
+    """
+    shard = (zlib.crc32(tenant_id) & 0xffffffff) % SHARED_INDICES
+    return time_index('{0}{1}'.format(SHARED_INDEX_PREFIX, shard), when)
+
+
+def tenant_index(tenant_id, dedicated=False, when=None):
+    """
+    Places the messages a tenant sends at a given time. Returns the name of
+    the daily index that holds them, and the routing value used to index
+    them, which is None for dedicated indices.
+    """
+    if dedicated or SHARED_INDICES < 1:
+        return time_index(tenant_id, when), None
+    return shared_index(tenant_id, when), tenant_id
+
+
+def tenant_alias_name(tenant_id):
+    """
+    Returns the name of the alias that finds the messages of a tenant
+    """
+    return INDEX_PREFIX + tenant_id
+
+
+def tenant_alias(tenant_id, routing=None):
+    """
+    Returns the body of the alias a tenant is given on a daily index. On a
+    shared index the alias filters and routes to the tenant's messages.
+    """
+    if routing is None:
+        return None
+    return {
+        'filter': {'term': {TENANT_FIELD: tenant_id}},
+        'routing': routing
+    }
+
+
+def parse_time_index(index):
+    """
+    Returns the tenant id and date of a daily index, or None if the index is
+    not a daily index created by meniscus
+    """
+    match = TIME_INDEX_RE.match(index)
+    if not match:
+        return None
+
+    try:
+        date = datetime.datetime.strptime(
+            match.group('date'), INDEX_DATE_FORMAT).date()
+    except ValueError:
+        return None
+
+    return match.group('tenant_id'), date
+
+
+def expired_indices(indices, retention_days=RETENTION_DAYS, today=None):
+    """
+    Returns the daily indices of a list of indices that are older than
+    retention_days. Indices that are not daily indices created by meniscus
+    are never expired.
+    """
+    today = today or timeutils.utcnow().date()
+    oldest_kept = today - datetime.timedelta(days=retention_days - 1)
+    expired = list()
+
+    for index in indices:
+        parsed = parse_time_index(index)
+        if parsed and parsed[1] < oldest_kept:
+            expired.append(index)
+
+    return expired
+
+
+def template_version(template):
+    """
+    Returns the version of an installed template, or 0 for a template that
+    is missing or has no version
+    """
+    if not template:
+        return 0
+    meta = template.get('mappings', {}).get('_default_', {}).get('_meta', {})
+    return meta.get('template_version', 0)
+
+
+def install_log_template(force=False):
+    """
+    Installs LOG_TEMPLATE with a single template update, unless the cluster
+    already has the same or a newer version of it. Returns True if the
+    template was installed.
+    :param force: install the template whatever version is installed
+    """
+    installed_version = template_version(
+        _es_handler.get_template(LOG_TEMPLATE_NAME))
+
+    if installed_version >= LOG_TEMPLATE_VERSION and not force:
+        return False
+
+    _es_handler.put_template(LOG_TEMPLATE_NAME, LOG_TEMPLATE)
+    _LOG.info('installed {0} template version {1}, replacing version {2}'
+              .format(LOG_TEMPLATE_NAME, LOG_TEMPLATE_VERSION,
+                      installed_version))
+    return True
+
 
 @celery.task(acks_late=True, max_retries=None, ignore_result=True)
-def create_index(tenant_id):
+def put_log_template():
     """
-    A celery task to create a new index in elasticsearch, and then create
-    a default field mapping.  The task will retry any failed attempts to
-    create the index
+    A celery task to install the index template that maps the fields of
+    log messages in every daily index, if the cluster does not have this
+    version of it. The task will retry until successful.
     """
     try:
-        _es_handler.create_index(index=tenant_id, mapping=DEFAULT_MAPPING)
+        install_log_template()
     except Exception as ex:
         _LOG.exception(ex.message)
-        create_index.retry()
+        put_log_template.retry()
 
 
-@celery.task(acks_late=True, max_retries=None, ignore_result=True)
-def create_ttl_mapping(tenant_id, producer_pattern):
+@celery.task(name='es.retention', ignore_result=True)
+def delete_expired_indices():
     """
-    A celery task to create a new mapping on a specified index/doc_type
-    that enables time to live.  The task will retry until successful.
+    A celery task that deletes the daily indices that have passed the
+    retention period. Deleting whole indices replaces per document time to
+    live, which elasticsearch purges one document at a time. Indices are
+    deleted RETENTION_DELETE_CHUNK at a time, and a chunk that fails to be
+    deleted does not stop the others from being deleted.
     """
     try:
-        _es_handler.put_mapping(
-            index=tenant_id, doc_type=producer_pattern, mapping=TTL_MAPPING)
+        expired = expired_indices(_es_handler.get_indices())
     except Exception as ex:
         _LOG.exception(ex.message)
-        create_ttl_mapping.retry()
-
+        return
 
-#the default ttl time for an index if one is not specified in the document
-DEFAULT_TTL = 7776000000
+    for start in range(0, len(expired), RETENTION_DELETE_CHUNK):
+        chunk = expired[start:start + RETENTION_DELETE_CHUNK]
+        try:
+            _es_handler.delete_indices(chunk)
+            _LOG.info('deleted expired indices: {0}'.format(chunk))
+        except Exception as ex:
+            _LOG.exception(ex.message)
 
-#es mapping for enabling TTL
-TTL_MAPPING = {
-    "_ttl": {
-        "enabled": True,
-        "default": DEFAULT_TTL
-    }
-}
 
-#default es mapping for log messages
-DEFAULT_MAPPING = {
-    "mappings": {
-        "default": {
-            "_ttl": {
-                "enabled": True,
-                "default": DEFAULT_TTL
-            },
-            "properties": {
-                "host": {
-                    "type": "string"
-                },
-                "meniscus": {
-                    "properties": {
-                        "correlation": {
-                            "properties": {
-                                "@timestamp": {
-                                    "type": "date",
-                                    "format": "dateOptionalTime"
-                                },
-                                "destinations": {
-                                    "properties": {
-                                        "elasticsearch": {
-                                            "type": "object"
-                                        }
-                                    }
-                                },
-                                "durable": {
-                                    "type": "boolean"
-                                },
-                                "encrypted": {
-                                    "type": "boolean"
-                                },
-                                "pattern": {
-                                    "type": "string"
-                                },
-                                "sinks": {
-                                    "type": "string"
-                                },
-                                "tenant_name": {
-                                    "type": "string"
-                                }
+#es field mappings of log messages
+LOG_PROPERTIES = {
+    "host": {
+        "type": "string"
+    },
+    "meniscus": {
+        "properties": {
+            "correlation": {
+                "properties": {
+                    "@timestamp": {
+                        "type": "date",
+                        "format": "dateOptionalTime"
+                    },
+                    "destinations": {
+                        "properties": {
+                            "elasticsearch": {
+                                "type": "object"
                             }
-                        },
-                        "tenant": {
-                            "type": "string"
                         }
+                    },
+                    "durable": {
+                        "type": "boolean"
+                    },
+                    "encrypted": {
+                        "type": "boolean"
+                    },
+                    "pattern": {
+                        "type": "string"
+                    },
+                    "sinks": {
+                        "type": "string"
+                    },
+                    "tenant_name": {
+                        "type": "string"
                     }
-                },
-                "msg": {
-                    "type": "string"
-                },
-                "msgid": {
-                    "type": "string"
-                },
-                "pid": {
-                    "type": "string"
-                },
-                "pname": {
-                    "type": "string"
-                },
-                "pri": {
-                    "type": "string"
-                },
-                "time": {
-                    "type": "date",
-                    "format": "dateOptionalTime"
-                },
-                "ver": {
-                    "type": "string"
                 }
+            },
+            "tenant": {
+                "type": "string",
+                "index": "not_analyzed"
             }
         }
+    },
+    "msg": {
+        "type": "string"
+    },
+    "msgid": {
+        "type": "string"
+    },
+    "pid": {
+        "type": "string"
+    },
+    "pname": {
+        "type": "string"
+    },
+    "pri": {
+        "type": "string"
+    },
+    "time": {
+        "type": "date",
+        "format": "dateOptionalTime"
+    },
+    "ver": {
+        "type": "string"
+    }
+}
+
+#index template applied to the daily indices of every tenant
+LOG_TEMPLATE = {
+    "template": TIME_INDEX_PATTERN,
+    "mappings": {
+        "_default_": {
+            "_meta": {
+                "template_version": LOG_TEMPLATE_VERSION
+            },
+            "properties": LOG_PROPERTIES
+        }
     }
 }
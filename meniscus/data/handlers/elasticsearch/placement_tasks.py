@@ -0,0 +1,57 @@
+"""
+The placement_tasks module promotes tenants from the shared daily indices to
+dedicated daily indices, based on the number of messages they are observed
+to send. Promotion is recorded on the tenant, and reaches the workers with
+the tenant's other changes.
+"""
+import datetime
+
+from meniscus.data.handlers import elasticsearch
+from meniscus.data.handlers.elasticsearch import mapping_tasks
+from meniscus.data.model import tenant_util
+from meniscus import env
+from meniscus.openstack.common import timeutils
+from meniscus.queue import celery
+
+
+_LOG = env.get_logger(__name__)
+
+_es_handler = elasticsearch.get_handler()
+
+DEDICATED_INDEX_MIN_DOCS = _es_handler.dedicated_index_min_docs
+#most tenants promoted by one run of the placement task
+PLACEMENT_MAX_TENANTS = 100
+
+
+@celery.task(name='es.placement', ignore_result=True)
+def promote_heavy_tenants():
+    """
+    A celery task, routed to the queue of the tenant persona, that promotes
+    the tenants that sent at least DEDICATED_INDEX_MIN_DOCS messages to the
+    shared indices yesterday to dedicated indices. Messages a tenant has
+    already sent stay in the shared indices, where the tenant's alias finds
+    them until they expire.
+    """
+    if mapping_tasks.SHARED_INDICES < 1:
+        return
+
+    yesterday = timeutils.utcnow() - datetime.timedelta(days=1)
+    pattern = mapping_tasks.time_index(
+        mapping_tasks.SHARED_INDEX_PREFIX + '*', yesterday)
+
+    try:
+        counts = _es_handler.count_terms(
+            pattern, mapping_tasks.TENANT_FIELD, PLACEMENT_MAX_TENANTS)
+
+        for tenant_id, count in counts.iteritems():
+            if count < DEDICATED_INDEX_MIN_DOCS:
+                continue
+
+            tenant = tenant_util.find_tenant(tenant_id)
+            if tenant and not tenant.dedicated_index:
+                tenant.dedicated_index = True
+                tenant_util.save_tenant(tenant)
+                _LOG.info('promoted tenant {0} to dedicated indices after '
+                          '{1} messages'.format(tenant_id, count))
+    except Exception as ex:
+        _LOG.exception(ex.message)
@@ -105,12 +105,20 @@ class MongoDBHandler(base.DataHandlerBase):
         return self.database['counters'].find_and_modify(
             {'name': sequence_name}, {'$inc': {'seq': 1}})['seq']
 
-    def find(self, object_name, query_filter=None, projection=None):
+    def find(self, object_name, query_filter=None, projection=None,
+             sort=None, limit=0):
         if query_filter is None:
             query_filter = dict()
 
         self._check_connection()
-        return self.database[object_name].find(query_filter, projection)
+        cursor = self.database[object_name].find(query_filter, projection)
+
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+
+        return cursor
 
     def find_one(self, object_name, query_filter=None):
         if query_filter is None:
@@ -92,7 +92,8 @@ class Tenant(object):
     """
 
     def __init__(self, tenant_id, token, event_producers=None,
-                 _id=None, tenant_name=None):
+                 _id=None, tenant_name=None, change_seq=None,
+                 dedicated_index=False):
 
         if event_producers is None:
             event_producers = list()
@@ -105,16 +106,54 @@ class Tenant(object):
         self.token = token
         self.event_producers = event_producers
         self.tenant_name = tenant_name
+        self.change_seq = change_seq
+        self.dedicated_index = dedicated_index
+        self._index_event_producers()
 
     def get_id(self):
         return self._id
 
+    def _index_event_producers(self):
+        """
+        Builds the indexes of event producers by id and by name. When
+        producers share an id or a name the first one in the list is indexed,
+        matching the order of a search through the list.
+        """
+        self._producers_by_id = dict()
+        self._producers_by_name = dict()
+        for producer in self.event_producers:
+            self._producers_by_id.setdefault(producer.get_id(), producer)
+            self._producers_by_name.setdefault(producer.name, producer)
+
+    def add_event_producer(self, event_producer):
+        self.event_producers.append(event_producer)
+        self._producers_by_id.setdefault(
+            event_producer.get_id(), event_producer)
+        self._producers_by_name.setdefault(
+            event_producer.name, event_producer)
+
+    def remove_event_producer(self, event_producer):
+        self.event_producers.remove(event_producer)
+        self._index_event_producers()
+
+    def rename_event_producer(self, event_producer, name):
+        event_producer.name = name
+        self._index_event_producers()
+
+    def find_event_producer_by_id(self, producer_id):
+        return self._producers_by_id.get(producer_id)
+
+    def find_event_producer_by_name(self, producer_name):
+        return self._producers_by_name.get(producer_name)
+
     def format(self):
         return {'tenant_id': self.tenant_id,
                 'tenant_name': self.tenant_name,
                 'event_producers':
                 [p.format() for p in self.event_producers],
-                'token': self.token.format()}
+                'token': self.token.format(),
+                'dedicated_index': self.dedicated_index,
+                'change_seq': self.change_seq}
 
     def format_for_save(self):
         tenant_dict = self.format()
@@ -145,7 +184,9 @@ def load_tenant_from_dict(tenant_dict):
     return Tenant(
         tenant_dict['tenant_id'], token,
         event_producers=event_producers,
-        _id=_id, tenant_name=tenant_dict['tenant_name'])
+        _id=_id, tenant_name=tenant_dict['tenant_name'],
+        change_seq=tenant_dict.get('change_seq'),
+        dedicated_index=tenant_dict.get('dedicated_index', False))
 
 
 def load_token_from_dict(token_dict):
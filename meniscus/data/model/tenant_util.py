@@ -3,14 +3,20 @@ The tenant_util module provides an abstraction of database operations used
 with instances of the Tenant class and its member objects
 """
 
+import hashlib
+
 from meniscus.data.handlers import mongodb
-from meniscus.data.handlers.elasticsearch import mapping_tasks
 from meniscus.data.model.tenant import EventProducer
 from meniscus.data.model.tenant import (
     load_tenant_from_dict, Tenant, Token)
+from meniscus.openstack.common import jsonutils
 
 _db_handler = mongodb.get_handler()
 
+#sequence used to number tenant changes, so that workers can request the
+#tenants that changed after the last change they applied
+TENANT_CHANGES_SEQUENCE = 'tenant_changes'
+
 
 def find_tenant(tenant_id, create_on_missing=False):
     """
@@ -38,17 +44,16 @@ def create_tenant(tenant_id, tenant_name=None):
     """
     #create new token for the tenant
     new_token = Token()
-    new_tenant = Tenant(tenant_id, new_token, tenant_name=tenant_name)
+    new_tenant = Tenant(tenant_id, new_token, tenant_name=tenant_name,
+                        change_seq=_next_change_seq())
 
     #save the new tenant to the datastore
-    _db_handler.put('tenant', new_tenant.format())
+    tenant_dict = new_tenant.format()
+    tenant_dict['change_seq'] = new_tenant.change_seq
+    _db_handler.put('tenant', tenant_dict)
     #create a new sequence for the tenant for creation of IDs on child objects
     _db_handler.create_sequence(new_tenant.tenant_id)
 
-    #create an index for the tenant in the default sink
-    # and enables time to live for the default doc_type
-    mapping_tasks.create_index.delay(tenant_id)
-
 
 def retrieve_tenant(tenant_id):
     """
@@ -64,11 +69,59 @@ def retrieve_tenant(tenant_id):
 
 def save_tenant(tenant):
     """
-    Update an existing tenant in the datastore
+    Update an existing tenant in the datastore. The change sequence number is
+    taken before the write, so concurrent saves may commit out of order, and
+    readers of the change feed request a window below their cursor again.
     """
+    tenant.change_seq = _next_change_seq()
     _db_handler.update('tenant', tenant.format_for_save())
 
 
+def create_change_sequence():
+    """
+    Creates the sequence used to number tenant changes, if it does not
+    already exist, and numbers the tenants saved before changes were numbered
+    """
+    _db_handler.create_sequence(TENANT_CHANGES_SEQUENCE)
+    backfill_change_seqs()
+
+
+def backfill_change_seqs():
+    """
+    Gives a change sequence number to each tenant that has none, so that the
+    change feed returns tenants saved before changes were numbered. Returns
+    the number of tenants that were numbered.
+    """
+    tenant_ids = [
+        tenant_dict['_id'] for tenant_dict in _db_handler.find(
+            'tenant', {'change_seq': {'$exists': False}}, {'_id': True})]
+
+    for tenant_id in tenant_ids:
+        #a tenant saved meanwhile already has a number and is left as it is
+        _db_handler.set_field(
+            'tenant', {'change_seq': _next_change_seq()},
+            {'_id': tenant_id, 'change_seq': {'$exists': False}})
+
+    return len(tenant_ids)
+
+
+def _next_change_seq():
+    return _db_handler.next_sequence_value(TENANT_CHANGES_SEQUENCE)
+
+
+def retrieve_tenant_changes(since=0, limit=100):
+    """
+    Retrieves the tenants changed after the given change sequence number,
+    ordered by the sequence number of their last change
+    """
+    tenant_dicts = _db_handler.find(
+        'tenant', {'change_seq': {'$gt': since}},
+        sort=[('change_seq', 1)], limit=limit)
+
+    return [load_tenant_from_dict(tenant_dict)
+            for tenant_dict in tenant_dicts]
+
+
 def create_event_producer(tenant, name, pattern, durable, encrypted, sinks):
     """
     Creates an Event Producer object, assigns it to a tenant, and updates the
@@ -82,16 +135,10 @@ def create_event_producer(tenant, name, pattern, durable, encrypted, sinks):
         encrypted,
         sinks)
     #add the event_producer to the tenant
-    tenant.event_producers.append(new_event_producer)
+    tenant.add_event_producer(new_event_producer)
     #save the tenant's data
     save_tenant(tenant)
 
-    #create a new mapping for the producer in the default
-    # sink to enable time_to_live
-    mapping_tasks.create_ttl_mapping.delay(
-        tenant_id=tenant.tenant_id,
-        producer_pattern=new_event_producer.pattern)
-
     #return the id of the newly created producer
     return new_event_producer.get_id()
 
@@ -102,7 +149,7 @@ def delete_event_producer(tenant, event_producer):
     the tenant in the datastore
     """
     #remove any references to the event producer being deleted
-    tenant.event_producers.remove(event_producer)
+    tenant.remove_event_producer(event_producer)
     #save the tenant document
     save_tenant(tenant)
 
@@ -112,14 +159,21 @@ def find_event_producer(tenant, producer_id=None, producer_name=None):
     searches the given tenant for a producer matching either the id or name
     """
     if producer_id:
-        producer_id = int(producer_id)
-        for producer in tenant.event_producers:
-            if producer_id == producer.get_id():
-                return producer
+        producer = tenant.find_event_producer_by_id(int(producer_id))
+        if producer:
+            return producer
 
     if producer_name:
-        for producer in tenant.event_producers:
-            if producer_name == producer.name:
-                return producer
+        return tenant.find_event_producer_by_name(producer_name)
 
     return None
+
+
+def generate_etag(tenant):
+    """
+    Generates an entity tag for a tenant. The tag changes whenever any of the
+    tenant's data changes, so it can be used to check whether a cached copy
+    of a tenant is current.
+    """
+    tenant_json = jsonutils.dumps(tenant.format(), sort_keys=True)
+    return hashlib.md5(tenant_json).hexdigest()
@@ -1,8 +1,10 @@
 from meniscus import env
 from meniscus.queue import celery
+from meniscus.queue import TASK_COMPRESSION
+from meniscus.queue import TASK_SERIALIZER
 from meniscus.normalization.lognorm import get_normalizer
 from meniscus import sinks
-import json
+from meniscus.sinks.document import RawJson
 
 
 _LOG = env.get_logger(__name__)
@@ -19,18 +21,31 @@ def should_normalize(message):
     return should_normalize and can_normalize
 
 
-@celery.task(acks_late=True, max_retries=None, serializer="json")
-def normalize_message(message):
+def normalize(message):
     """
-    This code takes a message and normalizes it into a dictionary. This
-    normalized dictionary is assigned to a field matching the pattern name
+    This code takes a message and normalizes it into a JSON document. This
+    normalized document is assigned to a field matching the pattern name
     of the normalization. This dictionary is then assigned to the message
-    under the normalized field.
+    under the normalized field. The document is kept as the JSON text
+    produced by liblognorm, which the sinks insert into the stored message
+    without decoding it as JSON. liblognorm produces UTF-8 encoded text.
     """
     pattern = message['meniscus']['correlation']['pattern']
-    normalized_doc = json.loads(
-        _normalizer.normalize(message['msg']).as_json())
+    event_json = _normalizer.normalize(message['msg']).as_json()
+    if isinstance(event_json, str):
+        event_json = event_json.decode('utf-8')
+    normalized_doc = RawJson(event_json)
     message['normalized'] = {
         pattern: normalized_doc
     }
+
+
+@celery.task(acks_late=True, max_retries=None,
+             serializer=TASK_SERIALIZER, compression=TASK_COMPRESSION)
+def normalize_message(message):
+    """
+    Normalizes a message queued for normalization, then routes it to its
+    sinks
+    """
+    normalize(message)
     sinks.route_message(message)
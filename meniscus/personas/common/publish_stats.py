@@ -1,9 +1,13 @@
+import os
+
 from oslo.config import cfg
 
+from meniscus.api.utils.request import get_client
 from meniscus.api.utils.request import http_request
 from meniscus.config import get_config
 from meniscus.config import init_config
-from meniscus.data.cache_handler import ConfigCache
+from meniscus.data.cache_handler import get_worker_config
+from meniscus.data.cache_handler import local_cache_stats
 from meniscus.data.model.worker import Worker
 from meniscus.openstack.common import jsonutils
 from meniscus.queue import celery
@@ -34,14 +38,28 @@ except cfg.ConfigFilesNotFoundError:
 WORKER_STATUS_INTERVAL = conf.status_update.worker_status_interval
 
 
+def log_process_stats():
+    """
+    Logs the local cache and coordinator client counters of the current
+    process. The counters are kept by each process, so every run reports
+    the process of the pool that happened to receive the task.
+    """
+    _LOG.info('process {0} stats: {1}'.format(
+        os.getpid(), jsonutils.dumps({
+            'local_cache': local_cache_stats(),
+            'http_client': get_client().stats()})))
+
+
 @celery.task(name="stats.publish")
 def publish_worker_stats():
     """
-    Publishes worker stats to the Coordinator(s) at set times
+    Publishes worker stats to the Coordinator(s) at set times, and logs the
+    counters of the process that runs the task
     """
     try:
-        cache = ConfigCache()
-        config = cache.get_config()
+        log_process_stats()
+
+        config = get_worker_config()
 
         request_uri = "{0}/worker/{1}/status".format(
             config.coordinator_uri, config.hostname)
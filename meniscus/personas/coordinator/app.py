@@ -6,8 +6,10 @@ from meniscus.api.status.resources import (
     WorkerStatusResource, WorkersStatusResource)
 from meniscus.api.tenant.resources import (
     EventProducerResource, EventProducersResource,
-    UserResource, TenantResource, TokenResource)
+    UserResource, TenantChangesResource, TenantResource,
+    TenantValidationResource, TokenResource)
 from meniscus.api.version.resources import VersionResource
+from meniscus.data.model import tenant_util
 from meniscus import env
 from meniscus.queue import celery
 
@@ -16,6 +18,9 @@ _LOG = env.get_logger(__name__)
 
 
 def start_up():
+    #number tenant changes for the workers' change feed
+    tenant_util.create_change_sequence()
+
     #Common Resource(s)
     versions = VersionResource()
 
@@ -29,6 +34,8 @@ def start_up():
     event_producers = EventProducersResource()
     event_producer = EventProducerResource()
     token = TokenResource()
+    tenant_validation = TenantValidationResource()
+    tenant_changes = TenantChangesResource()
 
     # Create API
     application = api = falcon.API()
@@ -47,6 +54,8 @@ def start_up():
                   event_producer)
 
     api.add_route('/v1/tenant/{tenant_id}/token', token)
+    api.add_route('/v1/tenant/{tenant_id}/validation', tenant_validation)
+    api.add_route('/v1/tenants', tenant_changes)
 
     celery_proc = Process(target=celery.worker_main)
     celery_proc.start()
@@ -7,18 +7,30 @@ from meniscus.api.tenant.resources import EventProducerResource
 from meniscus.api.tenant.resources import EventProducersResource
 from meniscus.api.tenant.resources import UserResource
 from meniscus.api.tenant.resources import TenantResource
+from meniscus.api.tenant.resources import TenantValidationResource
 from meniscus.api.tenant.resources import TokenResource
 from meniscus.api.version.resources import VersionResource
 from meniscus.data.datastore import COORDINATOR_DB, get_data_handler
+from meniscus.data.model import tenant_util
 from meniscus import env
 from meniscus.personas.common import publish_stats
 from meniscus.queue import celery
+from meniscus.queue import TENANT_QUEUE
 
 
 _LOG = env.get_logger(__name__)
 
+#time in seconds between runs of the es.placement task
+PLACEMENT_INTERVAL = 3600
+#module of the es.placement task, imported by the celery process alone so
+#that the API processes do not connect to elasticsearch
+PLACEMENT_TASKS = 'meniscus.data.handlers.elasticsearch.placement_tasks'
+
 
 def start_up():
+    #number tenant changes for the workers' change feed
+    tenant_util.create_change_sequence()
+
     #Common Resource(s)
     versions = VersionResource()
 
@@ -28,6 +40,7 @@ def start_up():
     event_producers = EventProducersResource()
     event_producer = EventProducerResource()
     token = TokenResource()
+    tenant_validation = TenantValidationResource()
 
     # Create API
     application = api = falcon.API()
@@ -42,16 +55,25 @@ def start_up():
     api.add_route('/v1/tenant/{tenant_id}/producers/{event_producer_id}',
                   event_producer)
     api.add_route('/v1/tenant/{tenant_id}/token', token)
+    api.add_route('/v1/tenant/{tenant_id}/validation', tenant_validation)
 
     celery.conf.CELERYBEAT_SCHEDULE = {
         'worker_stats': {
             'task': 'stats.publish',
             'schedule': timedelta(seconds=publish_stats.WORKER_STATUS_INTERVAL)
         },
+        #promotion is recorded on tenants, which this persona stores
+        'es_placement': {
+            'task': 'es.placement',
+            'schedule': timedelta(seconds=PLACEMENT_INTERVAL)
+        },
     }
 
-    #include blank argument to celery in order for beat to start correctly
-    celery_proc = Process(target=celery.worker_main, args=[['', '--beat']])
+    #include blank argument to celery in order for beat to start correctly,
+    #the worker also consumes the queue of the tasks only it registers
+    celery_proc = Process(target=celery.worker_main, args=[[
+        '', '--beat', '-Q', 'celery,{0}'.format(TENANT_QUEUE),
+        '--include', PLACEMENT_TASKS]])
     celery_proc.start()
     _LOG.info(
         'Celery started as process: {}'.format(celery_proc.pid)
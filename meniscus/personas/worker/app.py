@@ -3,14 +3,19 @@ from datetime import timedelta
 
 import falcon
 
+from meniscus.api.http_log.resources import PublishBatchResource
 from meniscus.api.http_log.resources import PublishMessageResource
 from meniscus.api.version.resources import VersionResource
 from meniscus import config
 from meniscus import env
 from meniscus.correlation import receiver
+from meniscus.data.handlers.elasticsearch import mapping_tasks
 from meniscus.personas.common import publish_stats
+from meniscus.personas.worker import cache_sync
 from meniscus.queue import celery
 from meniscus.sinks.elasticsearch import ElasticSearchStreamBulker
+from meniscus.supervisor import ProcessSupervisor
+from meniscus import transport
 
 
 _LOG = env.get_logger(__name__)
@@ -22,21 +27,29 @@ def start_up():
     except config.cfg.ConfigFilesNotFoundError as ex:
         _LOG.exception(ex.message)
 
+    #preload the tenant caches before the processes that use them start
+    if cache_sync.WARM_UP:
+        cache_sync.warm_up_caches()
+
     application = api = falcon.API()
     api.add_route('/', VersionResource())
 
     #http correlation endpoint
     api.add_route('/v1/tenant/{tenant_id}/publish', PublishMessageResource())
+    api.add_route('/v1/tenant/{tenant_id}/publish/batch',
+                  PublishBatchResource())
 
-    #syslog correlation endpoint
-    server = receiver.new_correlation_input_server()
-
-    server_proc = Process(target=server.start)
-    server_proc.start()
-
+    #syslog correlation endpoint, each process of the pool receives from
+    #every upstream host and zmq fair queues messages between them
+    receiver_pool = ProcessSupervisor(
+        receiver.run_correlation_input_server,
+        processes=transport.RECEIVER_PROCESSES,
+        name='ZeroMQ reception server')
+    receiver_proc = Process(target=receiver_pool.run)
+    receiver_proc.start()
     _LOG.info(
-        'ZeroMQ reception server started as process: {}'.format(
-            server_proc.pid)
+        'ZeroMQ reception server pool started as process: {}'.format(
+            receiver_proc.pid)
     )
 
     celery.conf.CELERYBEAT_SCHEDULE = {
@@ -44,6 +57,14 @@ def start_up():
             'task': 'stats.publish',
             'schedule': timedelta(seconds=publish_stats.WORKER_STATUS_INTERVAL)
         },
+        'tenant_cache_sync': {
+            'task': 'cache.sync',
+            'schedule': timedelta(seconds=cache_sync.SYNC_INTERVAL)
+        },
+        'es_retention': {
+            'task': 'es.retention',
+            'schedule': timedelta(seconds=mapping_tasks.RETENTION_INTERVAL)
+        },
     }
 
     #include blank argument to celery in order for beat to start correctly
@@ -53,11 +74,15 @@ def start_up():
         'Celery started as process: {}'.format(celery_proc.pid)
     )
 
+    #daily indices are created from the log template as messages arrive
+    mapping_tasks.put_log_template.delay()
+
+    #each flusher pool is supervised by a process of its own, sized by the
+    #elasticsearch flusher_processes option rather than the worker's cores
     es_flusher = ElasticSearchStreamBulker()
-    flush_proc = Process(target=es_flusher.start)
-    flush_proc.start()
-    _LOG.info(
-        'ElasticSearchStreamBulker started as process: {}'.format(
-            flush_proc.pid)
-    )
+    for flush_proc in es_flusher.start():
+        _LOG.info(
+            'ElasticSearchStreamBulker pool started as process: {}'.format(
+                flush_proc.pid)
+        )
     return application
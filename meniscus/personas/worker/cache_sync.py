@@ -0,0 +1,170 @@
+"""
+The cache_sync module keeps the tenant and token caches of a worker in step
+with the coordinator. At start up the worker pages through every tenant and
+loads them into its caches, so that correlation does not have to fetch
+tenants from the coordinator one at a time. A periodic task then requests
+only the tenants changed since the last page that was applied, so that token
+resets and event producer changes reach the worker without waiting for cached
+tenants to expire.
+
+Sequence numbers are taken before a tenant is written, so a change can be
+committed after a change with a higher number. Each sync requests the
+changes within change_overlap sequence numbers below its cursor again, so
+that such a change is not skipped.
+"""
+
+import httplib
+
+from oslo.config import cfg
+import requests
+
+from meniscus.api.utils.request import http_request
+from meniscus.config import get_config
+from meniscus.config import init_config
+from meniscus.data.cache_handler import ConfigCache
+from meniscus.data.cache_handler import get_worker_config
+from meniscus.data.cache_handler import TenantCache
+from meniscus.data.cache_handler import TokenCache
+from meniscus.data.model.tenant import load_tenant_from_dict
+from meniscus.queue import celery
+from meniscus import env
+
+
+_LOG = env.get_logger(__name__)
+
+# cache sync configuration options
+_CACHE_SYNC_GROUP = cfg.OptGroup(name='cache_sync',
+                                 title='Tenant Cache Sync Settings')
+get_config().register_group(_CACHE_SYNC_GROUP)
+
+_CACHE_SYNC_OPTIONS = [
+    cfg.BoolOpt('warm_up',
+                default=True,
+                help="""load every tenant into the cache when the worker
+                    starts"""
+                ),
+    cfg.IntOpt('page_size',
+               default=500,
+               help="""number of tenants requested from the coordinator in
+                    each page"""
+               ),
+    cfg.IntOpt('sync_interval',
+               default=30,
+               help="""time in seconds between requests for tenant changes"""
+               ),
+    cfg.IntOpt('change_overlap',
+               default=100,
+               help="""number of change sequence numbers below the cursor
+                    that each sync requests again"""
+               )
+]
+
+get_config().register_opts(_CACHE_SYNC_OPTIONS, group=_CACHE_SYNC_GROUP)
+try:
+    init_config()
+    conf = get_config()
+except cfg.ConfigFilesNotFoundError:
+    conf = get_config()
+
+WARM_UP = conf.cache_sync.warm_up
+PAGE_SIZE = conf.cache_sync.page_size
+SYNC_INTERVAL = conf.cache_sync.sync_interval
+CHANGE_OVERLAP = conf.cache_sync.change_overlap
+
+
+class CacheSyncError(Exception):
+    pass
+
+
+def _request_changes(worker_config, since):
+    """
+    Requests a page of the tenants changed after the given cursor
+    """
+    try:
+        resp = http_request(
+            '{0}/tenants?since={1}&limit={2}'.format(
+                worker_config.coordinator_uri, since, PAGE_SIZE),
+            {'hostname': worker_config.hostname},
+            http_verb='GET')
+
+    except requests.RequestException as ex:
+        raise CacheSyncError(ex.message)
+
+    if resp.status_code != httplib.OK:
+        raise CacheSyncError(
+            'tenant changes request failed with status {0}'.format(
+                resp.status_code))
+
+    return resp.json()
+
+
+def _apply_changes(tenants):
+    """
+    Stores a page of changed tenants and their tokens in the caches
+    """
+    TokenCache().set_tokens(
+        dict((tenant.tenant_id, tenant.token) for tenant in tenants))
+    TenantCache().set_tenants(tenants)
+
+
+def load_tenant_changes(since=0, overlap=0):
+    """
+    Pages through the tenants changed after the given cursor and applies them
+    to the caches. The cursor is saved after each page, so that an
+    interrupted load resumes from the last page that was applied. The first
+    page starts overlap sequence numbers below the cursor, and the cursor
+    never moves back. Returns the number of tenants loaded.
+    """
+    worker_config = get_worker_config()
+    if not worker_config:
+        raise CacheSyncError('worker configuration not found')
+
+    config_cache = ConfigCache()
+    loaded = 0
+    cursor = since
+    since = max(since - overlap, 0)
+
+    while True:
+        page = _request_changes(worker_config, since)
+        tenants = [load_tenant_from_dict(tenant_dict)
+                   for tenant_dict in page['tenants']]
+
+        if tenants:
+            _apply_changes(tenants)
+            loaded += len(tenants)
+
+        since = page['next']
+        cursor = max(cursor, since)
+        config_cache.set_tenant_changes_cursor(cursor)
+
+        if not page['more']:
+            return loaded
+
+
+def warm_up_caches():
+    """
+    Loads every tenant into the caches. Failures are logged and do not stop
+    the worker from starting, as tenants are still fetched from the
+    coordinator when they are not found in the cache.
+    """
+    try:
+        loaded = load_tenant_changes(since=0)
+        _LOG.info('Loaded {0} tenants into the cache'.format(loaded))
+    except CacheSyncError as ex:
+        _LOG.warning('Tenant cache warm up failed: {0}'.format(ex.message))
+
+
+@celery.task(name="cache.sync")
+def sync_tenant_caches():
+    """
+    Applies the tenant changes made since the last sync, and those within
+    CHANGE_OVERLAP sequence numbers before it
+    """
+    since = ConfigCache().get_tenant_changes_cursor() or 0
+
+    try:
+        loaded = load_tenant_changes(since=since, overlap=CHANGE_OVERLAP)
+        if loaded:
+            _LOG.debug('Applied {0} tenant changes'.format(loaded))
+    except CacheSyncError as ex:
+        _LOG.info('Tenant cache sync failed: {0}'.format(ex.message))
@@ -1,3 +1,8 @@
+from itertools import izip
+from multiprocessing.managers import BaseManager
+import threading
+import time
+
 try:
     import uwsgi
     UWSGI = True
@@ -6,40 +11,223 @@ except ImportError:
     UWSGI = False
 
 
+def _is_live(entry):
+    expires_at = entry[0]
+    return not expires_at or expires_at > time.time()
+
+
+class CacheStore(dict):
+    """
+    The dictionary behind a SharedMemoryCache. get_many reads several entries
+    with one call, so that a batched read costs a single round trip to the
+    manager process that holds the store.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(CacheStore, self).__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+
+    def get_many(self, store_keys):
+        return [self.get(store_key) for store_key in store_keys]
+
+    def add(self, store_key, entry):
+        """
+        Stores an entry unless a live entry is stored for the key, and returns
+        True if the entry was stored. The manager serves each process from a
+        thread of its own, so the check and the write are made under a lock.
+        """
+        with self._lock:
+            existing = self.get(store_key)
+            if existing and _is_live(existing):
+                return False
+            self[store_key] = entry
+            return True
+
+
+class _CacheManager(BaseManager):
+    pass
+
+
+_CacheManager.register(
+    'CacheStore', CacheStore,
+    exposed=('get', 'get_many', 'add', 'update', 'pop', 'keys',
+             '__setitem__'))
+
+
+class SharedMemoryCache(object):
+    """
+    A pure python implementation of the subset of the uWSGI cache api used by
+    NativeProxy. Values are held in a CacheStore owned by a multiprocessing
+    manager, so that the cache is shared by every process forked after the
+    cache is created. This allows Meniscus to use the same caching code paths
+    when it is not running under uWSGI.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def _expires_at(self, cache_expires):
+        if cache_expires:
+            return time.time() + cache_expires
+        return 0
+
+    def cache_exists(self, key, cache_name):
+        return self.cache_get(key, cache_name) is not None
+
+    def cache_get(self, key, cache_name):
+        entry = self.store.get((cache_name, key))
+        if entry and _is_live(entry):
+            return entry[1]
+        return None
+
+    def cache_get_many(self, keys, cache_name):
+        entries = self.store.get_many([(cache_name, key) for key in keys])
+        return dict(
+            (key, entry[1]) for key, entry in izip(keys, entries)
+            if entry and _is_live(entry))
+
+    def cache_set(self, key, value, cache_expires, cache_name):
+        """
+        Stores a value only if the key does not exist, and returns True if it
+        was stored, as the uWSGI cache does
+        """
+        return self.store.add(
+            (cache_name, key), (self._expires_at(cache_expires), value))
+
+    def cache_update(self, key, value, cache_expires, cache_name):
+        self.store[(cache_name, key)] = (
+            self._expires_at(cache_expires), value)
+
+    def cache_update_many(self, values, cache_expires, cache_name):
+        expires_at = self._expires_at(cache_expires)
+        self.store.update(dict(
+            ((cache_name, key), (expires_at, value))
+            for key, value in values.iteritems()))
+
+    def cache_del(self, key, cache_name):
+        self.store.pop((cache_name, key), None)
+
+    def cache_clear(self, cache_name):
+        for store_key in self.store.keys():
+            if store_key[0] == cache_name:
+                self.store.pop(store_key, None)
+
+
+_shared_memory_cache = None
+
+
+def enable_shared_memory_cache():
+    """
+    Creates the shared memory cache used by NativeProxy when uWSGI is not
+    available. This must be called before worker processes are forked for
+    the cache to be shared between them.
+    """
+    global _shared_memory_cache
+    if not UWSGI and _shared_memory_cache is None:
+        manager = _CacheManager()
+        manager.start()
+        _shared_memory_cache = SharedMemoryCache(manager.CacheStore())
+
+
 class NativeProxy(object):
+    """
+    Proxies calls to the uWSGI cache, or to the shared memory cache when
+    running outside of uWSGI. When neither is available the cache operations
+    do nothing and reads always miss.
+    """
     def __init__(self):
-        self.server = uwsgi
         self.UWSGI = UWSGI
+        if UWSGI:
+            self.server = uwsgi
+        else:
+            self.server = _shared_memory_cache
         # Default timeout = 15 minutes
 
     def cache_exists(self, key, cache_name):
-        if self.UWSGI:
+        if self.server:
             return self.server.cache_exists(key, cache_name)
         else:
             return None
 
     def cache_get(self, key, cache_name):
-        if self.UWSGI:
+        """
+        Returns the value stored for a key, or None if the key does not exist.
+        This only costs a single call to the cache, so callers should prefer
+        it over calling cache_exists before reading.
+        """
+        if self.server:
             return self.server.cache_get(key, cache_name)
         else:
             return None
 
+    def cache_get_many(self, keys, cache_name):
+        """
+        Returns a dictionary of the values stored for the given keys. Keys
+        that do not exist are not included. The shared memory cache reads
+        every key in one call. The uWSGI cache api has no multi-key read, so
+        under uWSGI each key is read from the local cache in turn, which does
+        not leave the process.
+        """
+        values = dict()
+        if hasattr(self.server, 'cache_get_many'):
+            values = self.server.cache_get_many(keys, cache_name)
+        elif self.server:
+            for key in keys:
+                value = self.server.cache_get(key, cache_name)
+                if value is not None:
+                    values[key] = value
+        return values
+
     def cache_set(self, key, value, cache_expires, cache_name):
-        if self.UWSGI:
+        if self.server:
             self.server.cache_set(
                 key, value, cache_expires, cache_name)
 
     def cache_update(self, key, value, cache_expires, cache_name):
-        if self.UWSGI:
+        if self.server:
             self.server.cache_update(
                 key, value, cache_expires, cache_name)
 
+    def cache_add(self, key, value, cache_expires, cache_name):
+        """
+        Stores a value only if the key does not exist, as a single operation
+        of the cache that concurrent processes can not both succeed at.
+        Returns True if the value was stored, and always returns True without
+        a cache, as there is no other process to share the key with.
+        """
+        if self.server:
+            return bool(self.server.cache_set(
+                key, value, cache_expires, cache_name))
+        return True
+
+    def cache_upsert(self, key, value, cache_expires, cache_name):
+        """
+        Stores a value whether or not the key already exists, in a single call
+        to the cache.
+        """
+        if self.server:
+            self.server.cache_update(
+                key, value, cache_expires, cache_name)
+
+    def cache_set_many(self, values, cache_expires, cache_name):
+        """
+        Upserts every key and value in the given dictionary, with a single
+        call to the shared memory cache or one call for each key to the uWSGI
+        cache
+        """
+        if hasattr(self.server, 'cache_update_many'):
+            self.server.cache_update_many(values, cache_expires, cache_name)
+        elif self.server:
+            for key, value in values.iteritems():
+                self.server.cache_update(
+                    key, value, cache_expires, cache_name)
+
     def cache_del(self, key, cache_name):
-        if self.UWSGI:
+        if self.server:
             self.server.cache_del(key, cache_name)
 
     def cache_clear(self, cache_name):
-        if self.UWSGI:
+        if self.server:
             self.server.cache_clear(cache_name)
 
     def restart(self):
@@ -1,7 +1,12 @@
 from celery import Celery
-
+from kombu import compression
 from oslo.config import cfg
 
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
 import meniscus.config as config
 from meniscus import env
 
@@ -27,12 +32,36 @@ _CELERY = [
                 ),
     cfg.StrOpt('CELERY_TASK_SERIALIZER',
                default="json",
-               help="""default serialization method to use"""
+               help="""serialization method used for pipeline tasks and
+                    index requests, json or msgpack"""
+               ),
+    cfg.StrOpt('CELERY_MESSAGE_COMPRESSION',
+               default=None,
+               help="""compression used for pipeline tasks and index
+                    requests, zlib, bzip2 or lz4. Messages are not compressed
+                    when this is not set"""
                )
 ]
 
 config.get_config().register_opts(_CELERY, group=_CELERY_GROUP)
 
+# Pipeline queue options, shared by the correlator and the sinks
+_PIPELINE_GROUP = cfg.OptGroup(
+    name='pipeline', title='Correlation Pipeline Options')
+config.get_config().register_group(_PIPELINE_GROUP)
+
+_PIPELINE_QUEUE_OPTIONS = [
+    cfg.BoolOpt('transient_non_durable',
+                default=False,
+                help="""normalize and route messages from event producers
+                    that are not durable in the same process, and store them
+                    through transient queues"""
+                )
+]
+
+config.get_config().register_opts(
+    _PIPELINE_QUEUE_OPTIONS, group=_PIPELINE_GROUP)
+
 try:
     config.init_config()
 except config.cfg.ConfigFilesNotFoundError as ex:
@@ -41,11 +70,26 @@ except config.cfg.ConfigFilesNotFoundError as ex:
 
 celery_conf = config.get_config().celery
 
+#lz4 is not built into kombu, register it when the package is installed
+if lz4_frame is not None:
+    compression.register(lz4_frame.compress, lz4_frame.decompress,
+                         'application/x-lz4', aliases=['lz4'])
+
+TASK_SERIALIZER = celery_conf.CELERY_TASK_SERIALIZER
+TASK_COMPRESSION = celery_conf.CELERY_MESSAGE_COMPRESSION or None
+TRANSIENT_NON_DURABLE = config.get_config().pipeline.transient_non_durable
+#queue of the tasks that only the tenant persona registers, so that the
+#workers consuming the default queue never receive them
+TENANT_QUEUE = 'tenant'
+
 
 celery = Celery('meniscus', broker=celery_conf.BROKER_URL)
 
 celery.conf.BROKER_URL = celery_conf.BROKER_URL
 celery.conf.CELERYD_CONCURRENCY = celery_conf.CELERYD_CONCURRENCY
 celery.conf.CELERY_DISABLE_RATE_LIMITS = celery_conf.CELERY_DISABLE_RATE_LIMITS
-celery.conf.CELERY_TASK_SERIALIZER = celery_conf.CELERY_TASK_SERIALIZER
+celery.conf.CELERY_TASK_SERIALIZER = TASK_SERIALIZER
+celery.conf.CELERY_MESSAGE_COMPRESSION = TASK_COMPRESSION
+celery.conf.CELERY_ACCEPT_CONTENT = sorted(set(['json', TASK_SERIALIZER]))
 celery.conf.CELERYD_HIJACK_ROOT_LOGGER = False
+celery.conf.CELERY_ROUTES = {'es.placement': {'queue': TENANT_QUEUE}}
@@ -1,8 +1,12 @@
+from collections import deque
+import threading
+
 from oslo.config import cfg
 
 import meniscus.config as config
 from meniscus import env
 from meniscus.sinks import elasticsearch
+from meniscus.sinks.document import expand_raw_json
 
 _LOG = env.get_logger(__name__)
 
@@ -17,6 +21,13 @@ _SINK = [
     cfg.StrOpt('default_sink',
                default='elasticsearch',
                help="""default data sink"""
+               ),
+    cfg.IntOpt('retry_buffer_size',
+               default=1000,
+               help="""number of messages from producers that are not
+                    durable held in each process for another attempt when
+                    they can not be sent to a sink. Messages that do not fit
+                    are queued as a task instead"""
                )
 ]
 
@@ -31,9 +42,71 @@ conf = config.get_config()
 
 VALID_SINKS = conf.data_sinks.valid_sinks
 DEFAULT_SINK = conf.data_sinks.default_sink
+RETRY_BUFFER_SIZE = conf.data_sinks.retry_buffer_size
+
+#messages from producers that are not durable that could not be sent to
+#elasticsearch, oldest first
+_retry_buffer = deque()
+_retry_lock = threading.Lock()
 
 
 def route_message(message):
+    """
+    Hands a message off to each of its sinks. Index requests are published
+    straight to the elasticsearch bulk queue from this process.
+    """
     message_sinks = message['meniscus']['correlation']['sinks']
     if 'elasticsearch' in message_sinks:
-        elasticsearch.put_message.delay(message)
+        _index_message(message)
+
+
+def _index_message(message):
+    """
+    Publishes an index request for a message. Messages from durable
+    producers that fail to publish are queued as a put_message task, which
+    retries until it succeeds. Messages from producers that are not durable
+    are held in a bounded buffer in the memory of the process instead, and
+    are sent again before the next message this process routes. When the
+    buffer is full they are queued as a put_message task as well.
+    """
+    if _retry_buffer:
+        _send_retry_buffer()
+
+    try:
+        elasticsearch.index_message(message)
+    except Exception as ex:
+        _LOG.exception(ex.message)
+        if message['meniscus']['correlation'].get('durable', True):
+            _queue_put_message(message)
+        else:
+            _buffer_or_queue(message)
+
+
+def _send_retry_buffer():
+    """
+    Sends the buffered messages again, oldest first, stopping at the first
+    message that fails
+    """
+    with _retry_lock:
+        while _retry_buffer:
+            try:
+                elasticsearch.index_message(_retry_buffer[0])
+            except Exception as ex:
+                _LOG.debug('Retry of buffered messages failed: {0}'.format(
+                    ex.message))
+                return
+            _retry_buffer.popleft()
+
+
+def _buffer_or_queue(message):
+    with _retry_lock:
+        if len(_retry_buffer) < RETRY_BUFFER_SIZE:
+            _retry_buffer.append(message)
+            return
+
+    _queue_put_message(message)
+
+
+def _queue_put_message(message):
+    #the task serializer does not know of raw json values
+    elasticsearch.put_message.delay(expand_raw_json(message))
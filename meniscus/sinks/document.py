@@ -0,0 +1,76 @@
+"""
+The document module encodes messages as the JSON documents stored by the
+sinks. Values of a message's normalized field that are already JSON text,
+such as the events of the normalizer, are held as RawJson and are inserted
+into the encoded document as they are, so that they are only encoded once.
+"""
+import datetime
+import json
+import uuid
+
+
+#placeholders for raw values are unique to the process, so that they can not
+#be mistaken for a string value of the message
+_PLACEHOLDER = '__meniscus_raw_json_{0}_{{0}}__'.format(uuid.uuid4().hex)
+
+
+class RawJson(unicode):
+    """
+    JSON text that stands for a value of the normalized field of a message.
+    Serializers that do not know of RawJson encode it as a string, so
+    expand_raw_json must be called on a message before it is passed to them.
+    """
+
+
+def _default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError('{0!r} is not JSON serializable'.format(value))
+
+
+def _dumps(value):
+    return json.dumps(value, default=_default)
+
+
+def _raw_values(message):
+    normalized = message.get('normalized')
+    if not normalized:
+        return dict()
+    return dict((key, value) for key, value in normalized.iteritems()
+                if isinstance(value, RawJson))
+
+
+def encode_document(message):
+    """
+    Encodes a message as a UTF-8 JSON document, inserting its RawJson values
+    without decoding them
+    """
+    raw_values = _raw_values(message)
+    if not raw_values:
+        encoded = _dumps(message)
+    else:
+        placeholders = dict(
+            (key, _PLACEHOLDER.format(index))
+            for index, key in enumerate(raw_values))
+        normalized = dict(message['normalized'])
+        normalized.update(placeholders)
+        message = dict(message)
+        message['normalized'] = normalized
+
+        encoded = _dumps(message)
+        for key, placeholder in placeholders.iteritems():
+            encoded = encoded.replace(
+                '"{0}"'.format(placeholder), raw_values[key], 1)
+
+    if isinstance(encoded, unicode):
+        encoded = encoded.encode('utf-8')
+    return encoded
+
+
+def expand_raw_json(message):
+    """
+    Decodes the RawJson values of a message in place, and returns the message
+    """
+    for key, value in _raw_values(message).iteritems():
+        message['normalized'][key] = json.loads(value)
+    return message
@@ -1,3 +1,4 @@
 #bring put_message task into meniscus.sinks.elasticsearch namespace
+from meniscus.sinks.elasticsearch.sink import index_message
 from meniscus.sinks.elasticsearch.sink import put_message
 from meniscus.sinks.elasticsearch.sink import ElasticSearchStreamBulker
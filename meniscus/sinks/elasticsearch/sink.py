@@ -1,22 +1,55 @@
 """
 This module contains operations for implementing an elasticsearch data sink.
 It exposes a task that allows messages to be queued for indexing.  It then
-exposes the ElasticSearchBulkStreamer which creates a pool of processes for
-pulling a stream off of the queue and performing bulk flushes to Elasticsearch.
+exposes the ElasticSearchStreamBulker which runs supervised pools of processes
+for pulling a stream off of the queues and performing bulk flushes to
+Elasticsearch.
+
+Index requests are queued as the lines of an elasticsearch bulk request,
+encoded once as they are queued, and are added to the bulk requests of the
+flushers without being decoded. The queue message headers name the index and
+routing of the request. Requests queued as action dictionaries by earlier
+versions are still accepted.
+
+Messages from durable event producers are queued as persistent messages on a
+durable queue and are acknowledged once they have been indexed. When the
+pipeline.transient_non_durable option is set, messages from producers that
+are not durable are queued as transient messages on a queue that is not
+durable, and are acknowledged as soon as they are received.
+
+Durable messages whose action fails to index are published to a retry queue,
+where they wait for a backoff that doubles with each retry before they are
+dead lettered back to the elasticsearch queue. Once a message has been
+retried bulk_max_retries times it is moved to a dead letter queue instead.
+The backoff is part of the name of each retry queue, so that changing it
+declares new retry queues rather than conflicting with the existing ones.
 """
-from multiprocessing import cpu_count, Process
-import signal
-import sys
+from collections import Counter, deque
+import datetime
+from functools import partial
+from itertools import izip
+from multiprocessing import Process
+import time
 import uuid
 
 from kombu import Connection, Exchange, Queue
 from kombu.pools import producers
+from elasticsearch import ElasticsearchException
 from elasticsearch import helpers as es_helpers
+from elasticsearch.serializer import JSONSerializer
 
 import meniscus.config as config
 from meniscus import env
 from meniscus.data.handlers import elasticsearch
+from meniscus.data.handlers.elasticsearch import mapping_tasks
+from meniscus.openstack.common import timeutils
+from meniscus.proxy import NativeProxy
 from meniscus.queue import celery
+from meniscus.queue import TASK_COMPRESSION
+from meniscus.queue import TASK_SERIALIZER
+from meniscus.queue import TRANSIENT_NON_DURABLE
+from meniscus.sinks.document import encode_document
+from meniscus.supervisor import ProcessSupervisor
 
 
 _LOG = env.get_logger(__name__)
@@ -25,10 +58,46 @@ conf = config.get_config()
 broker_url = conf.celery.BROKER_URL
 
 es_handler = elasticsearch.get_handler()
+_serializer = JSONSerializer()
 
 BULK_SIZE = es_handler.bulk_size
-TTL = es_handler.ttl
+BULK_MAX_BYTES = es_handler.bulk_max_bytes
+BULK_LINGER_MS = es_handler.bulk_linger_ms
+BULK_MAX_RETRIES = es_handler.bulk_max_retries
+BULK_RETRY_BACKOFF_MS = es_handler.bulk_retry_backoff_ms
+#time in seconds to wait before trying again after a failure
+BULK_RETRY_SECONDS = 1
+#time in seconds to wait for a message while no actions are buffered, and
+#so the longest time before a flusher notices it should stop
+IDLE_TIMEOUT = 1
+#time in seconds between the log lines that report a flusher's counters
+STATS_LOG_SECONDS = 60
+#time in seconds to wait before adding an alias that failed to be added again
+ALIAS_RETRY_SECONDS = 300
+ALIAS_CACHE = es_handler.alias_cache
+#time in seconds an added alias is remembered, by when its daily index no
+#longer receives messages
+ALIAS_CACHE_EXPIRES = 2 * 24 * 60 * 60
+FLUSHER_PROCESSES = es_handler.flusher_processes
 ELASTICSEARCH_QUEUE = 'elasticsearch'
+ELASTICSEARCH_TRANSIENT_QUEUE = 'elasticsearch_transient'
+ELASTICSEARCH_DEAD_LETTER_QUEUE = 'elasticsearch_dead_letter'
+#header that counts how many times a message has been retried
+RETRIES_HEADER = 'x-meniscus-retries'
+#content type and headers of index requests queued as encoded bulk lines
+BULK_CONTENT_TYPE = 'application/x-ndjson'
+INDEX_HEADER = 'x-meniscus-index'
+ROUTING_HEADER = 'x-meniscus-routing'
+
+
+def _retry_queue_name(retry, backoff_ms):
+    """
+    Returns the name of the queue where messages wait backoff_ms before
+    their retry. The time to live of a queue is fixed when it is declared,
+    so queues with different backoffs must have different names.
+    """
+    return '{0}_retry_{1}_{2}'.format(ELASTICSEARCH_QUEUE, retry, backoff_ms)
+
 
 try:
     # The broker where our exchange is.
@@ -43,110 +112,552 @@ try:
     # Queue that exchange will route messages to
     es_queue = Queue(ELASTICSEARCH_QUEUE, exchange=bound_exchange,
                      routing_key=ELASTICSEARCH_QUEUE, queue_durable=True)
+
+    # Queue for messages that may be lost if the broker restarts
+    es_transient_queue = Queue(
+        ELASTICSEARCH_TRANSIENT_QUEUE, exchange=bound_exchange,
+        routing_key=ELASTICSEARCH_TRANSIENT_QUEUE, durable=False)
+
+    # Queues where failed messages wait before they are dead lettered back
+    # to the elasticsearch queue, one for each retry so that every message
+    # on a queue waits for the same time
+    es_retry_queues = [
+        Queue(_retry_queue_name(retry, BULK_RETRY_BACKOFF_MS * 2 ** retry),
+              exchange=bound_exchange,
+              routing_key=_retry_queue_name(
+                  retry, BULK_RETRY_BACKOFF_MS * 2 ** retry),
+              durable=True,
+              queue_arguments={
+                  'x-message-ttl': BULK_RETRY_BACKOFF_MS * 2 ** retry,
+                  'x-dead-letter-exchange': ELASTICSEARCH_QUEUE,
+                  'x-dead-letter-routing-key': ELASTICSEARCH_QUEUE})
+        for retry in range(BULK_MAX_RETRIES)]
+
+    # Queue for messages that could not be indexed after every retry
+    es_dead_letter_queue = Queue(
+        ELASTICSEARCH_DEAD_LETTER_QUEUE, exchange=bound_exchange,
+        routing_key=ELASTICSEARCH_DEAD_LETTER_QUEUE, durable=True)
 except Exception as ex:
     _LOG.exception(ex)
 
 
-def _queue_index_request(index, doc_type, document, ttl=TTL):
+def _queue_index_request(index, doc_type, document, durable=True,
+                         routing=None):
     """
-    places a message index request on the queue
+    places a message index request on the queue, or on the transient queue
+    if the request does not need to survive a broker restart. The request is
+    queued as the encoded lines it adds to a bulk request.
     """
 
     #create the metadata for index operation
-    action = {
+    op = {
         '_index': index,
         '_type': doc_type,
-        '_id': str(uuid.uuid4()),
-        '_ttl': ttl,
-        '_source': document
+        '_id': str(uuid.uuid4())
     }
+    headers = {INDEX_HEADER: index}
+    if routing is not None:
+        op['_routing'] = routing
+        headers[ROUTING_HEADER] = routing
+
+    lines = (_serializer.dumps({'index': op}) + '\n' +
+             encode_document(document) + '\n')
+
+    if durable:
+        queue = es_queue
+        delivery_mode = 'persistent'
+    else:
+        queue = es_transient_queue
+        delivery_mode = 'transient'
 
     #publish the message
     with producers[connection].acquire(block=True) as producer:
-        producer.publish(action, routing_key=ELASTICSEARCH_QUEUE,
-                         serializer='json', declare=[es_queue])
+        producer.publish(lines, routing_key=queue.routing_key,
+                         delivery_mode=delivery_mode,
+                         content_type=BULK_CONTENT_TYPE,
+                         content_encoding='binary', headers=headers,
+                         compression=TASK_COMPRESSION, declare=[queue])
+
 
+def index_message(message):
+    """
+    Builds an indexing request for a message, then sends the request
+    to be queued. The message is indexed into the daily index for the time
+    it is queued, which is shared with other tenants unless the tenant has
+    been promoted to dedicated indices.
+    """
+    correlation = message['meniscus']['correlation']
+    index, routing = mapping_tasks.tenant_index(
+        message['meniscus']['tenant'],
+        dedicated=correlation.get('dedicated_index', False))
+    _queue_index_request(
+        index=index,
+        doc_type=correlation['pattern'],
+        document=message,
+        durable=(correlation.get('durable', True) or
+                 not TRANSIENT_NON_DURABLE),
+        routing=routing)
 
-@celery.task
+
+@celery.task(serializer=TASK_SERIALIZER, compression=TASK_COMPRESSION)
 def put_message(message):
     """
     Builds an indexing requests for a message, then sends the request
-    to be queued
+    to be queued. Messages are routed to the queue directly, this task
+    remains for messages that could not be published when they were routed
+    and for tasks queued by earlier versions.
     """
     try:
-        _queue_index_request(
-            index=message['meniscus']['tenant'],
-            doc_type=message['meniscus']['correlation']['pattern'],
-            document=message)
+        index_message(message)
     except Exception as ex:
         _LOG.exception(ex.message)
         put_message.retry()
 
 
-def get_queue_stream(ack_list, bulk_timeout=60):
+def _bulk_item_ok(item):
     """
-    A generator that pulls messages off a queue and yields the result.
-    The generator can be used as an iterable to consume messages.
-    Messages will be pulled continuously and will block while waiting for new
-    messages until the timeout is reached.
-    :param ack_list: list of data for messages that pending acknowledgement
-    :param bulk_timeout:  length of time to wait for a message from queue
+    Returns True if an item of a bulk response reports a successful action
     """
-    with Connection(broker_url) as connection:
-        simple_queue = connection.SimpleQueue(ELASTICSEARCH_QUEUE)
-        while True:
-            msg = simple_queue.get(block=True, timeout=bulk_timeout)
-            ack_list.append(msg)
-            yield msg.payload
+    op_type, result = dict(item).popitem()
+    return 'error' not in result
+
+
+def _retry_message(message):
+    """
+    Publishes a message that failed to index to the retry queue for its next
+    retry, or to the dead letter queue once it has been retried
+    BULK_MAX_RETRIES times. The body is published as it was received, without
+    decoding it. Returns True if the message will be retried.
+    """
+    retries = message.headers.get(RETRIES_HEADER, 0)
+    if retries < BULK_MAX_RETRIES:
+        queue = es_retry_queues[retries]
+    else:
+        queue = es_dead_letter_queue
+
+    #the body was decompressed when it was received
+    headers = dict(message.headers)
+    headers.pop('compression', None)
+    headers[RETRIES_HEADER] = retries + 1
+
+    with producers[connection].acquire(block=True) as producer:
+        producer.publish(message.body, routing_key=queue.routing_key,
+                         delivery_mode='persistent', headers=headers,
+                         content_type=message.content_type,
+                         content_encoding=message.content_encoding,
+                         compression=TASK_COMPRESSION, declare=[queue])
 
+    return queue is not es_dead_letter_queue
 
-def flush_to_es():
+
+def _ack_through(message):
     """
-    Flushes a stream of messages to elasticsearch using bulk flushing.
-    Uses a generator to pull messages off the queue and passes this as an
-     iterable to the streaming_bulk method.  streaming_bulk is also a generator
-     that yields message data used for acking from the queue after they
-     are flushed.
-    :param bulk_size: the number of messages to flush at once to elasticsearch
-    :param bulk_timeout:
-    :return: length of time to wait for a message from queue
+    Acknowledges a message and every unacknowledged message delivered before
+    it on the same channel
     """
+    message.channel.basic_ack(message.delivery_tag, multiple=True)
+
+
+class AliasCache(object):
+    """
+    Records the tenant aliases added to daily indices in the shared cache, so
+    that the flushers sharing the cache add each alias once instead of once
+    per flusher.
+    """
+    def __init__(self):
+        self.cache = NativeProxy()
+
+    def _alias_key(self, index, alias):
+        return '{0}/{1}'.format(index, alias)
+
+    def claim(self, index, alias):
+        """
+        Records that an alias is being added to an index, and returns False
+        if this or another flusher already recorded it
+        """
+        return self.cache.cache_add(
+            self._alias_key(index, alias), '1', ALIAS_CACHE_EXPIRES,
+            ALIAS_CACHE)
+
+    def release(self, index, alias):
+        """
+        Forgets an alias that could not be added, so that it is added again
+        """
+        self.cache.cache_del(self._alias_key(index, alias), ALIAS_CACHE)
+
+
+class BulkBuffer(object):
+    """
+    Holds index actions, and the queue messages they were received in, until
+    they are sent to elasticsearch as one bulk request. A flush is due once
+    the buffer holds max_docs actions or max_bytes of encoded actions, or
+    once its oldest action has waited for linger_ms milliseconds. Daily
+    indices are created by the bulk requests that first write to them, after
+    which the buffer adds the alias of each tenant written to them, unless
+    another flusher sharing the alias cache already has.
+    """
+
+    def __init__(self, es_client, max_docs=BULK_SIZE,
+                 max_bytes=BULK_MAX_BYTES, linger_ms=BULK_LINGER_MS,
+                 handler=None):
+        """
+        :param es_client: the elasticsearch client bulk requests are sent with
+        :param handler: the ElasticsearchHandler aliases are added with,
+        es_handler by default
+        """
+        self.es_client = es_client
+        self.handler = handler or es_handler
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.linger_ms = linger_ms
+        self.counters = Counter()
+        self.aliased_indices = set()
+        self._alias_retry_at = dict()
+        self._pruned_on = None
+        self._clear()
+
+    def _clear(self):
+        self.lines = list()
+        self.messages = deque()
+        self.indices = set()
+        self.size = 0
+        self.oldest = None
+
+    def __len__(self):
+        return len(self.messages)
+
+    def add(self, action, message=None):
+        """
+        Encodes an index action and holds it with the queue message that
+        carried it. The message is None when it was acknowledged as it was
+        received.
+        """
+        op, source = es_helpers.expand_action(action)
+        dumps = self.es_client.transport.serializer.dumps
+        lines = dumps(op) + '\n' + dumps(source) + '\n'
+        self.add_encoded(
+            lines, action['_index'], action.get('_routing'), message)
+
+    def add_encoded(self, lines, index, routing=None, message=None):
+        """
+        Holds the encoded bulk lines of an index action with the queue
+        message that carried them
+        :param lines: the action and source lines, each ending in a newline
+        :param index: the index the action writes to
+        :param routing: the routing value of the action, if it has one
+        :param message: the queue message, or None if it was acknowledged
+        """
+        self.lines.append(lines)
+        self.messages.append(message)
+        self.indices.add((index, routing))
+        self.size += len(lines)
+        if self.oldest is None:
+            self.oldest = time.time()
+
+    def wait_time(self):
+        """
+        Returns the time in seconds until the oldest action has waited for
+        linger_ms, or None if the buffer is empty
+        """
+        if self.oldest is None:
+            return None
+        return max(self.oldest + self.linger_ms / 1000.0 - time.time(), 0)
 
-    while True:
+    def is_full(self):
+        return len(self.messages) >= self.max_docs or \
+            self.size >= self.max_bytes
 
+    def is_due(self):
+        return bool(self.messages) and (
+            self.is_full() or self.wait_time() <= 0)
+
+    def flush(self):
+        """
+        Sends the held actions as one bulk request. Messages of actions that
+        failed to index are passed to the retry queues, and then every
+        message of the chunk is acknowledged with a single acknowledgement.
+        A message that can not be passed to the retry queues is requeued. If
+        the request fails the actions are kept, so that the flush can be tried
+        again. Returns the number of actions indexed and failed.
+        """
+        if not self.messages:
+            return 0, 0
+
+        resp = self.es_client.bulk(''.join(self.lines))
+        messages = self.messages
+        indices = self.indices
+        self._clear()
+
+        indexed = failed = 0
+        last_message = None
+
+        for message, item in izip(messages, resp['items']):
+            if _bulk_item_ok(item):
+                indexed += 1
+            else:
+                failed += 1
+                if message is not None and not self._retry(message):
+                    continue
+
+            if message is not None:
+                last_message = message
+
+        #requeued messages are already settled, so acknowledging the last
+        #message that was not requeued acknowledges every other message
+        if last_message is not None:
+            _ack_through(last_message)
+
+        self.counters['chunks'] += 1
+        self.counters['indexed'] += indexed
+        self.counters['failed'] += failed
+        if failed:
+            _LOG.warning('{0} of {1} actions of a bulk request failed to '
+                         'index'.format(failed, indexed + failed))
+
+        self._alias_indices(indices)
+        return indexed, failed
+
+    def _alias_indices(self, indices):
+        """
+        Adds tenant aliases to the daily indices this buffer has not yet
+        aliased, skipping the aliases another flusher has claimed in the
+        alias cache. Actions on a shared index are routed by tenant id, while
+        the tenant of a dedicated index is named by the index. An index that
+        can not be aliased is tried again by the first flush that writes to
+        it once ALIAS_RETRY_SECONDS have passed.
+        """
+        self._prune_aliased_indices()
+        alias_cache = AliasCache()
+        now = time.time()
+        for index, routing in indices - self.aliased_indices:
+            if self._alias_retry_at.get((index, routing), 0) > now:
+                continue
+
+            tenant_id = routing
+            if tenant_id is None:
+                parsed = mapping_tasks.parse_time_index(index)
+                tenant_id = parsed[0] if parsed else None
+            if tenant_id is None:
+                self.aliased_indices.add((index, routing))
+                continue
+
+            alias = mapping_tasks.tenant_alias_name(tenant_id)
+            if not alias_cache.claim(index, alias):
+                self.aliased_indices.add((index, routing))
+                continue
+
+            try:
+                self.handler.put_alias(
+                    index, alias,
+                    body=mapping_tasks.tenant_alias(tenant_id, routing))
+                self.aliased_indices.add((index, routing))
+                self._alias_retry_at.pop((index, routing), None)
+            except ElasticsearchException as ex:
+                alias_cache.release(index, alias)
+                self.counters['alias_failed'] += 1
+                self._alias_retry_at[(index, routing)] = (
+                    now + ALIAS_RETRY_SECONDS)
+                _LOG.warning('unable to alias index {0}, trying again in {1} '
+                             'seconds: {2}'.format(
+                                 index, ALIAS_RETRY_SECONDS, ex))
+
+    def _prune_aliased_indices(self):
+        """
+        Forgets the daily indices of past days once a day, as messages are
+        only written to the indices of the current day
+        """
+        today = timeutils.utcnow().date()
+        if self._pruned_on == today:
+            return
+        self._pruned_on = today
+
+        yesterday = today - datetime.timedelta(days=1)
+        aliased_indices = list(self.aliased_indices)
+        for aliased in aliased_indices + self._alias_retry_at.keys():
+            parsed = mapping_tasks.parse_time_index(aliased[0])
+            if parsed is None or parsed[1] < yesterday:
+                self.aliased_indices.discard(aliased)
+                self._alias_retry_at.pop(aliased, None)
+
+    def _retry(self, message):
+        """
+        Passes a message to the retry queues, or requeues it if that fails.
+        Returns False if the message was requeued.
+        """
         try:
-            es_client = es_handler.connection
-            ack_list = list()
-            actions = get_queue_stream(ack_list)
-            bulker = es_helpers.streaming_bulk(
-                es_client, actions, chunk_size=BULK_SIZE)
-            _LOG.error("Post flush")
+            if _retry_message(message):
+                self.counters['retried'] += 1
+            else:
+                self.counters['dead_lettered'] += 1
+            return True
+        except Exception as ex:
+            _LOG.exception(ex)
+            message.requeue()
+            self.counters['requeued'] += 1
+            return False
 
-            for response in bulker:
-                msg = ack_list.pop(0)
-                msg_ok = response[0]
 
-                if msg_ok:
-                    msg.ack()
+def _get_simple_queue(connection, durable, prefetch_count):
+    """
+    Returns a SimpleQueue consuming from the durable or transient queue. The
+    broker delivers no more than prefetch_count unacknowledged messages.
+    """
+    if durable:
+        simple_queue = connection.SimpleQueue(ELASTICSEARCH_QUEUE)
+    else:
+        simple_queue = connection.SimpleQueue(es_transient_queue, no_ack=True)
+    simple_queue.consumer.qos(prefetch_count=prefetch_count)
+    return simple_queue
+
+
+def _flush(bulk_buffer, counter):
+    indexed, failed = bulk_buffer.flush()
+    counter.value += indexed + failed
+
+
+def _log_counters(bulk_buffer):
+    _LOG.info('elasticsearch flusher counters: {0}'.format(
+        dict(bulk_buffer.counters)))
+
+
+def _add_message(bulk_buffer, msg, durable):
+    held = msg if durable else None
+    if msg.content_type == BULK_CONTENT_TYPE:
+        bulk_buffer.add_encoded(
+            msg.body, msg.headers[INDEX_HEADER],
+            msg.headers.get(ROUTING_HEADER), held)
+    else:
+        bulk_buffer.add(msg.payload, held)
+
+
+def stream_to_es(simple_queue, bulk_buffer, stop_event, counter,
+                 durable=True):
+    """
+    Pulls index actions off a queue into a bulk buffer, and flushes the buffer
+    whenever a flush is due. Waiting for a message never takes longer than
+    the oldest buffered action may linger, and a timeout does not discard
+    the buffer or the unacknowledged messages it holds. While the buffer is
+    full and can not be flushed no more messages are pulled. Once stop_event
+    is set the buffer is drained and the stream returns. The counters of the
+    buffer are logged every STATS_LOG_SECONDS.
+    :param simple_queue: the kombu SimpleQueue to pull messages from
+    :param bulk_buffer: the BulkBuffer that holds actions between flushes
+    :param stop_event: event that is set when the stream should stop
+    :param counter: shared value that counts the flushed actions
+    :param durable: whether the messages must be acknowledged once indexed
+    """
+    next_stats_log = time.time() + STATS_LOG_SECONDS
+
+    while not stop_event.is_set():
+        if not bulk_buffer.is_full():
+            timeout = bulk_buffer.wait_time()
+            if timeout is None:
+                timeout = IDLE_TIMEOUT
+
+            try:
+                msg = simple_queue.get(block=True, timeout=timeout)
+                _add_message(bulk_buffer, msg, durable)
+            except simple_queue.Empty:
+                pass
+
+        if bulk_buffer.is_due():
+            try:
+                _flush(bulk_buffer, counter)
+            except ElasticsearchException as ex:
+                _LOG.exception(ex)
+                stop_event.wait(BULK_RETRY_SECONDS)
+
+        if time.time() >= next_stats_log:
+            _log_counters(bulk_buffer)
+            next_stats_log = time.time() + STATS_LOG_SECONDS
+
+    #actions that can not be flushed are redelivered by the broker
+    try:
+        _flush(bulk_buffer, counter)
+    except ElasticsearchException as ex:
+        _LOG.exception(ex)
+
+
+def flush_to_es(stop_event, counter, durable=True, bulk_size=BULK_SIZE):
+    """
+    Flushes a stream of messages to elasticsearch using bulk flushing, until
+    stop_event is set. Messages are held in a BulkBuffer until it holds
+    bulk_size actions or bulk_max_bytes of encoded actions, or until the
+    oldest action has waited bulk_linger_ms, and the broker prefetches
+    bulk_size messages so that a buffer can fill without waiting on it.
+    If the broker connection is lost the buffer is dropped, as its
+    unacknowledged messages are delivered again by the broker.
+    :param stop_event: event that is set when flushing should stop
+    :param counter: shared value that counts the flushed actions
+    :param durable: flush the durable queue, or the transient queue
+    :param bulk_size: number of actions sent in one bulk request
+    """
+    bulk_buffer = None
+
+    while not stop_event.is_set():
+        try:
+            with Connection(broker_url) as connection:
+                simple_queue = _get_simple_queue(
+                    connection, durable, bulk_size)
+                bulk_buffer = BulkBuffer(
+                    es_handler.connection, max_docs=bulk_size,
+                    handler=es_handler)
+                stream_to_es(
+                    simple_queue, bulk_buffer, stop_event, counter, durable)
 
         except Exception as ex:
             _LOG.exception(ex)
+            stop_event.wait(BULK_RETRY_SECONDS)
+
+    if bulk_buffer is not None:
+        _log_counters(bulk_buffer)
 
 
 class ElasticSearchStreamBulker(object):
     """
-    Controls a mutliprocess pool that pulls a message stream from a queue and
-    bulk flushes to elasticsearch
+    Controls supervised multiprocess pools that pull message streams from the
+    durable queue, and from the transient queue when transient messages are
+    enabled, and bulk flush to elasticsearch. Each pool is run by a process
+    of its own, which restarts flushers that exit and logs their throughput.
     """
-    def __init__(self, bulk_size=BULK_SIZE):
+    def __init__(self, bulk_size=BULK_SIZE, processes=FLUSHER_PROCESSES,
+                 transient=TRANSIENT_NON_DURABLE):
+        """
+        :param bulk_size: number of actions sent in one bulk request, and the
+        number of messages each flusher prefetches
+        :param processes: number of flushers for each queue, or 0 for one
+        flusher per core
+        :param transient: whether to run a pool for the transient queue,
+        which only receives messages when pipeline.transient_non_durable is
+        set
+        """
         self.bulk_size = bulk_size
+        self.pools = [
+            ProcessSupervisor(
+                partial(flush_to_es, durable=True, bulk_size=bulk_size),
+                processes=processes, name='elasticsearch flusher')
+        ]
+        if transient:
+            self.pools.append(ProcessSupervisor(
+                partial(flush_to_es, durable=False, bulk_size=bulk_size),
+                processes=processes, name='elasticsearch transient flusher'))
+        self.pool_processes = list()
 
     def start(self):
         """
-        Start a process pool to handle streaming
+        Starts a process supervising each pool, and returns the processes
         """
-        concurrency = cpu_count()
-        process_list = [
-            Process(target=flush_to_es) for x in range(concurrency)]
+        self.pool_processes = [
+            Process(target=pool.run) for pool in self.pools]
+        for pool_process in self.pool_processes:
+            pool_process.start()
+        return self.pool_processes
 
-        map(lambda x: x.start(), process_list)
+    def stop(self, timeout=30.0):
+        """
+        Stops the pools, letting every flusher drain its buffer
+        """
+        for pool_process in self.pool_processes:
+            pool_process.terminate()
+        for pool_process in self.pool_processes:
+            pool_process.join(timeout)
@@ -0,0 +1,200 @@
+"""
+The supervisor module runs a pool of identical child processes. Children that
+exit while the pool is running are restarted, with a backoff for children that
+keep failing, and the pool is stopped by setting an event that every child
+watches. Each child is given a shared counter to report the work it has done,
+which the supervisor turns into per process rates.
+"""
+
+from multiprocessing import cpu_count, Event, Process, RawValue
+import signal
+import time
+
+from meniscus import env
+
+
+_LOG = env.get_logger(__name__)
+
+
+def _run_child(target, stop_event, counter):
+    """
+    Runs the target of a child process. Children stop when the stop event is
+    set, so they do not keep the supervisor's SIGTERM handler.
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    target(stop_event, counter)
+
+
+class _Slot(object):
+    """
+    Tracks one child process of the pool and the counters it shares with the
+    supervisor
+    """
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.started_at = None
+        self.restart_at = None
+        self.failures = 0
+        self.restarts = RawValue('L', 0)
+        self.pid = RawValue('L', 0)
+        self.counter = RawValue('L', 0)
+        self.last_count = 0
+        self.last_count_time = time.time()
+
+
+class ProcessSupervisor(object):
+    """
+    Runs a pool of processes that each call target(stop_event, counter). The
+    target should return once stop_event is set, and may add to
+    counter.value to report its progress.
+    """
+
+    def __init__(self, target, processes=0, name='process',
+                 restart_backoff=1.0, max_restart_backoff=60.0,
+                 check_interval=1.0, stats_interval=60.0):
+        """
+        :param target: the callable run by each child process
+        :param processes: size of the pool, or 0 for one process per core
+        :param name: name used when logging about the pool
+        :param restart_backoff: time in seconds to wait before restarting a
+        failed child, doubled for each failure in a row
+        :param max_restart_backoff: longest time to wait before a restart. A
+        child that runs for longer than this is considered healthy again.
+        :param check_interval: time in seconds between checks of the children
+        :param stats_interval: time in seconds between logging the rates of
+        the children, or 0 to disable logging
+        """
+        self.target = target
+        self.processes = processes or cpu_count()
+        self.name = name
+        self.restart_backoff = restart_backoff
+        self.max_restart_backoff = max_restart_backoff
+        self.check_interval = check_interval
+        self.stats_interval = stats_interval
+        self.stop_event = Event()
+        self.slots = [_Slot(index) for index in range(self.processes)]
+
+    def _spawn(self, slot):
+        slot.process = Process(
+            target=_run_child,
+            args=(self.target, self.stop_event, slot.counter))
+        slot.process.start()
+        slot.pid.value = slot.process.pid
+        slot.started_at = time.time()
+        slot.restart_at = None
+        _LOG.info('{0} started as process: {1}'.format(
+            self.name, slot.process.pid))
+
+    def start(self):
+        """
+        Starts every child process of the pool
+        """
+        for slot in self.slots:
+            self._spawn(slot)
+
+    def check(self):
+        """
+        Restarts children that have exited, waiting longer before each
+        restart of a child that keeps failing
+        """
+        now = time.time()
+
+        for slot in self.slots:
+            if self.stop_event.is_set():
+                return
+
+            if slot.process is None or slot.process.is_alive():
+                continue
+
+            if slot.restart_at is None:
+                if now - slot.started_at > self.max_restart_backoff:
+                    slot.failures = 0
+                delay = min(self.restart_backoff * (2 ** slot.failures),
+                            self.max_restart_backoff)
+                slot.failures += 1
+                slot.restart_at = now + delay
+                _LOG.warning(
+                    '{0} process {1} exited with code {2}, restarting in '
+                    '{3} seconds'.format(
+                        self.name, slot.process.pid,
+                        slot.process.exitcode, delay))
+
+            if now >= slot.restart_at:
+                slot.restarts.value += 1
+                self._spawn(slot)
+
+    def stats(self):
+        """
+        Returns the pid, restart count, total count and rate per second of
+        each child. Rates are measured since the previous call.
+        """
+        now = time.time()
+        stats = list()
+
+        for slot in self.slots:
+            count = slot.counter.value
+            elapsed = now - slot.last_count_time
+            rate = 0.0
+            if elapsed > 0:
+                rate = (count - slot.last_count) / elapsed
+            slot.last_count = count
+            slot.last_count_time = now
+
+            stats.append({
+                'pid': slot.pid.value,
+                'restarts': slot.restarts.value,
+                'count': count,
+                'rate': rate
+            })
+
+        return stats
+
+    def run(self):
+        """
+        Starts the pool and supervises it until stop() is called or the
+        process receives SIGTERM. This can be passed as the target of a
+        process that owns the pool.
+        """
+        signal.signal(signal.SIGTERM,
+                      lambda signum, frame: self.stop_event.set())
+
+        self.start()
+        next_stats = time.time() + self.stats_interval
+
+        while not self.stop_event.is_set():
+            self.stop_event.wait(self.check_interval)
+            self.check()
+
+            if self.stats_interval and time.time() >= next_stats:
+                next_stats = time.time() + self.stats_interval
+                rates = ', '.join(
+                    '{0}={1:.1f}/s'.format(stat['pid'], stat['rate'])
+                    for stat in self.stats())
+                _LOG.info('{0} rates: {1}'.format(self.name, rates))
+
+        self.join()
+
+    def stop(self, timeout=10.0):
+        """
+        Signals every child to stop and waits for them to exit
+        """
+        self.stop_event.set()
+        self.join(timeout)
+
+    def join(self, timeout=10.0):
+        """
+        Waits for the children to exit, terminating any that are still
+        running once the timeout has passed
+        """
+        deadline = time.time() + timeout
+
+        for slot in self.slots:
+            if slot.process is None:
+                continue
+            slot.process.join(max(deadline - time.time(), 0))
+            if slot.process.is_alive():
+                _LOG.warning('{0} process {1} did not stop, terminating'
+                             .format(self.name, slot.process.pid))
+                slot.process.terminate()
+                slot.process.join()
@@ -4,8 +4,10 @@ from mock import MagicMock
 from mock import patch
 import falcon
 import falcon.testing as testing
+from meniscus.api.http_log.resources import PublishBatchResource
 from meniscus.api.http_log.resources import PublishMessageResource
 from meniscus.api.tenant.resources import MESSAGE_TOKEN
+from meniscus.correlation.batcher import QueueUnavailableError
 from meniscus.data.model import tenant
 from meniscus.openstack.common import jsonutils
 
@@ -13,6 +15,7 @@ from meniscus.openstack.common import jsonutils
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(WhenTestingPublishMessage())
+    suite.addTest(WhenTestingPublishBatch())
     return suite
 
 
@@ -88,6 +91,149 @@ class WhenTestingPublishMessage(testing.TestBase):
 
         self.assertEquals(falcon.HTTP_202, self.srmock.status)
 
+    def test_queues_message_in_task_batch(self):
+        resource = PublishMessageResource(task_batch_size=10)
+        resource.batcher = MagicMock()
+        batched_route = '/v1/tenant/{tenant_id}/publish/batched'
+        self.api.add_route(batched_route, resource)
+
+        self.simulate_request(
+            '/v1/tenant/{0}/publish/batched'.format(self.tenant_id),
+            method='POST',
+            headers={
+                'content-type': 'application/json',
+                MESSAGE_TOKEN: self.token
+            },
+            body=jsonutils.dumps(self.message))
+
+        resource.batcher.add.assert_called_once_with(
+            [self.tenant_id, self.token, self.message['log_message']])
+        self.assertEquals(falcon.HTTP_202, self.srmock.status)
+
+    def test_batcher_needs_uwsgi_threads(self):
+        uwsgi = MagicMock(opt={})
+        with patch('meniscus.api.http_log.resources.proxy.UWSGI', True), \
+                patch('meniscus.api.http_log.resources.proxy.uwsgi', uwsgi):
+            self.assertIsNone(
+                PublishMessageResource(task_batch_size=10).batcher)
+
+            uwsgi.opt['enable-threads'] = True
+            self.assertIsNotNone(
+                PublishMessageResource(task_batch_size=10).batcher)
+
+    def test_refuses_message_when_batch_can_not_be_queued(self):
+        resource = PublishMessageResource(task_batch_size=10)
+        resource.batcher = MagicMock()
+        resource.batcher.add.side_effect = QueueUnavailableError
+        batched_route = '/v1/tenant/{tenant_id}/publish/batched'
+        self.api.add_route(batched_route, resource)
+
+        self.simulate_request(
+            '/v1/tenant/{0}/publish/batched'.format(self.tenant_id),
+            method='POST',
+            headers={
+                'content-type': 'application/json',
+                MESSAGE_TOKEN: self.token
+            },
+            body=jsonutils.dumps(self.message))
+
+        self.assertEquals(falcon.HTTP_503, self.srmock.status)
+
+
+class WhenTestingPublishBatch(testing.TestBase):
+    def before(self):
+        self.resource = PublishBatchResource()
+        self.tenant_id = '1234'
+        self.token = 'ffe7104e-8d93-47dc-a49a-8fb0d39e5192'
+        self.message = {
+            "ver": "1",
+            "msgid": "-",
+            "pri": "46",
+            "pid": "-",
+            "host": "tohru",
+            "pname": "rsyslogd",
+            "time": "2013-04-02T14:12:04.873490-05:00",
+            "msg": "start",
+            "native": {}
+        }
+        self.invalid_message = {"host": "tohru"}
+        self.test_route = '/v1/tenant/{tenant_id}/publish/batch'
+        self.api.add_route(self.test_route, self.resource)
+
+    def _post(self, body, content_type='application/json'):
+        return self.simulate_request(
+            '/v1/tenant/{0}/publish/batch'.format(self.tenant_id),
+            method='POST',
+            headers={
+                'content-type': content_type,
+                MESSAGE_TOKEN: self.token
+            },
+            body=body)
+
+    def test_returns_400_for_no_message_token_header(self):
+        self.simulate_request(
+            self.test_route,
+            method='POST',
+            headers={'content-type': 'application/json'},
+            body=jsonutils.dumps([self.message]))
+        self.assertEquals(falcon.HTTP_400, self.srmock.status)
+
+    def test_returns_415_for_unsupported_content_type(self):
+        self._post(jsonutils.dumps([self.message]), 'text/plain')
+        self.assertEquals(falcon.HTTP_415, self.srmock.status)
+
+    def test_returns_400_for_malformed_json(self):
+        self._post('[{"host": ')
+        self.assertEquals(falcon.HTTP_400, self.srmock.status)
+
+    def test_returns_400_for_non_list_body(self):
+        self._post(jsonutils.dumps(self.message))
+        self.assertEquals(falcon.HTTP_400, self.srmock.status)
+
+    def test_returns_413_for_batch_too_large(self):
+        with patch('meniscus.api.http_log.resources.MAX_BATCH_SIZE', 1):
+            self._post(jsonutils.dumps([self.message, self.message]))
+        self.assertEquals(falcon.HTTP_413, self.srmock.status)
+
+    def test_returns_202_and_queues_one_task_for_json_array(self):
+        correlate_func = MagicMock()
+        with patch('meniscus.correlation.correlator.correlate_http_messages',
+                   correlate_func):
+            body = self._post(
+                jsonutils.dumps([self.message, self.invalid_message]))
+
+        correlate_func.delay.assert_called_once_with(
+            self.tenant_id, self.token, [self.message])
+        self.assertEquals(falcon.HTTP_202, self.srmock.status)
+
+        result = jsonutils.loads(body[0])
+        self.assertEquals(result['accepted'], 1)
+        self.assertEquals(result['rejected'], 1)
+        self.assertTrue(result['results'][0]['accepted'])
+        self.assertFalse(result['results'][1]['accepted'])
+        self.assertIn('error', result['results'][1])
+
+    def test_returns_202_for_newline_delimited_json(self):
+        correlate_func = MagicMock()
+        body = '\n'.join(
+            [jsonutils.dumps(self.message), jsonutils.dumps(self.message)])
+        with patch('meniscus.correlation.correlator.correlate_http_messages',
+                   correlate_func):
+            self._post(body, 'application/x-ndjson')
+
+        correlate_func.delay.assert_called_once_with(
+            self.tenant_id, self.token, [self.message, self.message])
+        self.assertEquals(falcon.HTTP_202, self.srmock.status)
+
+    def test_returns_400_when_no_messages_are_valid(self):
+        correlate_func = MagicMock()
+        with patch('meniscus.correlation.correlator.correlate_http_messages',
+                   correlate_func):
+            self._post(jsonutils.dumps([self.invalid_message]))
+
+        self.assertFalse(correlate_func.delay.called)
+        self.assertEquals(falcon.HTTP_400, self.srmock.status)
+
 
 if __name__ == '__main__':
     unittest.main()
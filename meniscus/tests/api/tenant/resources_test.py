@@ -8,7 +8,9 @@ with patch('meniscus.api.tenant.resources.tenant_util', MagicMock()):
     from meniscus.api.tenant.resources import EventProducerResource
     from meniscus.api.tenant.resources import EventProducersResource
     from meniscus.api.tenant.resources import MESSAGE_TOKEN
+    from meniscus.api.tenant.resources import TenantChangesResource
     from meniscus.api.tenant.resources import TenantResource
+    from meniscus.api.tenant.resources import TenantValidationResource
     from meniscus.api.tenant.resources import TokenResource
     from meniscus.api.tenant.resources import UserResource
 from meniscus.data.model.tenant import EventProducer
@@ -37,6 +39,10 @@ def suite():
     test_suite.addTest(TestingTokenResourceOnGet())
     test_suite.addTest(TestingTokenResourceOnPost())
 
+    test_suite.addTest(TestingTenantValidationResourceOnGet())
+
+    test_suite.addTest(TestingTenantChangesResourceOnGet())
+
     return test_suite
 
 
@@ -1045,5 +1051,131 @@ class TestingTokenResourceValidation(TenantApiTestBase):
             self.resource._validate_token_min_time_limit_reached(self.token))
 
 
+class TestingTenantValidationResourceOnGet(TenantApiTestBase):
+
+    def _set_resource(self):
+        self.resource = TenantValidationResource()
+        self.test_route = '/v1/tenant/{tenant_id}/validation'
+        self.api.add_route(self.test_route, self.resource)
+
+    def test_return_400_for_missing_token(self):
+        with patch('meniscus.api.tenant.resources.tenant_util.find_tenant',
+                   self.tenant_found):
+            self.simulate_request(self.test_route, method='GET')
+            self.assertEqual(falcon.HTTP_400, self.srmock.status)
+
+    def test_return_404_for_tenant_not_found(self):
+        with patch('meniscus.api.tenant.resources.tenant_util.find_tenant',
+                   self.tenant_not_found):
+            self.simulate_request(
+                self.test_route,
+                method='GET',
+                headers={MESSAGE_TOKEN: self.token_original})
+            self.assertEqual(falcon.HTTP_404, self.srmock.status)
+
+    def test_return_404_for_invalid_token(self):
+        with patch('meniscus.api.tenant.resources.tenant_util.find_tenant',
+                   self.tenant_found):
+            self.simulate_request(
+                self.test_route,
+                method='GET',
+                headers={MESSAGE_TOKEN: self.token_invalid})
+            self.assertEqual(falcon.HTTP_404, self.srmock.status)
+
+    def test_should_return_200_and_tenant_json_on_get(self):
+        with patch('meniscus.api.tenant.resources.tenant_util.find_tenant',
+                   self.tenant_found):
+            body = self.simulate_request(
+                self.test_route,
+                method='GET',
+                headers={MESSAGE_TOKEN: self.token_previous})
+            self.assertEqual(falcon.HTTP_200, self.srmock.status)
+
+        parsed_body = jsonutils.loads(body[0])
+        self.assertEqual(parsed_body['tenant']['tenant_id'],
+                         self.tenant_id)
+        self.assertTrue('ETag' in self.srmock.headers_dict)
+
+    def test_should_return_304_when_etag_matches(self):
+        with patch('meniscus.api.tenant.resources.tenant_util.find_tenant',
+                   self.tenant_found):
+            self.simulate_request(
+                self.test_route,
+                method='GET',
+                headers={MESSAGE_TOKEN: self.token_original})
+            etag = self.srmock.headers_dict['ETag']
+
+            self.simulate_request(
+                self.test_route,
+                method='GET',
+                headers={MESSAGE_TOKEN: self.token_original,
+                         'If-None-Match': etag})
+            self.assertEqual(falcon.HTTP_304, self.srmock.status)
+
+    def test_should_return_200_when_etag_does_not_match(self):
+        with patch('meniscus.api.tenant.resources.tenant_util.find_tenant',
+                   self.tenant_found):
+            self.simulate_request(
+                self.test_route,
+                method='GET',
+                headers={MESSAGE_TOKEN: self.token_original,
+                         'If-None-Match': '"stale"'})
+            self.assertEqual(falcon.HTTP_200, self.srmock.status)
+
+
+class TestingTenantChangesResourceOnGet(TenantApiTestBase):
+
+    def _set_resource(self):
+        self.resource = TenantChangesResource()
+        self.test_route = '/v1/tenants'
+        self.api.add_route(self.test_route, self.resource)
+
+    def test_should_return_page_of_tenants(self):
+        self.tenant.change_seq = 12
+        retrieve_changes = MagicMock(return_value=[self.tenant])
+        with patch('meniscus.api.tenant.resources.tenant_util.'
+                   'retrieve_tenant_changes', retrieve_changes):
+            body = self.simulate_request(
+                self.test_route, method='GET', query_string='since=10')
+            self.assertEqual(falcon.HTTP_200, self.srmock.status)
+
+        retrieve_changes.assert_called_once_with(since=10, limit=100)
+        parsed_body = jsonutils.loads(body[0])
+        self.assertEqual(parsed_body['next'], 12)
+        self.assertFalse(parsed_body['more'])
+        self.assertEqual(parsed_body['tenants'][0]['tenant_id'],
+                         self.tenant_id)
+
+    def test_should_report_more_changes_for_full_page(self):
+        self.tenant.change_seq = 3
+        retrieve_changes = MagicMock(return_value=[self.tenant])
+        with patch('meniscus.api.tenant.resources.tenant_util.'
+                   'retrieve_tenant_changes', retrieve_changes):
+            body = self.simulate_request(
+                self.test_route, method='GET', query_string='limit=1')
+
+        retrieve_changes.assert_called_once_with(since=0, limit=1)
+        parsed_body = jsonutils.loads(body[0])
+        self.assertEqual(parsed_body['next'], 3)
+        self.assertTrue(parsed_body['more'])
+
+    def test_should_keep_cursor_when_no_changes(self):
+        retrieve_changes = MagicMock(return_value=[])
+        with patch('meniscus.api.tenant.resources.tenant_util.'
+                   'retrieve_tenant_changes', retrieve_changes):
+            body = self.simulate_request(
+                self.test_route, method='GET', query_string='since=8')
+
+        parsed_body = jsonutils.loads(body[0])
+        self.assertEqual(parsed_body['next'], 8)
+        self.assertEqual(parsed_body['tenants'], [])
+        self.assertFalse(parsed_body['more'])
+
+    def test_return_400_for_limit_too_large(self):
+        self.simulate_request(
+            self.test_route, method='GET', query_string='limit=100000')
+        self.assertEqual(falcon.HTTP_400, self.srmock.status)
+
+
 if __name__ == '__main__':
     unittest.main()
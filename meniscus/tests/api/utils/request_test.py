@@ -1,4 +1,7 @@
+from meniscus.api.utils import request
+from meniscus.api.utils.request import get_client
 from meniscus.api.utils.request import http_request
+from meniscus.api.utils.request import HttpClient
 from meniscus.api.utils.request import HTTP_VERBS
 
 from mock import MagicMock
@@ -15,6 +18,7 @@ import unittest
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(WhenTestingUtilsRequest())
+    suite.addTest(WhenTestingHttpClient())
     return suite
 
 
@@ -57,22 +61,83 @@ class WhenTestingUtilsRequest(unittest.TestCase):
                             falcon.HTTP_200)
 
     def test_should_cause_a_connection_exception(self):
-        with patch.object(requests, 'get') as mock_method:
+        with patch.object(requests.Session, 'request') as mock_method, \
+                patch('meniscus.api.utils.request.time.sleep'):
             with self.assertRaises(requests.ConnectionError):
                 mock_method.side_effect = requests.ConnectionError
                 http_request(self.url, json_payload=self.json_payload)
 
     def test_should_cause_a_http_exception(self):
-        with patch.object(requests, 'get') as mock_method:
+        with patch.object(requests.Session, 'request') as mock_method:
             with self.assertRaises(requests.HTTPError):
                 mock_method.side_effect = requests.HTTPError
                 http_request(self.url, json_payload=self.json_payload)
 
     def test_should_cause_a_request_exception(self):
-        with patch.object(requests, 'get') as mock_method:
+        with patch.object(requests.Session, 'request') as mock_method:
             with self.assertRaises(requests.RequestException):
                 mock_method.side_effect = requests.RequestException
                 http_request(self.url, json_payload=self.json_payload)
 
+    def test_should_reuse_client_within_a_process(self):
+        self.assertIs(get_client(), get_client())
+
+    def test_should_create_new_client_after_fork(self):
+        client = get_client()
+        with patch('meniscus.api.utils.request.os.getpid',
+                   MagicMock(return_value=-1)):
+            self.assertIsNot(get_client(), client)
+        request._client = None
+
+
+class WhenTestingHttpClient(unittest.TestCase):
+
+    def setUp(self):
+        self.url = 'http://localhost:8080/somewhere'
+        self.response = MagicMock()
+        self.client = HttpClient(pool_maxsize=2, timeout=5.0, retries=2,
+                                 retry_backoff=0.5)
+        self.sleep = MagicMock()
+
+    def test_should_use_default_timeout(self):
+        with patch.object(self.client.session, 'request',
+                          MagicMock(return_value=self.response)) as req:
+            self.client.request('GET', self.url)
+        self.assertEqual(req.call_args[1]['timeout'], 5.0)
+
+    def test_should_retry_idempotent_requests_with_backoff(self):
+        session_request = MagicMock(
+            side_effect=[requests.ConnectionError, requests.Timeout,
+                         self.response])
+        with patch.object(self.client.session, 'request', session_request), \
+                patch('meniscus.api.utils.request.time.sleep', self.sleep):
+            response = self.client.request('HEAD', self.url)
+
+        self.assertIs(response, self.response)
+        self.assertEqual(session_request.call_count, 3)
+        self.assertEqual(
+            [call[0][0] for call in self.sleep.call_args_list], [0.5, 1.0])
+
+    def test_should_not_retry_post(self):
+        session_request = MagicMock(side_effect=requests.ConnectionError)
+        with patch.object(self.client.session, 'request', session_request), \
+                patch('meniscus.api.utils.request.time.sleep', self.sleep):
+            with self.assertRaises(requests.ConnectionError):
+                self.client.request('POST', self.url)
+
+        self.assertEqual(session_request.call_count, 1)
+        self.assertFalse(self.sleep.called)
+
+    def test_should_record_stats_per_host(self):
+        session_request = MagicMock(
+            side_effect=[requests.ConnectionError, self.response])
+        with patch.object(self.client.session, 'request', session_request), \
+                patch('meniscus.api.utils.request.time.sleep', self.sleep):
+            self.client.request('GET', self.url)
+
+        stats = self.client.stats()['localhost:8080']
+        self.assertEqual(stats['requests'], 2)
+        self.assertEqual(stats['errors'], 1)
+
 if __name__ == '__main__':
     unittest.main()
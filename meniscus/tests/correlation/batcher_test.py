@@ -0,0 +1,84 @@
+import time
+import unittest
+
+from mock import MagicMock
+from mock import patch
+
+from meniscus.correlation.batcher import QueueUnavailableError
+from meniscus.correlation.batcher import TaskBatcher
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(WhenTestingTaskBatcher())
+    return suite
+
+
+class WhenTestingTaskBatcher(unittest.TestCase):
+    def setUp(self):
+        self.task = MagicMock()
+        self.batcher = TaskBatcher(self.task, batch_size=3, linger_ms=20)
+        self.addCleanup(self.batcher.flush)
+
+    def test_queues_full_batch(self):
+        for entry in range(4):
+            self.batcher.add(entry)
+
+        self.task.delay.assert_called_once_with([0, 1, 2])
+        self.assertEqual(self.batcher._entries, [3])
+
+    def test_queues_partial_batch_after_linger(self):
+        self.batcher.add('a')
+        self.assertFalse(self.task.delay.called)
+
+        time.sleep(0.1)
+        self.task.delay.assert_called_once_with(['a'])
+        self.assertIsNone(self.batcher._timer)
+
+    def test_flush_queues_pending_entries(self):
+        self.batcher.add('a')
+        self.batcher.flush()
+        self.task.delay.assert_called_once_with(['a'])
+
+        self.batcher.flush()
+        self.assertEqual(self.task.delay.call_count, 1)
+
+    def test_failed_batch_is_kept_and_new_entries_refused(self):
+        self.task.delay.side_effect = Exception
+        for entry in range(3):
+            self.batcher.add(entry)
+        self.assertEqual(self.batcher._entries, [0, 1, 2])
+
+        with self.assertRaises(QueueUnavailableError):
+            self.batcher.add(3)
+        self.assertEqual(self.batcher._entries, [0, 1, 2])
+
+        self.task.delay.side_effect = None
+        self.batcher.flush()
+        self.task.delay.assert_called_with([0, 1, 2])
+
+        self.batcher.add(3)
+        self.assertEqual(self.batcher._entries, [3])
+
+    def test_failed_batch_is_queued_again_after_linger(self):
+        self.task.delay.side_effect = [Exception, None]
+        for entry in range(3):
+            self.batcher.add(entry)
+
+        time.sleep(0.1)
+        self.assertEqual(self.task.delay.call_count, 2)
+        self.task.delay.assert_called_with([0, 1, 2])
+        self.assertEqual(self.batcher._entries, [])
+
+    def test_forked_process_starts_empty_batch(self):
+        self.batcher.add('a')
+        with patch('meniscus.correlation.batcher.os.getpid',
+                   MagicMock(return_value=-1)):
+            self.batcher.add('b')
+            self.assertEqual(self.batcher._entries, ['b'])
+            self.batcher.flush()
+        self.task.delay.assert_called_once_with(['b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
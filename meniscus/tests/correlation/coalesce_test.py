@@ -0,0 +1,168 @@
+import multiprocessing
+import time
+import unittest
+
+from mock import MagicMock
+
+from meniscus.correlation import coalesce
+from meniscus.data import cache_handler
+from meniscus import proxy
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(WhenTestingSingleFlight())
+    suite.addTest(WhenTestingSharedSingleFlight())
+    suite.addTest(WhenCoalescingAcrossProcesses())
+    return suite
+
+
+class WhenTestingSingleFlight(unittest.TestCase):
+
+    def setUp(self):
+        self.single_flight = coalesce.SingleFlight()
+        self.lookup = MagicMock(return_value='tenant')
+
+    def _in_flight_call(self, result=None, error=None):
+        call = coalesce._Call()
+        call.result = result
+        call.error = error
+        call.done.set()
+        self.single_flight._calls['key'] = call
+        return call
+
+    def test_returns_result_of_call(self):
+        self.assertEqual(
+            self.single_flight.do('key', self.lookup, 'tenant_id'), 'tenant')
+        self.lookup.assert_called_once_with('tenant_id')
+
+    def test_caller_shares_result_of_call_in_flight(self):
+        self._in_flight_call(result='in flight tenant')
+
+        self.assertEqual(
+            self.single_flight.do('key', self.lookup), 'in flight tenant')
+        self.assertFalse(self.lookup.called)
+
+    def test_caller_shares_error_of_call_in_flight(self):
+        self._in_flight_call(error=ValueError('lookup failed'))
+
+        with self.assertRaises(ValueError):
+            self.single_flight.do('key', self.lookup)
+        self.assertFalse(self.lookup.called)
+
+    def test_calls_for_different_keys_are_not_coalesced(self):
+        self._in_flight_call(result='in flight tenant')
+
+        self.assertEqual(
+            self.single_flight.do('other_key', self.lookup), 'tenant')
+        self.lookup.assert_called_once_with()
+
+    def test_key_is_released_after_call(self):
+        self.single_flight.do('key', self.lookup)
+        self.assertEqual(self.single_flight._calls, dict())
+
+    def test_key_is_released_after_error(self):
+        self.lookup.side_effect = ValueError('lookup failed')
+        with self.assertRaises(ValueError):
+            self.single_flight.do('key', self.lookup)
+        self.assertEqual(self.single_flight._calls, dict())
+
+
+class WhenTestingSharedSingleFlight(unittest.TestCase):
+
+    def setUp(self):
+        self.markers = MagicMock(expires=10)
+        self.cached = MagicMock(return_value=None)
+        self.single_flight = coalesce.SingleFlight(
+            self.markers, self.cached, poll_seconds=0)
+        self.lookup = MagicMock(return_value='tenant')
+
+    def test_holder_of_marker_makes_call(self):
+        self.markers.acquire.return_value = True
+        self.assertEqual(self.single_flight.do('key', self.lookup), 'tenant')
+        self.lookup.assert_called_once_with()
+        self.markers.release.assert_called_once_with('key')
+        self.assertFalse(self.cached.called)
+
+    def test_marker_is_released_after_error(self):
+        self.markers.acquire.return_value = True
+        self.lookup.side_effect = ValueError('lookup failed')
+        with self.assertRaises(ValueError):
+            self.single_flight.do('key', self.lookup)
+        self.markers.release.assert_called_once_with('key')
+
+    def test_waits_for_result_cached_by_holder(self):
+        self.markers.acquire.return_value = False
+        self.cached.side_effect = [None, 'cached tenant']
+        self.assertEqual(
+            self.single_flight.do('key', self.lookup), 'cached tenant')
+        self.assertFalse(self.lookup.called)
+        self.assertFalse(self.markers.release.called)
+
+    def test_reads_result_cached_before_marker_was_released(self):
+        self.markers.acquire.side_effect = [False, True]
+        self.cached.side_effect = [None, 'cached tenant']
+        self.assertEqual(
+            self.single_flight.do('key', self.lookup), 'cached tenant')
+        self.assertFalse(self.lookup.called)
+        self.markers.release.assert_called_once_with('key')
+
+    def test_makes_call_when_holder_caches_nothing(self):
+        self.markers.acquire.side_effect = [False, True]
+        self.assertEqual(self.single_flight.do('key', self.lookup), 'tenant')
+        self.lookup.assert_called_once_with()
+
+    def test_makes_call_once_wait_expires(self):
+        self.markers.expires = 0
+        self.markers.acquire.return_value = False
+        self.assertEqual(self.single_flight.do('key', self.lookup), 'tenant')
+        self.lookup.assert_called_once_with()
+        self.assertFalse(self.markers.release.called)
+
+
+class WhenCoalescingAcrossProcesses(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = proxy._CacheManager()
+        self.manager.start()
+        self.server = proxy.SharedMemoryCache(self.manager.CacheStore())
+        self.calls = multiprocessing.Value('i', 0)
+        self.results = multiprocessing.Queue()
+
+    def tearDown(self):
+        self.manager.shutdown()
+
+    def _cached(self, key):
+        return self.server.cache_get(key, 'cache-tenant')
+
+    def _lookup(self, key):
+        with self.calls.get_lock():
+            self.calls.value += 1
+        time.sleep(0.5)
+        self.server.cache_update(key, 'tenant', 0, 'cache-tenant')
+        return 'tenant'
+
+    def _run(self, single_flight):
+        self.results.put(single_flight.do('101', self._lookup, '101'))
+
+    def test_processes_share_one_call(self):
+        markers = cache_handler.InFlightCache()
+        markers.cache.server = self.server
+        single_flight = coalesce.SingleFlight(
+            markers, self._cached, poll_seconds=0.01)
+
+        processes = [
+            multiprocessing.Process(target=self._run, args=(single_flight,))
+            for _ in range(2)]
+        for process in processes:
+            process.start()
+        results = [self.results.get(timeout=10) for _ in processes]
+        for process in processes:
+            process.join()
+
+        self.assertEqual(results, ['tenant', 'tenant'])
+        self.assertEqual(self.calls.value, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
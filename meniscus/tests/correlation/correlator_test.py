@@ -8,6 +8,7 @@ from meniscus.correlation import correlator
 
 from meniscus.correlation import errors
 from meniscus.data.model.tenant import EventProducer
+from meniscus.data.model.tenant import load_tenant_from_dict
 from meniscus.data.model.tenant import Tenant
 from meniscus.data.model.tenant import Token
 from meniscus.data.model.worker import WorkerConfiguration
@@ -21,6 +22,9 @@ def suite():
 
 class WhenTestingCorrelationPipeline(unittest.TestCase):
     def setUp(self):
+        correlator._negative_cache.clear()
+        correlator._correlation_templates.clear()
+        correlator.cache_handler._local_tenants.clear()
         self.tenant_id = '5164b8f4-16fb-4376-9d29-8a6cbaa02fa9'
         self.message_token = 'ffe7104e-8d93-47dc-a49a-8fb0d39e5192'
         self.producers = [
@@ -120,6 +124,169 @@ class WhenTestingCorrelationPipeline(unittest.TestCase):
                                                   self.message_token,
                                                   self.src_msg)
 
+    def test_correlate_http_messages_validates_token_once(self):
+        get_tenant_func = MagicMock(return_value=self.tenant)
+        add_correlation_func = MagicMock()
+
+        with patch.object(correlator, '_get_validated_tenant',
+                          get_tenant_func), \
+                patch.object(correlator, '_add_correlation_info_to_message',
+                             add_correlation_func):
+            correlator.correlate_http_messages(
+                self.tenant_id, self.message_token,
+                [self.cee_msg, self.cee_msg])
+
+        get_tenant_func.assert_called_once_with(
+            self.tenant_id, self.message_token)
+        self.assertEqual(add_correlation_func.call_count, 2)
+
+    def test_correlate_http_messages_retries_on_communication_error(self):
+        get_tenant_func = MagicMock(
+            side_effect=errors.CoordinatorCommunicationError)
+        retry_func = MagicMock(
+            side_effect=errors.CoordinatorCommunicationError)
+
+        with patch.object(correlator, '_get_validated_tenant',
+                          get_tenant_func), \
+                patch.object(correlator.correlate_http_messages, 'retry',
+                             retry_func):
+            with self.assertRaises(errors.CoordinatorCommunicationError):
+                correlator.correlate_http_messages(
+                    self.tenant_id, self.message_token, [self.cee_msg])
+
+        retry_func.assert_called_once_with(
+            args=[self.tenant_id, self.message_token, [self.cee_msg]])
+
+    def test_correlate_http_messages_drops_invalid_messages(self):
+        get_tenant_func = MagicMock(
+            side_effect=errors.MessageAuthenticationError)
+        add_correlation_func = MagicMock()
+        retry_func = MagicMock()
+
+        with patch.object(correlator, '_get_validated_tenant',
+                          get_tenant_func), \
+                patch.object(correlator, '_add_correlation_info_to_message',
+                             add_correlation_func), \
+                patch.object(correlator.correlate_http_messages, 'retry',
+                             retry_func):
+            correlator.correlate_http_messages(
+                self.tenant_id, self.message_token,
+                [self.cee_msg, self.cee_msg])
+
+        self.assertEqual(get_tenant_func.call_count, 1)
+        self.assertFalse(add_correlation_func.called)
+        self.assertFalse(retry_func.called)
+
+    def test_correlate_http_message_entries_retries_failed_subset(self):
+        failed_entry = ['other_tenant', self.message_token, self.cee_msg]
+        get_tenant_func = MagicMock(
+            side_effect=[self.tenant, errors.CoordinatorCommunicationError])
+        add_correlation_func = MagicMock()
+        retry_func = MagicMock(
+            side_effect=errors.CoordinatorCommunicationError)
+        entries = [
+            [self.tenant_id, self.message_token, self.cee_msg],
+            failed_entry,
+            [self.tenant_id, self.message_token, self.cee_msg]]
+
+        with patch.object(correlator, '_get_validated_tenant',
+                          get_tenant_func), \
+                patch.object(correlator, '_add_correlation_info_to_message',
+                             add_correlation_func), \
+                patch.object(correlator.correlate_http_message_entries,
+                             'retry', retry_func):
+            with self.assertRaises(errors.CoordinatorCommunicationError):
+                correlator.correlate_http_message_entries(entries)
+
+        self.assertEqual(get_tenant_func.call_count, 2)
+        self.assertEqual(add_correlation_func.call_count, 2)
+        retry_func.assert_called_once_with(args=[[failed_entry]])
+
+    def test_correlate_batch_error_drops_only_its_message(self):
+        add_correlation_func = MagicMock(
+            side_effect=[None, KeyError('pname'), None])
+        entries = [
+            [self.tenant_id, self.message_token, self.cee_msg],
+            [self.tenant_id, self.message_token, {}],
+            ['malformed'],
+            [self.tenant_id, self.message_token, self.cee_msg]]
+
+        with patch.object(correlator, '_get_validated_tenant',
+                          MagicMock(return_value=self.tenant)), \
+                patch.object(correlator, '_add_correlation_info_to_message',
+                             add_correlation_func):
+            correlator.correlate_http_message_entries(entries)
+
+        self.assertEqual(add_correlation_func.call_count, 3)
+
+    def test_correlate_batch_unexpected_tenant_error_drops_group(self):
+        add_correlation_func = MagicMock()
+        entries = [
+            ['broken_tenant', self.message_token, self.cee_msg],
+            [self.tenant_id, self.message_token, self.cee_msg]]
+
+        with patch.object(correlator, '_get_validated_tenant',
+                          MagicMock(side_effect=[ValueError, self.tenant])), \
+                patch.object(correlator, '_add_correlation_info_to_message',
+                             add_correlation_func):
+            correlator.correlate_http_message_entries(entries)
+
+        add_correlation_func.assert_called_once_with(
+            self.tenant, self.cee_msg)
+
+    def test_correlate_syslog_messages_retries_failed_subset(self):
+        failed_message = {
+            '_SDATA': {'meniscus': {'tenant': 'other_tenant',
+                                    'token': self.message_token}}}
+        get_tenant_func = MagicMock(
+            side_effect=[errors.CoordinatorCommunicationError, self.tenant])
+        add_correlation_func = MagicMock()
+        retry_func = MagicMock(
+            side_effect=errors.CoordinatorCommunicationError)
+
+        with patch.object(correlator, '_get_validated_tenant',
+                          get_tenant_func), \
+                patch.object(correlator, '_add_correlation_info_to_message',
+                             add_correlation_func), \
+                patch.object(correlator.correlate_syslog_messages, 'retry',
+                             retry_func):
+            with self.assertRaises(errors.CoordinatorCommunicationError):
+                correlator.correlate_syslog_messages(
+                    [failed_message, {}, self.src_msg, self.src_msg])
+
+        self.assertEqual(get_tenant_func.call_count, 2)
+        add_correlation_func.assert_called_with(self.tenant, self.cee_msg)
+        self.assertEqual(add_correlation_func.call_count, 2)
+        retry_func.assert_called_once_with(args=[[failed_message]])
+
+    def test_get_validated_tenant_from_cache(self):
+        with patch.object(correlator.cache_handler.TokenCache, 'get_token',
+                          self.get_token), \
+                patch.object(correlator.cache_handler.TenantCache,
+                             'get_tenant', self.get_tenant):
+            tenant = correlator._get_validated_tenant(
+                self.tenant_id, self.message_token)
+        self.assertEqual(tenant, self.tenant)
+
+    def test_get_validated_tenant_rejects_invalid_token(self):
+        with patch.object(correlator.cache_handler.TokenCache, 'get_token',
+                          self.get_token):
+            with self.assertRaises(errors.MessageAuthenticationError):
+                correlator._get_validated_tenant(
+                    self.tenant_id, self.invalid_message_token)
+
+    def test_get_validated_tenant_from_coordinator(self):
+        request_func = MagicMock(return_value=self.tenant)
+        with patch.object(correlator.cache_handler.TokenCache, 'get_token',
+                          self.get_none), \
+                patch.object(correlator, '_request_validated_tenant',
+                             request_func):
+            tenant = correlator._get_validated_tenant(
+                self.tenant_id, self.message_token)
+        self.assertEqual(tenant, self.tenant)
+        request_func.assert_called_once_with(
+            self.tenant_id, self.message_token)
+
     def test_format_message_cee_message_failure_empty_string(self):
         with self.assertRaises(errors.MessageValidationError):
             correlator.correlate_syslog_message({})
@@ -154,17 +321,17 @@ class WhenTestingCorrelationPipeline(unittest.TestCase):
             get_tenant_from_cache_func.assert_called_once_with(
                 self.tenant_id, self.message_token, self.src_msg)
 
-    def test_validate_token_from_cache_calls_validate_token_coordinator(self):
-        validate_token_from_coordinator_func = MagicMock()
+    def test_validate_token_from_cache_calls_get_tenant_coordinator(self):
+        get_tenant_from_coordinator_func = MagicMock()
         with patch.object(correlator.cache_handler.TokenCache, 'get_token',
                           self.get_none), \
                 patch('meniscus.correlation.correlator.'
-                      '_validate_token_with_coordinator',
-                      validate_token_from_coordinator_func):
+                      '_get_tenant_from_coordinator',
+                      get_tenant_from_coordinator_func):
 
             correlator._validate_token_from_cache(
                 self.tenant_id, self.message_token, self.src_msg)
-            validate_token_from_coordinator_func.assert_called_once_with(
+            get_tenant_from_coordinator_func.assert_called_once_with(
                 self.tenant_id, self.message_token, self.src_msg)
 
     # Tests for _get_tenant_from_cache
@@ -196,20 +363,22 @@ class WhenTestingCorrelationPipeline(unittest.TestCase):
             add_correlation_info_to_message_func.assert_called_once_with(
                 self.tenant, self.src_msg)
 
-    # Tests for _validate_token_with_coordinator
-    def test_validate_token_with_coordinator_throws_communication_error(self):
-        http_request = MagicMock(side_effect=requests.RequestException)
+    # Tests for _get_tenant_from_coordinator
+    def test_get_tenant_from_coordinator_throws_communication_error(self):
+        http_request = MagicMock(
+            side_effect=requests.RequestException)
 
         with patch.object(correlator, '_get_config_from_cache',
-                          self.get_config),\
-            patch('meniscus.correlation.correlator.http_request',
-                  http_request):
+                          self.get_config), \
+                patch('meniscus.correlation.correlator.http_request',
+                      http_request):
 
             with self.assertRaises(errors.CoordinatorCommunicationError):
-                correlator._validate_token_with_coordinator(
-                    self.tenant_id, self.message_token, self.src_msg)
+                correlator._get_tenant_from_coordinator(self.tenant_id,
+                                                        self.message_token,
+                                                        self.src_msg)
 
-    def test_validate_token_with_coordinator_throws_auth_error(self):
+    def test_get_tenant_from_coordinator_throws_auth_error(self):
         response = MagicMock()
         response.status_code = httplib.NOT_FOUND
         http_request = MagicMock(return_value=response)
@@ -220,45 +389,30 @@ class WhenTestingCorrelationPipeline(unittest.TestCase):
                       http_request):
 
             with self.assertRaises(errors.MessageAuthenticationError):
-                correlator._validate_token_with_coordinator(
+                correlator._get_tenant_from_coordinator(
                     self.tenant_id, self.invalid_message_token, self.src_msg)
 
-    def test_validate_token_with_coordinator_calls_get_tenant(self):
+    def test_get_tenant_from_coordinator_caches_rejected_token(self):
         response = MagicMock()
-        response.status_code = httplib.OK
+        response.status_code = httplib.NOT_FOUND
         http_request = MagicMock(return_value=response)
-        get_tenant_from_coordinator_func = MagicMock()
-        with patch.object(correlator, '_get_config_from_cache',
-                          self.get_config), \
-            patch('meniscus.correlation.correlator.http_request',
-                  http_request),\
-            patch('meniscus.correlation.correlator.'
-                  '_get_tenant_from_coordinator',
-                  get_tenant_from_coordinator_func):
-            correlator._validate_token_with_coordinator(self.tenant_id,
-                                                        self.message_token,
-                                                        self.src_msg)
-        get_tenant_from_coordinator_func.assert_called_once_with(
-            self.tenant_id, self.message_token, self.src_msg)
-
-    # Tests for _get_tenant_from_coordinator
-    def test_get_tenant_from_coordinator_throws_communication_error(self):
-        http_request = MagicMock(
-            side_effect=requests.RequestException)
 
         with patch.object(correlator, '_get_config_from_cache',
                           self.get_config), \
                 patch('meniscus.correlation.correlator.http_request',
                       http_request):
 
-            with self.assertRaises(errors.CoordinatorCommunicationError):
-                correlator._get_tenant_from_coordinator(self.tenant_id,
-                                                        self.message_token,
-                                                        self.src_msg)
+            for attempt in range(2):
+                with self.assertRaises(errors.MessageAuthenticationError):
+                    correlator._get_tenant_from_coordinator(
+                        self.tenant_id, self.invalid_message_token,
+                        self.src_msg)
 
-    def test_get_tenant_from_coordinator_throws_auth_error(self):
+        self.assertEqual(http_request.call_count, 1)
+
+    def test_get_tenant_from_coordinator_does_not_cache_errors(self):
         response = MagicMock()
-        response.status_code = httplib.NOT_FOUND
+        response.status_code = httplib.INTERNAL_SERVER_ERROR
         http_request = MagicMock(return_value=response)
 
         with patch.object(correlator, '_get_config_from_cache',
@@ -266,11 +420,14 @@ class WhenTestingCorrelationPipeline(unittest.TestCase):
                 patch('meniscus.correlation.correlator.http_request',
                       http_request):
 
-            with self.assertRaises(errors.ResourceNotFoundError):
-                correlator._get_tenant_from_coordinator(
-                    self.tenant_id, self.invalid_message_token, self.src_msg)
+            for attempt in range(2):
+                with self.assertRaises(errors.CoordinatorCommunicationError):
+                    correlator._get_tenant_from_coordinator(
+                        self.tenant_id, self.message_token, self.src_msg)
+
+        self.assertEqual(http_request.call_count, 2)
 
-    def test_get_tenant_from_coordinator_throws_resource_not_found_error(self):
+    def test_get_tenant_from_coordinator_bad_request_communication_error(self):
         response = MagicMock()
         response.status_code = httplib.BAD_REQUEST
         http_request = MagicMock(return_value=response)
@@ -302,11 +459,46 @@ class WhenTestingCorrelationPipeline(unittest.TestCase):
             correlator._get_tenant_from_coordinator(self.tenant_id,
                                                     self.message_token,
                                                     self.src_msg)
+        self.assertEqual(
+            http_request.call_args[0][0],
+            'http://192.168.1.2/v1/tenant/{0}/validation'.format(
+                self.tenant_id))
+        self.assertFalse('If-None-Match' in http_request.call_args[0][1])
+        add_correlation_info_to_message_func.assert_called_once_with(
+            self.tenant, self.src_msg)
+
+    def test_get_tenant_from_coordinator_revalidates_stale_tenant(self):
+        response = MagicMock()
+        response.status_code = httplib.NOT_MODIFIED
+        http_request = MagicMock(return_value=response)
+        add_correlation_info_to_message_func = MagicMock()
+        save_tenant_to_cache_func = MagicMock()
+        with patch.object(correlator, '_get_config_from_cache',
+                          self.get_config), \
+                patch.object(correlator.cache_handler.TenantCache,
+                             'get_stale_tenant', self.get_tenant), \
+                patch('meniscus.correlation.correlator.http_request',
+                      http_request), \
+                patch('meniscus.correlation.correlator.'
+                      '_save_tenant_to_cache',
+                      save_tenant_to_cache_func), \
+                patch('meniscus.correlation.correlator.'
+                      '_add_correlation_info_to_message',
+                      add_correlation_info_to_message_func):
+            correlator._get_tenant_from_coordinator(self.tenant_id,
+                                                    self.message_token,
+                                                    self.src_msg)
+        etag = correlator.tenant_util.generate_etag(self.tenant)
+        self.assertEqual(http_request.call_args[0][1]['If-None-Match'],
+                         '"{0}"'.format(etag))
+        save_tenant_to_cache_func.assert_called_once_with(
+            self.tenant_id, self.tenant)
         add_correlation_info_to_message_func.assert_called_once_with(
             self.tenant, self.src_msg)
 
     #Tests for _add_correlation_info_to_message
     def test_add_correlation_info_to_message(self):
+        self.cee_msg['pname'] = 'producer1'
         route_message_func = MagicMock()
         with patch('meniscus.correlation.correlator.sinks.route_message',
                    route_message_func):
@@ -314,5 +506,130 @@ class WhenTestingCorrelationPipeline(unittest.TestCase):
                 self.tenant, self.cee_msg)
         route_message_func.assert_called_once_with(self.cee_msg)
 
+    def test_non_durable_messages_are_normalized_in_process(self):
+        self.cee_msg['pname'] = 'producer2'
+        normalize_func = MagicMock()
+        route_message_func = MagicMock()
+        with patch.object(correlator, 'TRANSIENT_NON_DURABLE', True), \
+                patch('meniscus.correlation.correlator.normalizer.'
+                      'should_normalize', MagicMock(return_value=True)), \
+                patch('meniscus.correlation.correlator.normalizer.normalize',
+                      normalize_func), \
+                patch('meniscus.correlation.correlator.sinks.route_message',
+                      route_message_func):
+            correlator._add_correlation_info_to_message(
+                self.tenant, self.cee_msg)
+
+        normalize_func.assert_called_once_with(self.cee_msg)
+        route_message_func.assert_called_once_with(self.cee_msg)
+
+    def test_non_durable_messages_are_queued_by_default(self):
+        self.cee_msg['pname'] = 'producer2'
+        normalize_func = MagicMock()
+        with patch('meniscus.correlation.correlator.normalizer.'
+                   'should_normalize', MagicMock(return_value=True)), \
+                patch('meniscus.correlation.correlator.normalizer.'
+                      'normalize_message', normalize_func):
+            correlator._add_correlation_info_to_message(
+                self.tenant, self.cee_msg)
+        normalize_func.delay.assert_called_once_with(self.cee_msg)
+
+    def test_add_correlation_info_queues_normalization(self):
+        self.cee_msg['pname'] = 'producer1'
+        normalize_func = MagicMock()
+        route_message_func = MagicMock()
+        with patch('meniscus.correlation.correlator.normalizer.'
+                   'should_normalize', MagicMock(return_value=True)), \
+                patch('meniscus.correlation.correlator.normalizer.'
+                      'normalize_message', normalize_func), \
+                patch('meniscus.correlation.correlator.sinks.route_message',
+                      route_message_func):
+            correlator._add_correlation_info_to_message(
+                self.tenant, self.cee_msg)
+
+        normalize_func.delay.assert_called_once_with(self.cee_msg)
+        self.assertFalse(route_message_func.called)
+
+    def test_fused_execution_normalizes_in_process(self):
+        normalize_func = MagicMock()
+        route_message_func = MagicMock()
+        with patch.object(correlator, 'FUSED_EXECUTION', True), \
+                patch('meniscus.correlation.correlator.normalizer.'
+                      'should_normalize', MagicMock(return_value=True)), \
+                patch('meniscus.correlation.correlator.normalizer.normalize',
+                      normalize_func), \
+                patch('meniscus.correlation.correlator.sinks.route_message',
+                      route_message_func):
+            correlator._add_correlation_info_to_message(
+                self.tenant, self.cee_msg)
+
+        normalize_func.assert_called_once_with(self.cee_msg)
+        route_message_func.assert_called_once_with(self.cee_msg)
+
+    def test_add_correlation_info_uses_producer_template(self):
+        self.cee_msg['pname'] = 'producer1'
+        with patch('meniscus.correlation.correlator.sinks.route_message',
+                   MagicMock()):
+            correlator._add_correlation_info_to_message(
+                self.tenant, self.cee_msg)
+
+        correlation = self.cee_msg['meniscus']['correlation']
+        self.assertEqual(correlation['ep_id'], 432)
+        self.assertTrue(correlation['durable'])
+        self.assertIsInstance(correlation['@timestamp'], basestring)
+        template = correlator._get_correlation_template(
+            self.tenant, 'producer1')
+        self.assertFalse('@timestamp' in template)
+        self.assertEqual(template['ep_id'], 432)
+
+    def test_correlation_template_is_compiled_once(self):
+        template = correlator._get_correlation_template(
+            self.tenant, 'producer2')
+        self.assertIs(
+            correlator._get_correlation_template(self.tenant, 'producer2'),
+            template)
+        self.assertFalse(template['durable'])
+
+    def test_tenant_changed_by_feed_is_compiled_again(self):
+        self.tenant.change_seq = 5
+        template = correlator._get_correlation_template(
+            self.tenant, 'producer2')
+
+        #the worker receives the changed tenant from the change feed
+        tenant_dict = self.tenant.format()
+        tenant_dict['change_seq'] = 6
+        tenant_dict['event_producers'][1]['durable'] = True
+        changed_tenant = load_tenant_from_dict(tenant_dict)
+
+        changed_template = correlator._get_correlation_template(
+            changed_tenant, 'producer2')
+        self.assertTrue(changed_template['durable'])
+        self.assertFalse(template['durable'])
+        self.assertIs(
+            correlator._get_correlation_template(self.tenant, 'producer2'),
+            template)
+
+    def test_tenant_without_change_seq_is_compiled_again(self):
+        template = correlator._get_correlation_template(
+            self.tenant, 'producer2')
+
+        tenant_dict = self.tenant.format()
+        tenant_dict['event_producers'][1]['durable'] = True
+        changed_tenant = load_tenant_from_dict(tenant_dict)
+
+        self.assertIsNone(changed_tenant.change_seq)
+        self.assertTrue(correlator._get_correlation_template(
+            changed_tenant, 'producer2')['durable'])
+        self.assertFalse(template['durable'])
+
+    def test_unknown_producers_share_default_template(self):
+        template = correlator._get_correlation_template(
+            self.tenant, 'unknown1')
+        self.assertEqual(template['pattern'], 'default')
+        self.assertIsNone(template['ep_id'])
+        self.assertIs(
+            correlator._get_correlation_template(self.tenant, 'unknown2'),
+            template)
+
 if __name__ == '__main__':
     unittest.main()
@@ -71,7 +71,8 @@ class WhenTestingCorrelationInputServer(unittest.TestCase):
             }
         }
         zmq_receiver = MagicMock()
-        zmq_receiver.get.return_value = json.dumps(self.src_msg)
+        zmq_receiver.codec = receiver.transport.JsonCodec()
+        zmq_receiver.get.return_value = [json.dumps(self.src_msg)]
         self.server = receiver.CorrelationInputServer(zmq_receiver)
 
     def test_process_msg(self):
@@ -81,9 +82,32 @@ class WhenTestingCorrelationInputServer(unittest.TestCase):
             self.server.process_msg()
             correlate_func.assert_called_once()
 
+    def test_process_batch(self):
+        frame = MagicMock()
+        frame.bytes = json.dumps(self.src_msg)
+        self.server.zmq_receiver.get_batch.return_value = [[frame], [frame]]
+        correlate_func = MagicMock()
+        with patch('meniscus.correlation.correlator.'
+                   'correlate_syslog_messages', correlate_func):
+            self.server.process_batch()
+        correlate_func.delay.assert_called_once_with(
+            [self.src_msg, self.src_msg])
+
     def test_new_correlation_input_server(self):
         server = receiver.new_correlation_input_server()
         self.assertIsInstance(server, receiver.CorrelationInputServer)
+        self.assertEqual(server.batch_size, receiver.transport.BATCH_SIZE)
+
+    def test_run_correlation_input_server(self):
+        stop_event = MagicMock()
+        counter = MagicMock()
+        server = MagicMock()
+        new_server = MagicMock(return_value=server)
+        with patch('meniscus.correlation.receiver.'
+                   'new_correlation_input_server', new_server):
+            receiver.run_correlation_input_server(stop_event, counter)
+        new_server.assert_called_once_with(stop_event, counter)
+        server.start.assert_called_once_with()
 
 
 if __name__ == '__main__':
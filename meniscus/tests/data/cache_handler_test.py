@@ -3,13 +3,22 @@ import unittest
 from mock import MagicMock
 from mock import patch
 
+from meniscus.data import cache_handler
+
 from meniscus.data.cache_handler import Cache
 from meniscus.data.cache_handler import CACHE_CONFIG
+from meniscus.data.cache_handler import CACHE_INFLIGHT
 from meniscus.data.cache_handler import CACHE_TENANT
 from meniscus.data.cache_handler import CACHE_TOKEN
 from meniscus.data.cache_handler import ConfigCache
 from meniscus.data.cache_handler import CONFIG_EXPIRES
+from meniscus.data.cache_handler import CONFIG_GENERATION_KEY
+from meniscus.data.cache_handler import ConfigSnapshot
 from meniscus.data.cache_handler import DEFAULT_EXPIRES
+from meniscus.data.cache_handler import InFlightCache
+from meniscus.data.cache_handler import LocalCache
+from meniscus.data.cache_handler import LocalCacheGeneration
+from meniscus.data.cache_handler import TENANT_CHANGES_CURSOR_KEY
 from meniscus.data.cache_handler import TenantCache
 from meniscus.data.cache_handler import TokenCache
 from meniscus.data.cache_handler import NativeProxy
@@ -17,13 +26,19 @@ from meniscus.data.model.tenant import Tenant
 from meniscus.data.model.tenant import Token
 from meniscus.data.model.worker import WorkerConfiguration
 from meniscus.openstack.common import jsonutils
+from meniscus import proxy
 
 
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(WhenTestingBaseCache())
+    suite.addTest(WhenTestingLocalCache())
     suite.addTest(WhenTestingConfigCache())
+    suite.addTest(WhenTestingConfigSnapshot())
+    suite.addTest(WhenTestingInFlightCache())
+    suite.addTest(WhenTestingLocalCacheGeneration())
     suite.addTest(WhenTestingTenantCache())
+    suite.addTest(WhenTestingTokenCache())
     return suite
 
 
@@ -34,14 +49,61 @@ class WhenTestingBaseCache(unittest.TestCase):
             cache.clear()
 
 
+class WhenTestingLocalCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = LocalCache(max_size=2, expires=60)
+
+    def test_get_returns_none_and_counts_miss(self):
+        self.assertIsNone(self.cache.get('missing'))
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_get_returns_value_and_counts_hit(self):
+        self.cache.set('key', 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_expired_entries_are_not_returned(self):
+        self.cache.set('key', 'value', expires=-1)
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_get_stale_returns_expired_entries(self):
+        self.cache.set('key', 'value', expires=-1)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(self.cache.get_stale('key'), 'value')
+        self.assertIsNone(self.cache.get_stale('missing'))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set('first', 1)
+        self.cache.set('second', 2)
+        self.cache.get('first')
+        self.cache.set('third', 3)
+
+        self.assertEqual(self.cache.get('first'), 1)
+        self.assertIsNone(self.cache.get('second'))
+        self.assertEqual(self.cache.get('third'), 3)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        self.assertEqual(self.cache.stats()['size'], 2)
+
+    def test_delete_and_clear(self):
+        self.cache.set('first', 1)
+        self.cache.set('second', 2)
+        self.cache.delete('first')
+        self.assertIsNone(self.cache.get('first'))
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('second'))
+
+    def test_zero_size_cache_stores_nothing(self):
+        cache = LocalCache(max_size=0)
+        cache.set('key', 'value')
+        self.assertIsNone(cache.get('key'))
+
+
 class WhenTestingConfigCache(unittest.TestCase):
     def setUp(self):
         self.cache_clear = MagicMock()
-        self.cache_true = MagicMock(return_value=True)
-        self.cache_false = MagicMock(return_value=False)
-        self.cache_update = MagicMock()
-        self.cache_set = MagicMock()
+        self.cache_upsert = MagicMock()
         self.cache_del = MagicMock()
+        self.cache_get_none = MagicMock(return_value=None)
         self.config = WorkerConfiguration(
             personality='worker',
             hostname='worker01',
@@ -55,32 +117,29 @@ class WhenTestingConfigCache(unittest.TestCase):
             config_cache.clear()
         self.cache_clear.assert_called_once_with(CACHE_CONFIG)
 
-    def test_set_config_calls_cache_update(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_true
-        ), patch.object(NativeProxy, 'cache_update', self.cache_update):
+    def test_set_config_calls_cache_upsert(self):
+        with patch.object(NativeProxy, 'cache_upsert', self.cache_upsert):
             config_cache = ConfigCache()
             config_cache.set_config(self.config)
 
-        self.cache_update.assert_called_once_with(
+        self.cache_upsert.assert_any_call(
             'worker_configuration', jsonutils.dumps(self.config.format()),
             CONFIG_EXPIRES, CACHE_CONFIG)
 
-    def test_set_config_calls_cache_set(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_false
-        ), patch.object(NativeProxy, 'cache_set', self.cache_set):
+    def test_set_config_bumps_generation(self):
+        with patch.object(NativeProxy, 'cache_upsert', self.cache_upsert):
             config_cache = ConfigCache()
             config_cache.set_config(self.config)
+            config_cache.set_config(self.config)
 
-        self.cache_set.assert_called_once_with(
-            'worker_configuration', jsonutils.dumps(self.config.format()),
-            CONFIG_EXPIRES, CACHE_CONFIG)
+        generations = [
+            call[0][1] for call in self.cache_upsert.call_args_list
+            if call[0][0] == CONFIG_GENERATION_KEY]
+        self.assertEqual(len(generations), 2)
+        self.assertNotEqual(generations[0], generations[1])
 
     def test_get_config_calls_returns_config(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_true
-        ), patch.object(NativeProxy, 'cache_get',  self.cache_get_config):
+        with patch.object(NativeProxy, 'cache_get', self.cache_get_config):
             config_cache = ConfigCache()
             config = config_cache.get_config()
 
@@ -89,43 +148,177 @@ class WhenTestingConfigCache(unittest.TestCase):
         self.assertIsInstance(config, WorkerConfiguration)
 
     def test_get_config_calls_returns_none(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_false):
+        with patch.object(NativeProxy, 'cache_get', self.cache_get_none):
             config_cache = ConfigCache()
             config = config_cache.get_config()
 
         self.assertIs(config, None)
 
     def test_delete_config_calls_cache_del(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_true
-        ), patch.object(NativeProxy, 'cache_del', self.cache_del):
+        with patch.object(NativeProxy, 'cache_del', self.cache_del):
             config_cache = ConfigCache()
             config_cache.delete_config()
 
-        self.cache_del.assert_called_once_with(
+        self.cache_del.assert_any_call(
             'worker_configuration', CACHE_CONFIG)
+        self.cache_del.assert_any_call(CONFIG_GENERATION_KEY, CACHE_CONFIG)
 
-    def test_delete_config_does_not_call_cache_del(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_false
-        ), patch.object(NativeProxy, 'cache_del', self.cache_del):
+    def test_set_tenant_changes_cursor_calls_cache_upsert(self):
+        with patch.object(NativeProxy, 'cache_upsert', self.cache_upsert):
             config_cache = ConfigCache()
-            config_cache.delete_config()
+            config_cache.set_tenant_changes_cursor(42)
+
+        self.cache_upsert.assert_called_once_with(
+            TENANT_CHANGES_CURSOR_KEY, '42', CONFIG_EXPIRES, CACHE_CONFIG)
+
+    def test_get_tenant_changes_cursor_returns_int(self):
+        with patch.object(NativeProxy, 'cache_get',
+                          MagicMock(return_value='42')):
+            config_cache = ConfigCache()
+            self.assertEqual(config_cache.get_tenant_changes_cursor(), 42)
+
+    def test_get_tenant_changes_cursor_returns_none(self):
+        with patch.object(NativeProxy, 'cache_get', self.cache_get_none):
+            config_cache = ConfigCache()
+            self.assertIsNone(config_cache.get_tenant_changes_cursor())
+
+
+class WhenTestingConfigSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.config = WorkerConfiguration(
+            personality='worker',
+            hostname='worker01',
+            coordinator_uri='http://192.168.1.2/v1')
+        self.get_config = MagicMock(return_value=self.config)
+        self.snapshot = ConfigSnapshot()
+
+    def test_config_is_decoded_once_per_generation(self):
+        get_generation = MagicMock(return_value='generation-1')
+        with patch.object(ConfigCache, 'get_config', self.get_config), \
+                patch.object(ConfigCache, 'get_generation', get_generation):
+            self.assertIs(self.snapshot.get_config(), self.config)
+            self.assertIs(self.snapshot.get_config(), self.config)
+
+        self.assertEqual(self.get_config.call_count, 1)
+
+    def test_config_is_reloaded_when_generation_changes(self):
+        get_generation = MagicMock(
+            side_effect=['generation-1', 'generation-2'])
+        with patch.object(ConfigCache, 'get_config', self.get_config), \
+                patch.object(ConfigCache, 'get_generation', get_generation):
+            self.snapshot.get_config()
+            self.snapshot.get_config()
 
-        with self.assertRaises(AssertionError):
-            self.cache_del.assert_called_once_with(
-                'worker_configuration', CACHE_CONFIG)
+        self.assertEqual(self.get_config.call_count, 2)
+
+    def test_config_is_not_memoized_without_generation(self):
+        get_generation = MagicMock(return_value=None)
+        with patch.object(ConfigCache, 'get_config', self.get_config), \
+                patch.object(ConfigCache, 'get_generation', get_generation):
+            self.snapshot.get_config()
+            self.snapshot.get_config()
+
+        self.assertEqual(self.get_config.call_count, 2)
+
+
+class WhenTestingInFlightCache(unittest.TestCase):
+    def setUp(self):
+        self.in_flight = InFlightCache()
+        self.in_flight.cache.server = proxy.SharedMemoryCache(
+            proxy.CacheStore())
+
+    def test_marker_is_held_until_released(self):
+        key = ('101', 'token')
+        self.assertTrue(self.in_flight.acquire(key))
+        self.assertFalse(self.in_flight.acquire(key))
+        self.assertTrue(self.in_flight.acquire(('102', 'token')))
+
+        self.in_flight.release(key)
+        self.assertTrue(self.in_flight.acquire(key))
+
+    def test_marker_expires(self):
+        self.in_flight.expires = -1
+        self.assertTrue(self.in_flight.acquire('key'))
+        self.assertTrue(self.in_flight.acquire('key'))
+
+    def test_clear_calls_cache_clear(self):
+        cache_clear = MagicMock()
+        with patch.object(NativeProxy, 'cache_clear', cache_clear):
+            InFlightCache().clear()
+        cache_clear.assert_called_once_with(CACHE_INFLIGHT)
+
+
+class WhenTestingLocalCacheGeneration(unittest.TestCase):
+    def setUp(self):
+        cache_handler._local_tenants.clear()
+        cache_handler._local_tokens.clear()
+        self.generation = LocalCacheGeneration()
+        self.tenant = Tenant(tenant_id='101', token=Token())
+        self.get_cursor = MagicMock(return_value=5)
+
+    def _check(self, now):
+        with patch.object(ConfigCache, 'get_tenant_changes_cursor',
+                          self.get_cursor), \
+                patch('meniscus.data.cache_handler.time.time',
+                      MagicMock(return_value=now)):
+            self.generation.check()
+
+    def test_local_caches_are_kept_while_cursor_is_unchanged(self):
+        self._check(1000.0)
+        cache_handler._local_tenants.set('101', self.tenant)
+        cache_handler._local_tokens.set('101', self.tenant.token)
+        self._check(1010.0)
+
+        self.assertIs(cache_handler._local_tenants.get('101'), self.tenant)
+        self.assertIs(
+            cache_handler._local_tokens.get('101'), self.tenant.token)
+
+    def test_local_caches_are_cleared_when_cursor_moves(self):
+        self._check(1000.0)
+        cache_handler._local_tenants.set('101', self.tenant)
+        cache_handler._local_tokens.set('101', self.tenant.token)
+        self.get_cursor.return_value = 6
+        self._check(1010.0)
+
+        self.assertIsNone(cache_handler._local_tenants.get('101'))
+        self.assertIsNone(cache_handler._local_tokens.get('101'))
+        self.assertEqual(self.generation.cursor, 6)
+
+    def test_cursor_is_read_once_per_interval(self):
+        self._check(1000.0)
+        self._check(
+            1000.0 + cache_handler.LOCAL_GENERATION_CHECK_SECONDS / 2.0)
+        self.assertEqual(self.get_cursor.call_count, 1)
+
+    def test_token_reset_by_feed_reaches_every_process(self):
+        with patch.object(cache_handler, '_local_generation',
+                          self.generation):
+            self._check(1000.0)
+            cache_handler._local_tokens.set('101', self.tenant.token)
+
+            #another process applied a change of the token and moved the
+            #cursor
+            reset_token = Token()
+            cache_get = MagicMock(
+                return_value=jsonutils.dumps(reset_token.format()))
+            self.get_cursor.return_value = 6
+            self.generation.checked_at = 0
+            with patch.object(ConfigCache, 'get_tenant_changes_cursor',
+                              self.get_cursor), \
+                    patch.object(NativeProxy, 'cache_get', cache_get):
+                token = TokenCache().get_token('101')
+
+        self.assertEqual(token.valid, reset_token.valid)
 
 
 class WhenTestingTenantCache(unittest.TestCase):
     def setUp(self):
+        cache_handler._local_tenants.clear()
+        cache_handler._local_tokens.clear()
         self.cache_clear = MagicMock()
-        self.cache_true = MagicMock(return_value=True)
-        self.cache_false = MagicMock(return_value=False)
-        self.cache_update = MagicMock()
-        self.cache_set = MagicMock()
+        self.cache_upsert = MagicMock()
         self.cache_del = MagicMock()
+        self.cache_get_none = MagicMock(return_value=None)
         self.tenant_id = '101'
         self.tenant = Tenant(
             tenant_id=self.tenant_id,
@@ -140,32 +333,28 @@ class WhenTestingTenantCache(unittest.TestCase):
             tenant_cache.clear()
         self.cache_clear.assert_called_once_with(CACHE_TENANT)
 
-    def test_set_tenant_calls_cache_update(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_true
-        ), patch.object(NativeProxy, 'cache_update', self.cache_update):
+    def test_set_tenant_calls_cache_upsert(self):
+        with patch.object(NativeProxy, 'cache_upsert', self.cache_upsert):
             tenant_cache = TenantCache()
             tenant_cache.set_tenant(self.tenant)
 
-        self.cache_update.assert_called_once_with(
+        self.cache_upsert.assert_called_once_with(
             self.tenant_id, jsonutils.dumps(self.tenant.format()),
             DEFAULT_EXPIRES, CACHE_TENANT)
 
-    def test_set_tenant_calls_cache_set(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_false
-        ), patch.object(NativeProxy, 'cache_set', self.cache_set):
+    def test_set_tenants_calls_cache_set_many(self):
+        cache_handler._local_tenants.set(self.tenant_id, self.tenant)
+        cache_set_many = MagicMock()
+        with patch.object(NativeProxy, 'cache_set_many', cache_set_many):
             tenant_cache = TenantCache()
-            tenant_cache.set_tenant(self.tenant)
+            tenant_cache.set_tenants([self.tenant])
 
-        self.cache_set.assert_called_once_with(
-            self.tenant_id, jsonutils.dumps(self.tenant.format()),
-            DEFAULT_EXPIRES, CACHE_TENANT)
+        cache_set_many.assert_called_once_with(
+            {self.tenant_id: self.tenant_json}, DEFAULT_EXPIRES, CACHE_TENANT)
+        self.assertIsNone(cache_handler._local_tenants.get(self.tenant_id))
 
     def test_get_tenant_calls_returns_tenant(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_true
-        ), patch.object(NativeProxy, 'cache_get',  self.cache_get_tenant):
+        with patch.object(NativeProxy, 'cache_get', self.cache_get_tenant):
             tenant_cache = TenantCache()
             tenant = tenant_cache.get_tenant(self.tenant_id)
 
@@ -174,43 +363,58 @@ class WhenTestingTenantCache(unittest.TestCase):
         self.assertIsInstance(tenant, Tenant)
 
     def test_get_tenant_calls_returns_none(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_false):
+        with patch.object(NativeProxy, 'cache_get', self.cache_get_none):
             tenant_cache = TenantCache()
             tenant = tenant_cache.get_tenant(self.tenant_id)
 
         self.assertIs(tenant, None)
 
     def test_delete_tenant_calls_cache_del(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_true
-        ), patch.object(NativeProxy, 'cache_del', self.cache_del):
+        with patch.object(NativeProxy, 'cache_del', self.cache_del):
             tenant_cache = TenantCache()
             tenant_cache.delete_tenant(self.tenant_id)
 
         self.cache_del.assert_called_once_with(
             self.tenant_id, CACHE_TENANT)
 
-    def test_delete_tenant_does_not_call_cache_del(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_false
-        ), patch.object(NativeProxy, 'cache_del', self.cache_del):
+    def test_get_tenant_is_served_from_local_cache(self):
+        with patch.object(NativeProxy, 'cache_get', self.cache_get_tenant):
             tenant_cache = TenantCache()
+            first = tenant_cache.get_tenant(self.tenant_id)
+            second = tenant_cache.get_tenant(self.tenant_id)
+
+        self.cache_get_tenant.assert_called_once_with(
+            self.tenant_id, CACHE_TENANT)
+        self.assertIs(first, second)
+
+    def test_set_tenant_populates_local_cache(self):
+        with patch.object(NativeProxy, 'cache_upsert', self.cache_upsert):
+            tenant_cache = TenantCache()
+            tenant_cache.set_tenant(self.tenant)
+            tenant = tenant_cache.get_tenant(self.tenant_id)
+
+        self.assertIs(tenant, self.tenant)
+
+    def test_delete_tenant_removes_from_local_cache(self):
+        with patch.object(NativeProxy, 'cache_upsert', self.cache_upsert), \
+                patch.object(NativeProxy, 'cache_del', self.cache_del), \
+                patch.object(NativeProxy, 'cache_get', self.cache_get_none):
+            tenant_cache = TenantCache()
+            tenant_cache.set_tenant(self.tenant)
             tenant_cache.delete_tenant(self.tenant_id)
+            tenant = tenant_cache.get_tenant(self.tenant_id)
 
-        with self.assertRaises(AssertionError):
-            self.cache_del.assert_called_once_with(
-                self.tenant_id, CACHE_TENANT)
+        self.assertIsNone(tenant)
 
 
 class WhenTestingTokenCache(unittest.TestCase):
     def setUp(self):
+        cache_handler._local_tenants.clear()
+        cache_handler._local_tokens.clear()
         self.cache_clear = MagicMock()
-        self.cache_true = MagicMock(return_value=True)
-        self.cache_false = MagicMock(return_value=False)
-        self.cache_update = MagicMock()
-        self.cache_set = MagicMock()
+        self.cache_upsert = MagicMock()
         self.cache_del = MagicMock()
+        self.cache_get_none = MagicMock(return_value=None)
         self.tenant_id = '101'
         self.token = Token()
         self.token_json = jsonutils.dumps(self.token.format())
@@ -222,32 +426,28 @@ class WhenTestingTokenCache(unittest.TestCase):
             token_cache.clear()
         self.cache_clear.assert_called_once_with(CACHE_TOKEN)
 
-    def test_set_token_calls_cache_update(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_true
-        ), patch.object(NativeProxy, 'cache_update', self.cache_update):
+    def test_set_tokens_calls_cache_set_many(self):
+        cache_handler._local_tokens.set(self.tenant_id, self.token)
+        cache_set_many = MagicMock()
+        with patch.object(NativeProxy, 'cache_set_many', cache_set_many):
             token_cache = TokenCache()
-            token_cache.set_token(self.tenant_id, self.token)
+            token_cache.set_tokens({self.tenant_id: self.token})
 
-        self.cache_update.assert_called_once_with(
-            self.tenant_id, jsonutils.dumps(self.token.format()),
-            DEFAULT_EXPIRES, CACHE_TOKEN)
+        cache_set_many.assert_called_once_with(
+            {self.tenant_id: self.token_json}, DEFAULT_EXPIRES, CACHE_TOKEN)
+        self.assertIsNone(cache_handler._local_tokens.get(self.tenant_id))
 
-    def test_set_token_calls_cache_set(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_false
-        ), patch.object(NativeProxy, 'cache_set', self.cache_set):
+    def test_set_token_calls_cache_upsert(self):
+        with patch.object(NativeProxy, 'cache_upsert', self.cache_upsert):
             token_cache = TokenCache()
             token_cache.set_token(self.tenant_id, self.token)
 
-        self.cache_set.assert_called_once_with(
+        self.cache_upsert.assert_called_once_with(
             self.tenant_id, jsonutils.dumps(self.token.format()),
             DEFAULT_EXPIRES, CACHE_TOKEN)
 
     def test_get_token_calls_returns_tenant(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_true
-        ), patch.object(NativeProxy, 'cache_get',  self.cache_get_token):
+        with patch.object(NativeProxy, 'cache_get', self.cache_get_token):
             token_cache = TokenCache()
             token = token_cache.get_token(self.tenant_id)
 
@@ -256,33 +456,43 @@ class WhenTestingTokenCache(unittest.TestCase):
         self.assertIsInstance(token, Token)
 
     def test_get_token_calls_returns_none(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_false):
+        with patch.object(NativeProxy, 'cache_get', self.cache_get_none):
             token_cache = TokenCache()
             token = token_cache.get_token(self.tenant_id)
 
         self.assertIs(token, None)
 
     def test_delete_token_calls_cache_del(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_true
-        ), patch.object(NativeProxy, 'cache_del', self.cache_del):
+        with patch.object(NativeProxy, 'cache_del', self.cache_del):
             token_cache = TokenCache()
             token_cache.delete_token(self.tenant_id)
 
         self.cache_del.assert_called_once_with(
             self.tenant_id, CACHE_TOKEN)
 
-    def test_delete_token_does_not_call_cache_del(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_false
-        ), patch.object(NativeProxy, 'cache_del', self.cache_del):
+    def test_get_token_is_served_from_local_cache(self):
+        with patch.object(NativeProxy, 'cache_get', self.cache_get_token):
             token_cache = TokenCache()
-            token_cache.delete_token(self.tenant_id)
+            first = token_cache.get_token(self.tenant_id)
+            second = token_cache.get_token(self.tenant_id)
+
+        self.cache_get_token.assert_called_once_with(
+            self.tenant_id, CACHE_TOKEN)
+        self.assertIs(first, second)
+
+    def test_set_token_with_reset_token_invalidates_local_tenant(self):
+        tenant = Tenant(tenant_id=self.tenant_id, token=self.token)
+        reset_token = Token()
+
+        with patch.object(NativeProxy, 'cache_upsert', self.cache_upsert), \
+                patch.object(NativeProxy, 'cache_get', self.cache_get_none):
+            TenantCache().set_tenant(tenant)
+            token_cache = TokenCache()
+            token_cache.set_token(self.tenant_id, self.token)
+            token_cache.set_token(self.tenant_id, reset_token)
 
-        with self.assertRaises(AssertionError):
-            self.cache_del.assert_called_once_with(
-                self.tenant_id, CACHE_TOKEN)
+            self.assertIsNone(TenantCache().get_tenant(self.tenant_id))
+            self.assertIs(token_cache.get_token(self.tenant_id), reset_token)
 
 
 if __name__ == '__main__':
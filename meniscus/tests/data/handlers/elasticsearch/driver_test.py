@@ -16,7 +16,7 @@ class WhenTestingEsDataSourceHandler(unittest.TestCase):
         self.conf = MagicMock()
         self.conf.servers = ['localhost:9200']
         self.conf.bulk_size = 100
-        self.conf.ttl = 30
+        self.conf.retention_days = 30
         self.es_handler = es.ElasticsearchHandler(self.conf)
         self.mock_index = "dc2bb3e0-3116-11e3-aa6e-0800200c9a66"
         self.mock_mapping = {
@@ -37,7 +37,8 @@ class WhenTestingEsDataSourceHandler(unittest.TestCase):
             [{'host': 'localhost', 'port': '9200'}]
         )
         self.assertEqual(self.es_handler.bulk_size, self.conf.bulk_size)
-        self.assertEqual(self.es_handler.ttl, self.conf.ttl)
+        self.assertEqual(
+            self.es_handler.retention_days, self.conf.retention_days)
         self.assertEquals(self.es_handler.status, self.es_handler.STATUS_NEW)
 
     def test_check_connection(self):
@@ -112,6 +113,72 @@ class WhenTestingEsDataSourceHandler(unittest.TestCase):
             body=self.mock_mapping
         )
 
+    def _connect_mock(self):
+        connection = MagicMock()
+        self.es_handler.connection = connection
+        self.es_handler.status = self.es_handler.STATUS_CONNECTED
+        return connection
+
+    def test_put_template(self):
+        connection = self._connect_mock()
+        self.es_handler.put_template('logs', self.mock_mapping)
+        connection.indices.put_template.assert_called_once_with(
+            name='logs', body=self.mock_mapping)
+
+    def test_get_template(self):
+        connection = self._connect_mock()
+        connection.indices.get_template.return_value = {
+            'logs': self.mock_mapping}
+        self.assertEqual(
+            self.es_handler.get_template('logs'), self.mock_mapping)
+        connection.indices.get_template.assert_called_once_with(name='logs')
+
+    def test_get_missing_template(self):
+        connection = self._connect_mock()
+        connection.indices.get_template.side_effect = es.NotFoundError
+        self.assertIsNone(self.es_handler.get_template('logs'))
+
+    def test_put_alias(self):
+        connection = self._connect_mock()
+        index = self.mock_index + '-2013.07.12'
+        self.es_handler.put_alias(index, self.mock_index)
+        connection.indices.put_alias.assert_called_once_with(
+            index=index, name=self.mock_index, body=None)
+
+    def test_count_terms(self):
+        connection = self._connect_mock()
+        connection.search.return_value = {'facets': {'terms': {'terms': [
+            {'term': 'a', 'count': 3}, {'term': 'b', 'count': 1}]}}}
+
+        self.assertEqual(
+            self.es_handler.count_terms('shared-*', 'meniscus.tenant', 10),
+            {'a': 3, 'b': 1})
+        kwargs = connection.search.call_args[1]
+        self.assertEqual(kwargs['index'], 'shared-*')
+        self.assertEqual(kwargs['search_type'], 'count')
+        self.assertEqual(
+            kwargs['body']['facets']['terms']['terms'],
+            {'field': 'meniscus.tenant', 'size': 10})
+
+    def test_count_terms_of_missing_index(self):
+        connection = self._connect_mock()
+        connection.search.side_effect = es.NotFoundError
+        self.assertEqual(
+            self.es_handler.count_terms('shared-*', 'meniscus.tenant', 10),
+            {})
+
+    def test_get_indices(self):
+        connection = self._connect_mock()
+        connection.indices.get_aliases.return_value = {
+            self.mock_index: {'aliases': {}}}
+        self.assertEqual(self.es_handler.get_indices(), [self.mock_index])
+
+    def test_delete_indices(self):
+        connection = self._connect_mock()
+        self.es_handler.delete_indices(['a-2013.07.11', 'a-2013.07.12'])
+        connection.indices.delete.assert_called_once_with(
+            index='a-2013.07.11,a-2013.07.12')
+
 
 class WhenTestingGetHandler(unittest.TestCase):
     def setUp(self):
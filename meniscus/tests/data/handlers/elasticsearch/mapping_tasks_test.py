@@ -1,5 +1,7 @@
+import datetime
 import unittest
 
+from elasticsearch import ElasticsearchException
 from mock import MagicMock, patch
 
 from meniscus.data.handlers.elasticsearch import mapping_tasks
@@ -7,45 +9,175 @@ from meniscus.data.handlers.elasticsearch import mapping_tasks
 
 def suite():
     suite = unittest.TestSuite()
-    suite.addTest(WhenTestingTtlTasks())
+    suite.addTest(WhenTestingTimeIndices())
+    suite.addTest(WhenTestingIndexTasks())
     return suite
 
 
-class WhenTestingTtlTasks(unittest.TestCase):
+class WhenTestingTimeIndices(unittest.TestCase):
 
     def setUp(self):
         self.tenant_id = "dc2bb3e0-3116-11e3-aa6e-0800200c9a66"
-        self.doc_type = "default"
+        self.today = datetime.date(2013, 7, 12)
+
+    def test_time_index(self):
+        self.assertEqual(
+            mapping_tasks.time_index(
+                self.tenant_id, datetime.datetime(2013, 7, 2, 23, 59)),
+            'meniscus-' + self.tenant_id + '-2013.07.02')
+
+    def test_shared_index_is_stable(self):
+        when = datetime.datetime(2013, 7, 2)
+        with patch.object(mapping_tasks, 'SHARED_INDICES', 4):
+            index = mapping_tasks.shared_index(self.tenant_id, when)
+            self.assertEqual(
+                index, mapping_tasks.shared_index(self.tenant_id, when))
+        self.assertRegexpMatches(index, r'^meniscus-shared_[0-3]-2013.07.02$')
+
+    def test_tenant_index_shares_small_tenants(self):
+        when = datetime.datetime(2013, 7, 2)
+        with patch.object(mapping_tasks, 'SHARED_INDICES', 4):
+            index, routing = mapping_tasks.tenant_index(
+                self.tenant_id, when=when)
+            self.assertEqual(
+                index, mapping_tasks.shared_index(self.tenant_id, when))
+        self.assertEqual(routing, self.tenant_id)
+
+    def test_tenant_index_of_dedicated_tenant(self):
+        when = datetime.datetime(2013, 7, 2)
+        with patch.object(mapping_tasks, 'SHARED_INDICES', 4):
+            self.assertEqual(
+                mapping_tasks.tenant_index(self.tenant_id, True, when),
+                ('meniscus-' + self.tenant_id + '-2013.07.02', None))
+
+    def test_tenant_index_without_shared_indices(self):
+        with patch.object(mapping_tasks, 'SHARED_INDICES', 0):
+            index, routing = mapping_tasks.tenant_index(self.tenant_id)
+        self.assertTrue(index.startswith('meniscus-' + self.tenant_id))
+        self.assertIsNone(routing)
+
+    def test_tenant_alias_name(self):
+        self.assertEqual(mapping_tasks.tenant_alias_name(self.tenant_id),
+                         'meniscus-' + self.tenant_id)
+
+    def test_tenant_alias(self):
+        self.assertIsNone(mapping_tasks.tenant_alias(self.tenant_id))
+        self.assertEqual(
+            mapping_tasks.tenant_alias(self.tenant_id, self.tenant_id), {
+                'filter': {'term': {'meniscus.tenant': self.tenant_id}},
+                'routing': self.tenant_id})
+
+    def test_parse_time_index(self):
+        self.assertEqual(
+            mapping_tasks.parse_time_index(
+                'meniscus-' + self.tenant_id + '-2013.07.02'),
+            (self.tenant_id, datetime.date(2013, 7, 2)))
+
+    def test_parse_time_index_ignores_other_indices(self):
+        self.assertIsNone(mapping_tasks.parse_time_index(self.tenant_id))
+        self.assertIsNone(mapping_tasks.parse_time_index('kibana-int'))
+        self.assertIsNone(mapping_tasks.parse_time_index(
+            'meniscus-' + self.tenant_id + '-2013.13.02'))
+        self.assertIsNone(
+            mapping_tasks.parse_time_index(self.tenant_id + '-2013.07.02'))
+        self.assertIsNone(
+            mapping_tasks.parse_time_index('logstash-2013.07.02'))
+
+    def test_expired_indices(self):
+        indices = [
+            self.tenant_id,
+            'meniscus-' + self.tenant_id + '-2013.07.10',
+            'meniscus-' + self.tenant_id + '-2013.07.11',
+            'meniscus-' + self.tenant_id + '-2013.07.12',
+            'meniscus-1234-2013.07.09',
+            'logstash-2013.07.09'
+        ]
+        self.assertEqual(
+            mapping_tasks.expired_indices(
+                indices, retention_days=2, today=self.today),
+            ['meniscus-' + self.tenant_id + '-2013.07.10',
+             'meniscus-1234-2013.07.09'])
+
+
+class WhenTestingIndexTasks(unittest.TestCase):
+
+    def setUp(self):
         self.db_handler = MagicMock()
-        self.create_index_method = MagicMock()
-        self.db_handler.create_index = self.create_index_method
-        self.put_mapping_method = MagicMock()
-        self.db_handler.put_mapping = self.put_mapping_method
-
-    def test_create_ttl_mapping(self):
-        with patch(
-            'meniscus.data.handlers.elasticsearch.'
-                'mapping_tasks._es_handler', self.db_handler):
-            mapping_tasks.create_ttl_mapping(self.tenant_id, self.doc_type)
-            self.put_mapping_method.assert_called_once_with(
-                index=self.tenant_id, doc_type=self.doc_type,
-                mapping=mapping_tasks.TTL_MAPPING
-            )
-
-    def test_create_index(self):
-        delay_call = MagicMock()
-
-        with patch(
-            'meniscus.data.handlers.elasticsearch.'
-            'mapping_tasks._es_handler',
-            self.db_handler), \
-                patch(
-                    'meniscus.data.handlers.elasticsearch.'
-                    'mapping_tasks.create_ttl_mapping',
-                    MagicMock()):
-            mapping_tasks.create_index(self.tenant_id)
-        self.create_index_method.assert_called_once_with(
-            index=self.tenant_id, mapping=mapping_tasks.DEFAULT_MAPPING)
+
+    def _install_log_template(self, installed_version, force=False):
+        installed = None
+        if installed_version is not None:
+            installed = {'mappings': {'_default_': {
+                '_meta': {'template_version': installed_version}}}}
+        self.db_handler.get_template.return_value = installed
+
+        with patch.object(mapping_tasks, '_es_handler', self.db_handler):
+            return mapping_tasks.install_log_template(force)
+
+    def test_template_version(self):
+        self.assertEqual(mapping_tasks.template_version(None), 0)
+        self.assertEqual(mapping_tasks.template_version({'mappings': {}}), 0)
+        self.assertEqual(
+            mapping_tasks.template_version(mapping_tasks.LOG_TEMPLATE),
+            mapping_tasks.LOG_TEMPLATE_VERSION)
+
+    def test_install_missing_template(self):
+        self.assertTrue(self._install_log_template(None))
+        self.db_handler.get_template.assert_called_once_with(
+            mapping_tasks.LOG_TEMPLATE_NAME)
+        self.db_handler.put_template.assert_called_once_with(
+            mapping_tasks.LOG_TEMPLATE_NAME, mapping_tasks.LOG_TEMPLATE)
+
+    def test_install_replaces_older_template(self):
+        self.assertTrue(self._install_log_template(
+            mapping_tasks.LOG_TEMPLATE_VERSION - 1))
+        self.assertTrue(self.db_handler.put_template.called)
+
+    def test_install_keeps_current_and_newer_templates(self):
+        for version in (mapping_tasks.LOG_TEMPLATE_VERSION,
+                        mapping_tasks.LOG_TEMPLATE_VERSION + 1):
+            self.assertFalse(self._install_log_template(version))
+        self.assertFalse(self.db_handler.put_template.called)
+
+    def test_forced_install_replaces_newer_template(self):
+        self.assertTrue(self._install_log_template(
+            mapping_tasks.LOG_TEMPLATE_VERSION + 1, force=True))
+        self.assertTrue(self.db_handler.put_template.called)
+
+    def test_put_log_template(self):
+        with patch.object(mapping_tasks, 'install_log_template') as install:
+            mapping_tasks.put_log_template()
+        install.assert_called_once_with()
+
+    def test_delete_expired_indices(self):
+        self.db_handler.get_indices.return_value = ['1234', '1234-2013.07.12']
+        with patch.object(mapping_tasks, '_es_handler', self.db_handler), \
+                patch.object(mapping_tasks, 'expired_indices',
+                             MagicMock(return_value=['1234-2013.07.12'])):
+            mapping_tasks.delete_expired_indices()
+        self.db_handler.delete_indices.assert_called_once_with(
+            ['1234-2013.07.12'])
+
+    def test_delete_expired_indices_in_chunks(self):
+        expired = ['meniscus-{0}-2013.07.01'.format(n) for n in range(5)]
+        self.db_handler.delete_indices.side_effect = [
+            ElasticsearchException, None, None]
+        with patch.object(mapping_tasks, '_es_handler', self.db_handler), \
+                patch.object(mapping_tasks, 'RETENTION_DELETE_CHUNK', 2), \
+                patch.object(mapping_tasks, 'expired_indices',
+                             MagicMock(return_value=expired)):
+            mapping_tasks.delete_expired_indices()
+
+        self.assertEqual(
+            [call[0][0] for call in
+             self.db_handler.delete_indices.call_args_list],
+            [expired[0:2], expired[2:4], expired[4:5]])
+
+    def test_delete_expired_indices_does_nothing_without_expired(self):
+        self.db_handler.get_indices.return_value = ['1234']
+        with patch.object(mapping_tasks, '_es_handler', self.db_handler):
+            mapping_tasks.delete_expired_indices()
+        self.assertFalse(self.db_handler.delete_indices.called)
 
 
 if __name__ == "__main__":
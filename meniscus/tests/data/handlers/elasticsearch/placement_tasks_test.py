@@ -0,0 +1,66 @@
+import datetime
+import unittest
+
+from mock import MagicMock, patch
+
+from meniscus.data.handlers.elasticsearch import placement_tasks
+from meniscus.queue import celery
+from meniscus.queue import TENANT_QUEUE
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(WhenTestingPromoteHeavyTenants())
+    return suite
+
+
+class WhenTestingPromoteHeavyTenants(unittest.TestCase):
+
+    def setUp(self):
+        self.es_handler = MagicMock()
+        self.es_handler.count_terms.return_value = {
+            'heavy': 20, 'light': 5, 'dedicated': 30}
+        self.tenants = {
+            'heavy': MagicMock(dedicated_index=False),
+            'light': MagicMock(dedicated_index=False),
+            'dedicated': MagicMock(dedicated_index=True)
+        }
+        self.tenant_util = MagicMock()
+        self.tenant_util.find_tenant.side_effect = self.tenants.get
+
+    def _promote(self, shared_indices=4):
+        with patch.object(placement_tasks, '_es_handler', self.es_handler), \
+                patch.object(placement_tasks, 'tenant_util',
+                             self.tenant_util), \
+                patch.object(placement_tasks, 'DEDICATED_INDEX_MIN_DOCS',
+                             10), \
+                patch.object(placement_tasks.mapping_tasks, 'SHARED_INDICES',
+                             shared_indices), \
+                patch.object(placement_tasks.timeutils, 'utcnow',
+                             return_value=datetime.datetime(2013, 7, 12)):
+            placement_tasks.promote_heavy_tenants()
+
+    def test_counts_yesterdays_shared_indices(self):
+        self._promote()
+        self.es_handler.count_terms.assert_called_once_with(
+            'meniscus-shared_*-2013.07.11', 'meniscus.tenant',
+            placement_tasks.PLACEMENT_MAX_TENANTS)
+
+    def test_promotes_heavy_tenants(self):
+        self._promote()
+        self.assertTrue(self.tenants['heavy'].dedicated_index)
+        self.assertFalse(self.tenants['light'].dedicated_index)
+        self.tenant_util.save_tenant.assert_called_once_with(
+            self.tenants['heavy'])
+
+    def test_does_nothing_without_shared_indices(self):
+        self._promote(shared_indices=0)
+        self.assertFalse(self.es_handler.count_terms.called)
+
+    def test_task_is_routed_to_tenant_queue(self):
+        route = celery.amqp.router.route({}, 'es.placement', (), {})
+        self.assertEqual(route['queue'].name, TENANT_QUEUE)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -119,6 +119,20 @@ class WhenTestingMongoDataSourceHandler(unittest.TestCase):
         self.mongo_handler.find(object_name, query_filter)
         find.assert_called_once_with(query_filter, None)
 
+    def test_find_with_sort_and_limit(self):
+        self.mongo_handler.status = self.mongo_handler.STATUS_CONNECTED
+        object_name = 'object01'
+        sort = [('seq', 1)]
+        cursor = MagicMock()
+        cursor.sort.return_value = cursor
+        find = MagicMock(return_value=cursor)
+        self.mongo_handler.database = MagicMock()
+        self.mongo_handler.database[object_name].find = find
+        self.mongo_handler.find(object_name, sort=sort, limit=10)
+        find.assert_called_once_with({}, None)
+        cursor.sort.assert_called_once_with(sort)
+        cursor.limit.assert_called_once_with(10)
+
     def test_find_one_no_query_filter(self):
         self.mongo_handler.status = self.mongo_handler.STATUS_CONNECTED
         object_name = 'object01'
@@ -5,6 +5,7 @@ from mock import MagicMock, patch
 from meniscus.data.model.tenant import EventProducer
 from meniscus.data.model.tenant import Token
 from meniscus.data.model.tenant import Tenant
+from meniscus.data.model.tenant import load_tenant_from_dict
 
 
 def suite():
@@ -12,6 +13,7 @@ def suite():
     suite.addTest(WhenTestingEventProducerObject())
     suite.addTest(WhenTestingTokenObject())
     suite.addTest(WhenTestingTenantObject())
+    suite.addTest(WhenTestingTenantEventProducerIndex())
 
 
 class WhenTestingEventProducerObject(unittest.TestCase):
@@ -111,6 +113,13 @@ class WhenTestingTenantObject(unittest.TestCase):
         self.assertEqual(tenant_dict['tenant_id'], '1022')
         self.assertEqual(tenant_dict['event_producers'], [])
         self.assertTrue('token' in tenant_dict)
+        self.assertFalse(tenant_dict['dedicated_index'])
+        self.assertIsNone(tenant_dict['change_seq'])
+
+    def test_tenant_format_keeps_change_seq(self):
+        self.test_tenant_bare.change_seq = 7
+        tenant = load_tenant_from_dict(self.test_tenant_bare.format())
+        self.assertEqual(tenant.change_seq, 7)
 
     def test_tenant_format_for_save(self):
         tenant_dict = self.test_tenant.format_for_save()
@@ -119,5 +128,46 @@ class WhenTestingTenantObject(unittest.TestCase):
         self.assertEqual(tenant_dict['event_producers'], [])
         self.assertEqual(tenant_dict['_id'], 'MDBid')
 
+
+class WhenTestingTenantEventProducerIndex(unittest.TestCase):
+    def setUp(self):
+        self.producer = EventProducer(1, 'apache', 'apache2.cee')
+        self.duplicate = EventProducer(1, 'apache', 'syslog')
+        self.tenant = Tenant('1022', Token(),
+                             [self.producer, self.duplicate])
+
+    def test_find_event_producer_returns_first_match(self):
+        self.assertIs(self.tenant.find_event_producer_by_id(1),
+                      self.producer)
+        self.assertIs(self.tenant.find_event_producer_by_name('apache'),
+                      self.producer)
+
+    def test_find_event_producer_returns_none(self):
+        self.assertIsNone(self.tenant.find_event_producer_by_id(2))
+        self.assertIsNone(self.tenant.find_event_producer_by_name('nginx'))
+
+    def test_add_event_producer_is_indexed(self):
+        producer = EventProducer(2, 'nginx', 'nginx')
+        self.tenant.add_event_producer(producer)
+        self.assertTrue(producer in self.tenant.event_producers)
+        self.assertIs(self.tenant.find_event_producer_by_id(2), producer)
+        self.assertIs(self.tenant.find_event_producer_by_name('nginx'),
+                      producer)
+
+    def test_remove_event_producer_reindexes(self):
+        self.tenant.remove_event_producer(self.producer)
+        self.assertIs(self.tenant.find_event_producer_by_id(1),
+                      self.duplicate)
+        self.assertIs(self.tenant.find_event_producer_by_name('apache'),
+                      self.duplicate)
+
+    def test_rename_event_producer_reindexes(self):
+        self.tenant.remove_event_producer(self.duplicate)
+        self.tenant.rename_event_producer(self.producer, 'httpd')
+        self.assertEqual(self.producer.name, 'httpd')
+        self.assertIsNone(self.tenant.find_event_producer_by_name('apache'))
+        self.assertIs(self.tenant.find_event_producer_by_name('httpd'),
+                      self.producer)
+
 if __name__ == '__main__':
     unittest.main()
@@ -88,17 +88,17 @@ class WhenTestingFindMethods(unittest.TestCase):
             create_tenant_call.assert_called_once_with('unknown_tenant_id')
 
     def test_create_tenant(self):
-        ttl_create_index_call = MagicMock()
         with patch('meniscus.data.model.tenant_util._db_handler',
-                   self.ds_handler), patch(
-                'meniscus.data.model.tenant_util.'
-                'mapping_tasks.create_index.delay',
-                ttl_create_index_call):
+                   self.ds_handler):
             tenant_util.create_tenant(self.tenant_id)
             self.ds_handler.put.assert_called_once()
+            tenant_dict = self.ds_handler.put.call_args[0][1]
+            self.assertEqual(tenant_dict['change_seq'],
+                             self.ds_handler.next_sequence_value.return_value)
+            self.ds_handler.next_sequence_value.assert_called_once_with(
+                tenant_util.TENANT_CHANGES_SEQUENCE)
             self.ds_handler.create_sequence.assert_called_once_with(
                 self.tenant_id)
-            ttl_create_index_call.assert_called_once_with(self.tenant_id)
 
     def test_retrieve_tenant_returns_tenant_obj(self):
         self.ds_handler.find_one = MagicMock(return_value=self.tenant_dict)
@@ -125,6 +125,43 @@ class WhenTestingFindMethods(unittest.TestCase):
             tenant_util.save_tenant(self.tenant_obj)
             self.ds_handler.update.assert_called_once_with(
                 'tenant', self.tenant_obj.format_for_save())
+            self.assertEqual(self.tenant_obj.change_seq,
+                             self.ds_handler.next_sequence_value.return_value)
+
+    def test_create_change_sequence(self):
+        with patch('meniscus.data.model.tenant_util._db_handler',
+                   self.ds_handler):
+            tenant_util.create_change_sequence()
+            self.ds_handler.create_sequence.assert_called_once_with(
+                tenant_util.TENANT_CHANGES_SEQUENCE)
+            self.ds_handler.find.assert_called_once_with(
+                'tenant', {'change_seq': {'$exists': False}}, {'_id': True})
+
+    def test_backfill_change_seqs_numbers_tenants_without_one(self):
+        self.ds_handler.find.return_value = [{'_id': 'a'}, {'_id': 'b'}]
+        self.ds_handler.next_sequence_value.side_effect = [8, 9]
+        with patch('meniscus.data.model.tenant_util._db_handler',
+                   self.ds_handler):
+            self.assertEqual(tenant_util.backfill_change_seqs(), 2)
+
+        self.ds_handler.set_field.assert_any_call(
+            'tenant', {'change_seq': 8},
+            {'_id': 'a', 'change_seq': {'$exists': False}})
+        self.ds_handler.set_field.assert_any_call(
+            'tenant', {'change_seq': 9},
+            {'_id': 'b', 'change_seq': {'$exists': False}})
+
+    def test_retrieve_tenant_changes(self):
+        self.tenant_dict['change_seq'] = 7
+        self.ds_handler.find.return_value = [self.tenant_dict]
+        with patch('meniscus.data.model.tenant_util._db_handler',
+                   self.ds_handler):
+            tenants = tenant_util.retrieve_tenant_changes(since=5, limit=10)
+            self.ds_handler.find.assert_called_once_with(
+                'tenant', {'change_seq': {'$gt': 5}},
+                sort=[('change_seq', 1)], limit=10)
+        self.assertEqual(len(tenants), 1)
+        self.assertEqual(tenants[0].change_seq, 7)
 
     def test_load_tenant_from_dict(self):
         tenant = tenant_util.load_tenant_from_dict(
@@ -133,18 +170,25 @@ class WhenTestingFindMethods(unittest.TestCase):
         self.assertEqual(tenant.format_for_save(),
                          self.tenant_obj.format_for_save())
 
+    def test_load_tenant_from_dict_keeps_dedicated_index(self):
+        self.tenant_obj.dedicated_index = True
+        tenant = tenant_util.load_tenant_from_dict(
+            self.tenant_obj.format_for_save())
+        self.assertTrue(tenant.dedicated_index)
+
+    def test_load_tenant_from_dict_without_dedicated_index(self):
+        tenant_dict = self.tenant_obj.format_for_save()
+        del tenant_dict['dedicated_index']
+        tenant = tenant_util.load_tenant_from_dict(tenant_dict)
+        self.assertFalse(tenant.dedicated_index)
+
     def test_create_event_producer(self):
         self.ds_handler.next_sequence_value = MagicMock(
             return_value=self.producer_id)
-        ttl_create_mapping_call = MagicMock()
         save_tenant_call = MagicMock()
         with patch(
                 'meniscus.data.model.tenant_util._db_handler',
                 self.ds_handler), \
-            patch(
-                'meniscus.data.model.tenant_util.'
-                'mapping_tasks.create_ttl_mapping.delay',
-                ttl_create_mapping_call), \
             patch(
                 'meniscus.data.model.tenant_util.save_tenant',
                 save_tenant_call):
@@ -157,9 +201,6 @@ class WhenTestingFindMethods(unittest.TestCase):
                 self.event_producer.sinks
             )
             save_tenant_call.assert_called_once_with(self.tenant_obj)
-            ttl_create_mapping_call.assert_called_once_with(
-                tenant_id=self.tenant_obj.tenant_id,
-                producer_pattern=self.event_producer.pattern)
             self.assertEqual(new_producer_id, self.producer_id)
 
     def test_delete_event_producer(self):
@@ -203,5 +244,15 @@ class WhenTestingFindMethods(unittest.TestCase):
                 tenant, producer_name='not_name')
             self.assertEquals(producer, None)
 
+    def test_generate_etag_is_stable(self):
+        tenant = tenant_util.load_tenant_from_dict(self.tenant_dict)
+        self.assertEqual(tenant_util.generate_etag(tenant),
+                         tenant_util.generate_etag(self.tenant_obj))
+
+    def test_generate_etag_changes_with_tenant(self):
+        etag = tenant_util.generate_etag(self.tenant_obj)
+        self.tenant_obj.tenant_name = 'RenamedTenant'
+        self.assertNotEqual(tenant_util.generate_etag(self.tenant_obj), etag)
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,11 @@
+import json
 import unittest
 
 from mock import MagicMock, patch
+from meniscus.normalization.normalizer import normalize
 from meniscus.normalization.normalizer import should_normalize
+from meniscus.sinks.document import encode_document
+from meniscus.sinks.document import RawJson
 
 
 class WhenNormalizingMessages(unittest.TestCase):
@@ -41,3 +45,28 @@ class WhenNormalizingMessages(unittest.TestCase):
         target = 'meniscus.normalization.normalizer.loaded_normalizer_rules'
         with patch(target, self.loaded_rules):
             self.assertTrue(should_normalize(self.good_message))
+
+    def test_normalize_keeps_event_json(self):
+        event_json = u'{"interface": "wlan0", "duration": "3600"}'
+        normalizer = MagicMock()
+        normalizer.normalize.return_value.as_json.return_value = event_json
+        target = 'meniscus.normalization.normalizer._normalizer'
+        with patch(target, normalizer):
+            normalize(self.good_message)
+
+        normalizer.normalize.assert_called_once_with(self.good_message['msg'])
+        normalized = self.good_message['normalized']['wpa_supplicant']
+        self.assertIsInstance(normalized, RawJson)
+        self.assertEqual(normalized, event_json)
+
+    def test_normalize_decodes_utf8_event_json(self):
+        normalizer = MagicMock()
+        normalizer.normalize.return_value.as_json.return_value = \
+            '{"city": "M\xc3\xbcnchen"}'
+        target = 'meniscus.normalization.normalizer._normalizer'
+        with patch(target, normalizer):
+            normalize(self.good_message)
+
+        document = json.loads(encode_document(self.good_message))
+        self.assertEqual(document['normalized']['wpa_supplicant'],
+                         {'city': u'M\xfcnchen'})
@@ -5,7 +5,7 @@ from mock import MagicMock
 from mock import patch
 
 from meniscus.openstack.common import jsonutils
-from meniscus.personas.common.publish_stats import ConfigCache
+from meniscus.personas.common.publish_stats import log_process_stats
 from meniscus.personas.common.publish_stats import publish_worker_stats
 from meniscus.data.model.worker import SystemInfo
 from meniscus.data.model.worker import Worker
@@ -16,6 +16,7 @@ def suite():
 
     suite = unittest.TestSuite()
     suite.addTest(WhenTestingPublishStats())
+    suite.addTest(WhenTestingLogProcessStats())
     return suite
 
 
@@ -43,8 +44,9 @@ class WhenTestingPublishStats(unittest.TestCase):
         self.http_request = MagicMock(return_value=self.resp)
 
     def test_http_request_called(self):
-        with patch.object(
-                ConfigCache, 'get_config', self.get_config), patch(
+        with patch(
+                'meniscus.personas.common.publish_stats.get_worker_config',
+                self.get_config), patch(
                 'meniscus.personas.common.publish_stats.http_request',
                 self.http_request), patch(
                 'meniscus.personas.common.publish_stats.get_config',
@@ -61,5 +63,24 @@ class WhenTestingPublishStats(unittest.TestCase):
             )
 
 
+class WhenTestingLogProcessStats(unittest.TestCase):
+    def test_cache_and_client_counters_are_logged(self):
+        cache_stats = {'tenant': {'hits': 4}, 'token': {'hits': 2}}
+        client = MagicMock()
+        client.stats.return_value = {'192.168.1.2': {'requests': 6}}
+        target = 'meniscus.personas.common.publish_stats.{0}'
+        with patch(target.format('local_cache_stats'),
+                   MagicMock(return_value=cache_stats)), \
+                patch(target.format('get_client'),
+                      MagicMock(return_value=client)), \
+                patch(target.format('_LOG')) as log:
+            log_process_stats()
+
+        logged = log.info.call_args[0][0].split(': ', 1)[1]
+        self.assertEqual(jsonutils.loads(logged), {
+            'local_cache': cache_stats,
+            'http_client': {'192.168.1.2': {'requests': 6}}})
+
+
 if __name__ == '__main__':
     unittest.main()
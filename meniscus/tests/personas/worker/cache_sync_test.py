@@ -0,0 +1,145 @@
+import httplib
+import unittest
+
+import requests
+from mock import MagicMock
+from mock import patch
+
+from meniscus.data.model.tenant import Tenant
+from meniscus.data.model.tenant import Token
+from meniscus.data.model.worker import WorkerConfiguration
+from meniscus.personas.worker import cache_sync
+
+
+def suite():
+
+    suite = unittest.TestSuite()
+    suite.addTest(WhenTestingCacheSync())
+    return suite
+
+
+class WhenTestingCacheSync(unittest.TestCase):
+    def setUp(self):
+        self.config = WorkerConfiguration(
+            personality='worker',
+            hostname='worker01',
+            coordinator_uri='http://192.168.1.2/v1')
+        self.get_config = MagicMock(return_value=self.config)
+        self.tenant = Tenant('101', Token())
+        self.config_cache = MagicMock()
+        self.config_cache.get_tenant_changes_cursor.return_value = 4
+        self.token_cache = MagicMock()
+        self.tenant_cache = MagicMock()
+
+    def _page(self, tenants, next_cursor, more):
+        resp = MagicMock()
+        resp.status_code = httplib.OK
+        resp.json.return_value = {
+            'tenants': [tenant.format() for tenant in tenants],
+            'next': next_cursor,
+            'more': more}
+        return resp
+
+    def _patches(self, http_request):
+        return [
+            patch('meniscus.personas.worker.cache_sync.get_worker_config',
+                  self.get_config),
+            patch('meniscus.personas.worker.cache_sync.http_request',
+                  http_request),
+            patch('meniscus.personas.worker.cache_sync.ConfigCache',
+                  MagicMock(return_value=self.config_cache)),
+            patch('meniscus.personas.worker.cache_sync.TokenCache',
+                  MagicMock(return_value=self.token_cache)),
+            patch('meniscus.personas.worker.cache_sync.TenantCache',
+                  MagicMock(return_value=self.tenant_cache))]
+
+    def _start(self, patches):
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_load_tenant_changes_pages_until_done(self):
+        http_request = MagicMock(side_effect=[
+            self._page([self.tenant], 1, True),
+            self._page([self.tenant], 2, False)])
+        self._start(self._patches(http_request))
+
+        loaded = cache_sync.load_tenant_changes(since=0)
+
+        self.assertEqual(loaded, 2)
+        self.assertEqual(http_request.call_count, 2)
+        self.assertEqual(
+            http_request.call_args[0][0],
+            'http://192.168.1.2/v1/tenants?since=1&limit={0}'.format(
+                cache_sync.PAGE_SIZE))
+        self.assertEqual(self.tenant_cache.set_tenants.call_count, 2)
+        self.config_cache.set_tenant_changes_cursor.assert_called_with(2)
+
+    def test_load_tenant_changes_stores_tokens(self):
+        http_request = MagicMock(
+            return_value=self._page([self.tenant], 1, False))
+        self._start(self._patches(http_request))
+
+        cache_sync.load_tenant_changes()
+
+        tokens = self.token_cache.set_tokens.call_args[0][0]
+        self.assertEqual(tokens['101'].valid, self.tenant.token.valid)
+
+    def test_load_tenant_changes_raises_for_bad_status(self):
+        resp = MagicMock()
+        resp.status_code = httplib.INTERNAL_SERVER_ERROR
+        self._start(self._patches(MagicMock(return_value=resp)))
+
+        with self.assertRaises(cache_sync.CacheSyncError):
+            cache_sync.load_tenant_changes()
+
+    def test_load_tenant_changes_raises_without_config(self):
+        self.get_config.return_value = None
+        self._start(self._patches(MagicMock()))
+
+        with self.assertRaises(cache_sync.CacheSyncError):
+            cache_sync.load_tenant_changes()
+
+    def test_warm_up_caches_logs_failures(self):
+        http_request = MagicMock(side_effect=requests.ConnectionError)
+        self._start(self._patches(http_request))
+
+        cache_sync.warm_up_caches()
+        self.assertFalse(self.tenant_cache.set_tenants.called)
+
+    def test_sync_tenant_caches_resumes_below_cursor(self):
+        self.config_cache.get_tenant_changes_cursor.return_value = 14
+        http_request = MagicMock(return_value=self._page([], 4, False))
+        self._start(self._patches(http_request))
+
+        with patch.object(cache_sync, 'CHANGE_OVERLAP', 10):
+            cache_sync.sync_tenant_caches()
+
+        self.assertTrue('since=4&' in http_request.call_args[0][0])
+        self.assertFalse(self.tenant_cache.set_tenants.called)
+
+    def test_cursor_does_not_move_back(self):
+        http_request = MagicMock(return_value=self._page([], 4, False))
+        self._start(self._patches(http_request))
+
+        cache_sync.load_tenant_changes(since=14, overlap=10)
+
+        self.config_cache.set_tenant_changes_cursor.assert_called_once_with(
+            14)
+
+    def test_late_commit_below_cursor_is_applied(self):
+        self.tenant.change_seq = 12
+        http_request = MagicMock(
+            return_value=self._page([self.tenant], 12, False))
+        self._start(self._patches(http_request))
+
+        loaded = cache_sync.load_tenant_changes(since=14, overlap=10)
+
+        self.assertEqual(loaded, 1)
+        self.assertTrue(self.tenant_cache.set_tenants.called)
+        self.config_cache.set_tenant_changes_cursor.assert_called_once_with(
+            14)
+
+
+if __name__ == '__main__':
+    unittest.main()
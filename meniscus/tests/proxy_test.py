@@ -0,0 +1,130 @@
+import unittest
+
+from mock import MagicMock
+
+from meniscus import proxy
+
+
+class WhenTestingSharedMemoryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = proxy.SharedMemoryCache(proxy.CacheStore())
+        self.cache_name = 'cache-tenant'
+
+    def test_cache_get_returns_none_for_missing_key(self):
+        self.assertIsNone(self.cache.cache_get('missing', self.cache_name))
+        self.assertFalse(self.cache.cache_exists('missing', self.cache_name))
+
+    def test_cache_update_stores_value(self):
+        self.cache.cache_update('key', 'value', 0, self.cache_name)
+        self.assertEqual(self.cache.cache_get('key', self.cache_name), 'value')
+        self.assertTrue(self.cache.cache_exists('key', self.cache_name))
+
+    def test_cache_set_does_not_overwrite(self):
+        self.assertTrue(
+            self.cache.cache_set('key', 'first', 0, self.cache_name))
+        self.assertFalse(
+            self.cache.cache_set('key', 'second', 0, self.cache_name))
+        self.assertEqual(self.cache.cache_get('key', self.cache_name), 'first')
+
+    def test_cache_set_replaces_expired_value(self):
+        self.cache.cache_update('key', 'first', -1, self.cache_name)
+        self.assertTrue(
+            self.cache.cache_set('key', 'second', 0, self.cache_name))
+        self.assertEqual(
+            self.cache.cache_get('key', self.cache_name), 'second')
+
+    def test_expired_values_are_not_returned(self):
+        self.cache.cache_update('key', 'value', -1, self.cache_name)
+        self.assertIsNone(self.cache.cache_get('key', self.cache_name))
+
+    def test_caches_are_kept_separate(self):
+        self.cache.cache_update('key', 'tenant', 0, 'cache-tenant')
+        self.cache.cache_update('key', 'token', 0, 'cache-token')
+        self.cache.cache_clear('cache-tenant')
+
+        self.assertIsNone(self.cache.cache_get('key', 'cache-tenant'))
+        self.assertEqual(self.cache.cache_get('key', 'cache-token'), 'token')
+
+    def test_cache_del(self):
+        self.cache.cache_update('key', 'value', 0, self.cache_name)
+        self.cache.cache_del('key', self.cache_name)
+        self.cache.cache_del('key', self.cache_name)
+        self.assertIsNone(self.cache.cache_get('key', self.cache_name))
+
+    def test_cache_get_many_reads_store_once(self):
+        self.cache.store = MagicMock()
+        self.cache.store.get_many.return_value = [(0, 'value'), None]
+        self.assertEqual(
+            self.cache.cache_get_many(['key', 'missing'], self.cache_name),
+            {'key': 'value'})
+        self.cache.store.get_many.assert_called_once_with(
+            [(self.cache_name, 'key'), (self.cache_name, 'missing')])
+
+    def test_cache_update_many_writes_store_once(self):
+        self.cache.store = MagicMock()
+        self.cache.cache_update_many({'a': '1', 'b': '2'}, 0, self.cache_name)
+        self.cache.store.update.assert_called_once_with({
+            (self.cache_name, 'a'): (0, '1'),
+            (self.cache_name, 'b'): (0, '2')})
+
+
+class WhenTestingNativeProxy(unittest.TestCase):
+
+    def setUp(self):
+        self.proxy = proxy.NativeProxy()
+        self.proxy.server = proxy.SharedMemoryCache(proxy.CacheStore())
+        self.cache_name = 'cache-tenant'
+
+    def test_cache_upsert_sets_and_updates(self):
+        self.proxy.cache_upsert('key', 'first', 0, self.cache_name)
+        self.proxy.cache_upsert('key', 'second', 0, self.cache_name)
+        self.assertEqual(
+            self.proxy.cache_get('key', self.cache_name), 'second')
+
+    def test_cache_set_many_and_get_many(self):
+        self.proxy.cache_set_many({'a': '1', 'b': '2'}, 0, self.cache_name)
+        self.assertEqual(
+            self.proxy.cache_get_many(['a', 'b', 'c'], self.cache_name),
+            {'a': '1', 'b': '2'})
+
+    def test_cache_upsert_makes_one_call_to_server(self):
+        self.proxy.server = MagicMock()
+        self.proxy.cache_upsert('key', 'value', 0, self.cache_name)
+        self.proxy.server.cache_update.assert_called_once_with(
+            'key', 'value', 0, self.cache_name)
+        self.assertFalse(self.proxy.server.cache_exists.called)
+
+    def test_cache_add_reports_whether_value_was_stored(self):
+        self.assertTrue(self.proxy.cache_add('key', '1', 0, self.cache_name))
+        self.assertFalse(
+            self.proxy.cache_add('key', '2', 0, self.cache_name))
+        self.assertEqual(self.proxy.cache_get('key', self.cache_name), '1')
+
+    def test_cache_add_uses_uwsgi_cache_set(self):
+        self.proxy.server = MagicMock(spec=['cache_set'])
+        self.proxy.server.cache_set.return_value = None
+        self.assertFalse(
+            self.proxy.cache_add('key', 'value', 10, self.cache_name))
+        self.proxy.server.cache_set.assert_called_once_with(
+            'key', 'value', 10, self.cache_name)
+
+    def test_get_many_reads_uwsgi_keys_in_turn(self):
+        self.proxy.server = MagicMock(spec=['cache_get'])
+        self.proxy.server.cache_get.side_effect = ['1', None]
+        self.assertEqual(
+            self.proxy.cache_get_many(['a', 'b'], self.cache_name),
+            {'a': '1'})
+
+    def test_operations_without_server_do_nothing(self):
+        self.proxy.server = None
+        self.proxy.cache_upsert('key', 'value', 0, self.cache_name)
+        self.assertIsNone(self.proxy.cache_get('key', self.cache_name))
+        self.assertTrue(
+            self.proxy.cache_add('key', 'value', 0, self.cache_name))
+        self.assertEqual(
+            self.proxy.cache_get_many(['key'], self.cache_name), dict())
+
+
+if __name__ == '__main__':
+    unittest.main()
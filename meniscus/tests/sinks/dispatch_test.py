@@ -0,0 +1,101 @@
+import unittest
+
+from mock import call
+from mock import MagicMock
+from mock import patch
+
+from meniscus.sinks import dispatch
+from meniscus.sinks.document import RawJson
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(WhenTestingRouteMessage())
+    return suite
+
+
+class WhenTestingRouteMessage(unittest.TestCase):
+    def setUp(self):
+        self.message = {
+            'msg': 'log message',
+            'meniscus': {
+                'tenant': '1234',
+                'correlation': {
+                    'pattern': 'syslog',
+                    'durable': False,
+                    'sinks': ['elasticsearch']
+                }
+            }
+        }
+        self.put_message = MagicMock()
+        self.index_message = MagicMock()
+
+    def _route(self):
+        with patch('meniscus.sinks.dispatch.elasticsearch.put_message',
+                   self.put_message), \
+                patch('meniscus.sinks.dispatch.elasticsearch.index_message',
+                      self.index_message):
+            dispatch.route_message(self.message)
+
+    def tearDown(self):
+        dispatch._retry_buffer.clear()
+
+    def test_route_message_publishes_index_request(self):
+        self._route()
+        self.index_message.assert_called_once_with(self.message)
+        self.assertFalse(self.put_message.delay.called)
+
+    def test_route_message_buffers_failed_message(self):
+        self.index_message.side_effect = Exception('broker unavailable')
+        self._route()
+        self.assertEqual(list(dispatch._retry_buffer), [self.message])
+        self.assertFalse(self.put_message.delay.called)
+
+    def test_route_message_queues_failed_durable_message(self):
+        self.message['meniscus']['correlation']['durable'] = True
+        self.index_message.side_effect = Exception('broker unavailable')
+        self._route()
+        self.put_message.delay.assert_called_once_with(self.message)
+        self.assertEqual(len(dispatch._retry_buffer), 0)
+
+    def test_route_message_sends_buffered_messages_first(self):
+        buffered_message = {'msg': 'buffered'}
+        dispatch._retry_buffer.append(buffered_message)
+        self._route()
+        self.assertEqual(self.index_message.call_args_list,
+                         [call(buffered_message), call(self.message)])
+        self.assertEqual(len(dispatch._retry_buffer), 0)
+
+    def test_route_message_keeps_buffer_when_retry_fails(self):
+        buffered_message = {'msg': 'buffered'}
+        dispatch._retry_buffer.append(buffered_message)
+        self.index_message.side_effect = Exception('broker unavailable')
+        self._route()
+        self.assertEqual(list(dispatch._retry_buffer),
+                         [buffered_message, self.message])
+
+    def test_route_message_queues_task_when_buffer_full(self):
+        self.index_message.side_effect = Exception('broker unavailable')
+        with patch.object(dispatch, 'RETRY_BUFFER_SIZE', 0):
+            self._route()
+        self.put_message.delay.assert_called_once_with(self.message)
+        self.assertEqual(len(dispatch._retry_buffer), 0)
+
+    def test_route_message_decodes_raw_json_for_task(self):
+        self.message['normalized'] = {'syslog': RawJson(u'{"field": 1}')}
+        self.index_message.side_effect = Exception('broker unavailable')
+        with patch.object(dispatch, 'RETRY_BUFFER_SIZE', 0):
+            self._route()
+        queued = self.put_message.delay.call_args[0][0]
+        self.assertEqual(queued['normalized'], {'syslog': {'field': 1}})
+        self.assertNotIsInstance(queued['normalized']['syslog'], RawJson)
+
+    def test_route_message_ignores_unknown_sinks(self):
+        self.message['meniscus']['correlation']['sinks'] = ['hdfs']
+        self._route()
+        self.assertFalse(self.index_message.called)
+        self.assertFalse(self.put_message.delay.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
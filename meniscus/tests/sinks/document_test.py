@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import datetime
+import json
+import unittest
+
+from meniscus.sinks import document
+from meniscus.sinks.document import RawJson
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(WhenTestingEncodeDocument())
+    suite.addTest(WhenTestingExpandRawJson())
+    return suite
+
+
+class WhenTestingEncodeDocument(unittest.TestCase):
+    def setUp(self):
+        self.message = {
+            'msg': 'log message',
+            'meniscus': {
+                'tenant': '1234',
+                'correlation': {
+                    '@timestamp': datetime.datetime(2013, 7, 12, 14, 17)
+                }
+            }
+        }
+
+    def test_encodes_message(self):
+        encoded = document.encode_document(self.message)
+        self.assertIsInstance(encoded, str)
+        self.assertEqual(
+            json.loads(encoded)['meniscus']['correlation']['@timestamp'],
+            '2013-07-12T14:17:00')
+
+    def test_inserts_raw_json_values(self):
+        self.message['normalized'] = {
+            'apache': RawJson(u'{"status": 404, "path": "/test.html"}'),
+            'other': {'field': 'value'}
+        }
+        encoded = document.encode_document(self.message)
+
+        self.assertIn('"apache": {"status": 404, "path": "/test.html"}',
+                      encoded)
+        self.assertEqual(json.loads(encoded)['normalized'], {
+            'apache': {'status': 404, 'path': '/test.html'},
+            'other': {'field': 'value'}
+        })
+        self.assertIsInstance(self.message['normalized']['apache'], RawJson)
+
+    def test_encodes_raw_json_as_utf8(self):
+        self.message['normalized'] = {
+            'apache': RawJson(u'{"user": "töhru"}')}
+        encoded = document.encode_document(self.message)
+
+        self.assertIsInstance(encoded, str)
+        self.assertEqual(
+            json.loads(encoded.decode('utf-8'))['normalized']['apache'],
+            {'user': u'töhru'})
+
+
+class WhenTestingExpandRawJson(unittest.TestCase):
+    def test_decodes_raw_json_values(self):
+        message = {'normalized': {'apache': RawJson(u'{"status": 404}')}}
+        self.assertIs(document.expand_raw_json(message), message)
+        self.assertEqual(message['normalized'], {'apache': {'status': 404}})
+
+    def test_ignores_messages_without_raw_json(self):
+        message = {'msg': 'log message'}
+        self.assertEqual(document.expand_raw_json(message),
+                         {'msg': 'log message'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,534 @@
+import datetime
+import json
+from Queue import Empty
+import unittest
+
+from elasticsearch import ElasticsearchException
+from mock import MagicMock
+from mock import patch
+
+from meniscus import proxy
+from meniscus.sinks.document import RawJson
+from meniscus.sinks.elasticsearch import sink
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(WhenTestingQueueIndexRequest())
+    suite.addTest(WhenTestingRetryMessage())
+    suite.addTest(WhenTestingBulkBuffer())
+    suite.addTest(WhenTestingStreamToEs())
+    suite.addTest(WhenTestingFlushToEs())
+    suite.addTest(WhenTestingElasticSearchStreamBulker())
+    return suite
+
+
+class WhenTestingQueueIndexRequest(unittest.TestCase):
+    def setUp(self):
+        self.producer = MagicMock()
+        self.producers = MagicMock()
+        self.producers.__getitem__.return_value.acquire.return_value.\
+            __enter__.return_value = self.producer
+        self.es_queue = MagicMock()
+        self.es_queue.routing_key = sink.ELASTICSEARCH_QUEUE
+        self.es_transient_queue = MagicMock()
+        self.es_transient_queue.routing_key = \
+            sink.ELASTICSEARCH_TRANSIENT_QUEUE
+        self.message = {
+            'msg': 'log message',
+            'meniscus': {
+                'tenant': '1234',
+                'correlation': {'pattern': 'syslog', 'durable': True}
+            }
+        }
+
+    def _index_message(self):
+        with patch.object(sink, 'producers', self.producers), \
+                patch.object(sink, 'connection', MagicMock(), create=True), \
+                patch.object(sink, 'es_queue', self.es_queue, create=True), \
+                patch.object(sink, 'es_transient_queue',
+                             self.es_transient_queue, create=True), \
+                patch.object(sink, 'TASK_COMPRESSION', 'zlib'):
+            sink.index_message(self.message)
+
+        lines = self.producer.publish.call_args[0][0]
+        self.assertTrue(lines.endswith('\n'))
+        op_line, source_line = lines.splitlines()
+        return (json.loads(op_line)['index'], json.loads(source_line),
+                self.producer.publish.call_args[1])
+
+    def test_index_message_publishes_encoded_bulk_lines(self):
+        op, source, kwargs = self._index_message()
+
+        self.assertNotIn('_ttl', op)
+        self.assertEqual(op['_type'], 'syslog')
+        self.assertEqual(source, self.message)
+        self.assertEqual(kwargs['content_type'], sink.BULK_CONTENT_TYPE)
+        self.assertEqual(kwargs['content_encoding'], 'binary')
+        self.assertEqual(kwargs['headers'][sink.INDEX_HEADER], op['_index'])
+        self.assertEqual(kwargs['compression'], 'zlib')
+
+    def test_index_message_inserts_raw_normalized_json(self):
+        self.message['normalized'] = {
+            'syslog': RawJson(u'{"field": "value"}')}
+        op, source, kwargs = self._index_message()
+        self.assertEqual(source['normalized'], {'syslog': {'field': 'value'}})
+
+    def test_small_tenant_is_routed_to_shared_index(self):
+        with patch.object(sink.mapping_tasks, 'SHARED_INDICES', 4):
+            op, source, kwargs = self._index_message()
+
+        self.assertTrue(op['_index'].startswith('meniscus-shared_'))
+        self.assertEqual(op['_routing'], '1234')
+        self.assertEqual(kwargs['headers'][sink.ROUTING_HEADER], '1234')
+
+    def test_dedicated_tenant_has_own_index(self):
+        self.message['meniscus']['correlation']['dedicated_index'] = True
+        op, source, kwargs = self._index_message()
+
+        self.assertTrue(op['_index'].startswith('meniscus-1234-'))
+        self.assertNotIn('_routing', op)
+        self.assertNotIn(sink.ROUTING_HEADER, kwargs['headers'])
+
+    def test_durable_message_is_persistent(self):
+        op, source, kwargs = self._index_message()
+
+        self.assertEqual(kwargs['routing_key'], sink.ELASTICSEARCH_QUEUE)
+        self.assertEqual(kwargs['delivery_mode'], 'persistent')
+        self.assertEqual(kwargs['declare'], [self.es_queue])
+
+    def test_non_durable_message_is_transient(self):
+        self.message['meniscus']['correlation']['durable'] = False
+        with patch.object(sink, 'TRANSIENT_NON_DURABLE', True):
+            op, source, kwargs = self._index_message()
+
+        self.assertEqual(
+            kwargs['routing_key'], sink.ELASTICSEARCH_TRANSIENT_QUEUE)
+        self.assertEqual(kwargs['delivery_mode'], 'transient')
+        self.assertEqual(kwargs['declare'], [self.es_transient_queue])
+
+    def test_non_durable_message_is_persistent_by_default(self):
+        self.message['meniscus']['correlation']['durable'] = False
+        op, source, kwargs = self._index_message()
+
+        self.assertEqual(kwargs['routing_key'], sink.ELASTICSEARCH_QUEUE)
+        self.assertEqual(kwargs['delivery_mode'], 'persistent')
+
+
+class WhenTestingRetryMessage(unittest.TestCase):
+    def setUp(self):
+        self.producer = MagicMock()
+        self.producers = MagicMock()
+        self.producers.__getitem__.return_value.acquire.return_value.\
+            __enter__.return_value = self.producer
+        self.retry_queues = [MagicMock(), MagicMock()]
+        self.dead_letter_queue = MagicMock()
+        self.message = MagicMock()
+        self.message.body = '{"index": {}}\n{}\n'
+        self.message.content_type = sink.BULK_CONTENT_TYPE
+        self.message.content_encoding = 'binary'
+
+    def _retry_message(self):
+        with patch.object(sink, 'producers', self.producers), \
+                patch.object(sink, 'connection', MagicMock(), create=True), \
+                patch.object(sink, 'es_retry_queues', self.retry_queues,
+                             create=True), \
+                patch.object(sink, 'es_dead_letter_queue',
+                             self.dead_letter_queue, create=True), \
+                patch.object(sink, 'BULK_MAX_RETRIES', 2):
+            return sink._retry_message(self.message)
+
+    def test_retry_queue_name_holds_backoff(self):
+        self.assertEqual(sink._retry_queue_name(1, 2000),
+                         'elasticsearch_retry_1_2000')
+        self.assertNotEqual(sink._retry_queue_name(1, 2000),
+                            sink._retry_queue_name(1, 4000))
+
+    def test_first_failure_goes_to_first_retry_queue(self):
+        self.message.headers = {sink.INDEX_HEADER: '1234',
+                                'compression': 'application/x-gzip'}
+        self.assertTrue(self._retry_message())
+
+        kwargs = self.producer.publish.call_args[1]
+        self.producer.publish.assert_called_once_with(
+            self.message.body, **kwargs)
+        self.assertEqual(kwargs['declare'], [self.retry_queues[0]])
+        self.assertEqual(kwargs['headers'], {
+            sink.INDEX_HEADER: '1234', sink.RETRIES_HEADER: 1})
+        self.assertEqual(kwargs['delivery_mode'], 'persistent')
+        self.assertEqual(kwargs['content_type'], sink.BULK_CONTENT_TYPE)
+        self.assertEqual(kwargs['content_encoding'], 'binary')
+
+    def test_retried_failure_goes_to_next_retry_queue(self):
+        self.message.headers = {sink.RETRIES_HEADER: 1}
+        self.assertTrue(self._retry_message())
+
+        kwargs = self.producer.publish.call_args[1]
+        self.assertEqual(kwargs['declare'], [self.retry_queues[1]])
+        self.assertEqual(kwargs['headers'], {sink.RETRIES_HEADER: 2})
+
+    def test_last_failure_goes_to_dead_letter_queue(self):
+        self.message.headers = {sink.RETRIES_HEADER: 2}
+        self.assertFalse(self._retry_message())
+
+        kwargs = self.producer.publish.call_args[1]
+        self.assertEqual(kwargs['declare'], [self.dead_letter_queue])
+
+
+class WhenTestingBulkBuffer(unittest.TestCase):
+    def setUp(self):
+        self.es_client = MagicMock()
+        self.es_client.transport.serializer.dumps = json.dumps
+        self.action = {
+            '_index': '1234',
+            '_type': 'syslog',
+            '_id': 'abc',
+            '_source': {'msg': 'log message'}
+        }
+        self.es_handler = MagicMock()
+        self.bulk_buffer = sink.BulkBuffer(
+            self.es_client, max_docs=3, max_bytes=1000, linger_ms=50,
+            handler=self.es_handler)
+        utcnow = patch.object(sink.timeutils, 'utcnow', MagicMock(
+            return_value=datetime.datetime(2013, 7, 12, 12)))
+        utcnow.start()
+        self.addCleanup(utcnow.stop)
+
+    def test_add_encodes_bulk_lines(self):
+        self.bulk_buffer.add(self.action)
+        op, source = self.bulk_buffer.lines[0].splitlines()
+        self.assertEqual(json.loads(op), {'index': {
+            '_index': '1234', '_type': 'syslog', '_id': 'abc'}})
+        self.assertEqual(json.loads(source), {'msg': 'log message'})
+        self.assertEqual(
+            self.bulk_buffer.size, len(self.bulk_buffer.lines[0]))
+
+    def test_add_encoded_holds_lines(self):
+        lines = '{"index": {"_index": "1234"}}\n{"msg": "log"}\n'
+        self.bulk_buffer.add_encoded(lines, '1234', message=None)
+        self.assertEqual(self.bulk_buffer.lines, [lines])
+        self.assertEqual(self.bulk_buffer.size, len(lines))
+        self.assertEqual(self.bulk_buffer.indices, set([('1234', None)]))
+
+    def test_is_due_when_max_docs_reached(self):
+        self.assertFalse(self.bulk_buffer.is_due())
+        for index in range(3):
+            self.bulk_buffer.add(self.action)
+        self.assertTrue(self.bulk_buffer.is_full())
+        self.assertTrue(self.bulk_buffer.is_due())
+
+    def test_is_due_when_max_bytes_reached(self):
+        self.action['_source']['msg'] = 'x' * 1000
+        self.bulk_buffer.add(self.action)
+        self.assertTrue(self.bulk_buffer.is_due())
+
+    def test_is_due_when_linger_expires(self):
+        with patch('meniscus.sinks.elasticsearch.sink.time.time',
+                   MagicMock(return_value=100.0)):
+            self.bulk_buffer.add(self.action)
+            self.assertFalse(self.bulk_buffer.is_due())
+            self.assertAlmostEqual(self.bulk_buffer.wait_time(), 0.05)
+
+        with patch('meniscus.sinks.elasticsearch.sink.time.time',
+                   MagicMock(return_value=100.06)):
+            self.assertTrue(self.bulk_buffer.is_due())
+
+    def _flush(self, items, messages, retry_message=None):
+        for message in messages:
+            self.bulk_buffer.add(self.action, message)
+        self.es_client.bulk.return_value = {'items': items}
+
+        if retry_message is None:
+            retry_message = MagicMock(return_value=True)
+        with patch.object(sink, '_retry_message', retry_message):
+            return self.bulk_buffer.flush()
+
+    def test_flush_acks_chunk_once(self):
+        messages = [MagicMock(delivery_tag=tag) for tag in range(1, 4)]
+        result = self._flush([{'index': {'ok': True}}] * 3, messages)
+
+        self.assertEqual(result, (3, 0))
+        self.assertEqual(self.es_client.bulk.call_count, 1)
+        messages[2].channel.basic_ack.assert_called_once_with(
+            3, multiple=True)
+        self.assertFalse(messages[0].channel.basic_ack.called)
+        self.assertEqual(len(self.bulk_buffer), 0)
+        self.assertIsNone(self.bulk_buffer.wait_time())
+
+    def test_flush_retries_failed_messages(self):
+        indexed_message = MagicMock(delivery_tag=1)
+        failed_message = MagicMock(delivery_tag=2)
+        retry_message = MagicMock(return_value=True)
+        result = self._flush(
+            [{'index': {'ok': True}},
+             {'index': {'error': 'MapperParsingException'}},
+             {'index': {'ok': True}}],
+            [indexed_message, failed_message, None], retry_message)
+
+        self.assertEqual(result, (2, 1))
+        retry_message.assert_called_once_with(failed_message)
+        failed_message.channel.basic_ack.assert_called_once_with(
+            2, multiple=True)
+        self.assertEqual(self.bulk_buffer.counters['retried'], 1)
+        self.assertEqual(self.bulk_buffer.counters['failed'], 1)
+        self.assertEqual(self.bulk_buffer.counters['indexed'], 2)
+        self.assertEqual(self.bulk_buffer.counters['chunks'], 1)
+
+    def test_flush_counts_dead_lettered_messages(self):
+        self._flush([{'index': {'error': 'MapperParsingException'}}],
+                    [MagicMock()], MagicMock(return_value=False))
+        self.assertEqual(self.bulk_buffer.counters['dead_lettered'], 1)
+
+    def test_flush_requeues_messages_that_can_not_be_retried(self):
+        indexed_message = MagicMock(delivery_tag=1)
+        failed_message = MagicMock(delivery_tag=2)
+        self._flush([{'index': {'ok': True}},
+                     {'index': {'error': 'MapperParsingException'}}],
+                    [indexed_message, failed_message],
+                    MagicMock(side_effect=IOError))
+
+        failed_message.requeue.assert_called_once_with()
+        indexed_message.channel.basic_ack.assert_called_once_with(
+            1, multiple=True)
+        self.assertEqual(self.bulk_buffer.counters['requeued'], 1)
+
+    def test_flush_aliases_new_daily_indices(self):
+        self.action['_index'] = 'meniscus-1234-2013.07.12'
+        self._flush([{'index': {'ok': True}}] * 2, [None, None])
+        self._flush([{'index': {'ok': True}}], [None])
+
+        self.es_handler.put_alias.assert_called_once_with(
+            'meniscus-1234-2013.07.12', 'meniscus-1234', body=None)
+
+    def test_flush_adds_filtered_aliases_to_shared_indices(self):
+        self.action['_index'] = 'meniscus-shared_1-2013.07.12'
+        self.action['_routing'] = '1234'
+        self._flush([{'index': {'ok': True}}], [None])
+
+        self.es_handler.put_alias.assert_called_once_with(
+            'meniscus-shared_1-2013.07.12', 'meniscus-1234', body={
+                'filter': {'term': {'meniscus.tenant': '1234'}},
+                'routing': '1234'})
+
+    def test_failed_alias_is_tried_again_later(self):
+        self.action['_index'] = 'meniscus-1234-2013.07.12'
+        self.es_handler.put_alias.side_effect = [
+            ElasticsearchException, None]
+        with patch('meniscus.sinks.elasticsearch.sink.time.time',
+                   MagicMock(return_value=1000.0)):
+            self._flush([{'index': {'ok': True}}], [None])
+            self._flush([{'index': {'ok': True}}], [None])
+
+        self.assertEqual(self.es_handler.put_alias.call_count, 1)
+        self.assertEqual(self.bulk_buffer.counters['alias_failed'], 1)
+        self.assertEqual(self.bulk_buffer.aliased_indices, set())
+
+        with patch('meniscus.sinks.elasticsearch.sink.time.time',
+                   MagicMock(return_value=1000.0 + sink.ALIAS_RETRY_SECONDS)):
+            self._flush([{'index': {'ok': True}}], [None])
+
+        self.assertEqual(self.es_handler.put_alias.call_count, 2)
+        self.assertEqual(
+            self.bulk_buffer.aliased_indices,
+            set([('meniscus-1234-2013.07.12', None)]))
+
+    def test_alias_is_added_once_by_flushers_sharing_the_cache(self):
+        self.action['_index'] = 'meniscus-1234-2013.07.12'
+        shared_cache = proxy.SharedMemoryCache(proxy.CacheStore())
+        other_buffer = sink.BulkBuffer(
+            self.es_client, handler=self.es_handler)
+        with patch.object(proxy, '_shared_memory_cache', shared_cache):
+            self._flush([{'index': {'ok': True}}], [None])
+            self.bulk_buffer = other_buffer
+            self._flush([{'index': {'ok': True}}], [None])
+
+        self.assertEqual(self.es_handler.put_alias.call_count, 1)
+        self.assertEqual(
+            other_buffer.aliased_indices,
+            set([('meniscus-1234-2013.07.12', None)]))
+
+    def test_failed_alias_is_released_for_other_flushers(self):
+        self.action['_index'] = 'meniscus-1234-2013.07.12'
+        self.es_handler.put_alias.side_effect = [
+            ElasticsearchException, None]
+        shared_cache = proxy.SharedMemoryCache(proxy.CacheStore())
+        other_buffer = sink.BulkBuffer(
+            self.es_client, handler=self.es_handler)
+        with patch.object(proxy, '_shared_memory_cache', shared_cache):
+            self._flush([{'index': {'ok': True}}], [None])
+            self.bulk_buffer = other_buffer
+            self._flush([{'index': {'ok': True}}], [None])
+
+        self.assertEqual(self.es_handler.put_alias.call_count, 2)
+
+    def test_indices_of_past_days_are_forgotten(self):
+        self.bulk_buffer.aliased_indices.update([
+            ('meniscus-1234-2013.07.10', None),
+            ('meniscus-1234-2013.07.11', None),
+            ('meniscus-1234-2013.07.12', None)])
+        self.bulk_buffer._alias_retry_at[
+            ('meniscus-1234-2013.07.09', None)] = 0
+        self._flush([{'index': {'ok': True}}], [None])
+
+        self.assertEqual(self.bulk_buffer.aliased_indices, set([
+            ('meniscus-1234-2013.07.11', None),
+            ('meniscus-1234-2013.07.12', None),
+            ('1234', None)]))
+        self.assertEqual(self.bulk_buffer._alias_retry_at, dict())
+
+    def test_failed_flush_keeps_actions(self):
+        message = MagicMock()
+        self.bulk_buffer.add(self.action, message)
+        self.es_client.bulk.side_effect = ElasticsearchException
+
+        with self.assertRaises(ElasticsearchException):
+            self.bulk_buffer.flush()
+
+        self.assertEqual(len(self.bulk_buffer), 1)
+        self.assertFalse(message.ack.called)
+
+
+class WhenTestingStreamToEs(unittest.TestCase):
+    def setUp(self):
+        self.simple_queue = MagicMock()
+        self.simple_queue.Empty = Empty
+        self.message = MagicMock()
+        self.message.content_type = 'application/json'
+        self.message.payload = {'_index': '1234', '_source': {}}
+        self.bulk_buffer = MagicMock()
+        self.bulk_buffer.is_full.return_value = False
+        self.bulk_buffer.wait_time.return_value = None
+        self.bulk_buffer.is_due.side_effect = [False, True, False]
+        self.bulk_buffer.flush.return_value = (1, 0)
+        self.stop_event = MagicMock()
+        self.stop_event.is_set.side_effect = [False, False, False, True]
+        self.counter = MagicMock(value=0)
+
+    def _stream(self, durable=True):
+        sink.stream_to_es(self.simple_queue, self.bulk_buffer,
+                          self.stop_event, self.counter, durable)
+
+    def test_timeout_keeps_buffered_messages(self):
+        self.simple_queue.get.side_effect = [self.message, Empty, Empty]
+        self._stream()
+
+        self.bulk_buffer.add.assert_called_once_with(
+            self.message.payload, self.message)
+        self.simple_queue.get.assert_called_with(
+            block=True, timeout=sink.IDLE_TIMEOUT)
+
+    def test_waits_no_longer_than_linger(self):
+        self.bulk_buffer.wait_time.return_value = 0.25
+        self.simple_queue.get.side_effect = Empty
+        self._stream()
+        self.simple_queue.get.assert_called_with(block=True, timeout=0.25)
+
+    def test_does_not_pull_while_full(self):
+        self.bulk_buffer.is_full.return_value = True
+        self.bulk_buffer.flush.side_effect = ElasticsearchException
+        self._stream()
+        self.assertFalse(self.simple_queue.get.called)
+        self.stop_event.wait.assert_called_once_with(
+            sink.BULK_RETRY_SECONDS)
+
+    def test_transient_messages_are_not_held_for_ack(self):
+        self.simple_queue.get.side_effect = [self.message, Empty, Empty]
+        self._stream(durable=False)
+        self.bulk_buffer.add.assert_called_once_with(
+            self.message.payload, None)
+
+    def test_encoded_messages_are_added_without_decoding(self):
+        self.message.content_type = sink.BULK_CONTENT_TYPE
+        self.message.headers = {sink.INDEX_HEADER: 'meniscus-shared_1',
+                                sink.ROUTING_HEADER: '1234'}
+        self.simple_queue.get.side_effect = [self.message, Empty, Empty]
+        self._stream()
+
+        self.bulk_buffer.add_encoded.assert_called_once_with(
+            self.message.body, 'meniscus-shared_1', '1234', self.message)
+        self.assertFalse(self.bulk_buffer.add.called)
+
+    def test_stop_drains_buffer_and_counts_actions(self):
+        self.simple_queue.get.side_effect = [self.message, Empty, Empty]
+        self._stream()
+
+        self.assertEqual(self.bulk_buffer.flush.call_count, 2)
+        self.assertEqual(self.counter.value, 2)
+
+    def test_counters_are_logged_periodically(self):
+        self.simple_queue.get.side_effect = Empty
+        self.bulk_buffer.counters = {'indexed': 3}
+        with patch.object(sink, 'STATS_LOG_SECONDS', 0), \
+                patch.object(sink, '_LOG') as log:
+            self._stream()
+
+        self.assertEqual(log.info.call_count, 3)
+        log.info.assert_called_with(
+            "elasticsearch flusher counters: {'indexed': 3}")
+
+
+class WhenTestingFlushToEs(unittest.TestCase):
+    def setUp(self):
+        self.connection = MagicMock()
+        self.stop_event = MagicMock()
+        self.stop_event.is_set.side_effect = [False, True]
+        self.counter = MagicMock(value=0)
+
+    def _flush_to_es(self, durable):
+        with patch.object(sink, 'Connection') as connection, \
+                patch.object(sink, 'es_transient_queue', MagicMock(),
+                             create=True), \
+                patch.object(sink, 'stream_to_es') as stream_to_es:
+            connection.return_value.__enter__.return_value = self.connection
+            sink.flush_to_es(self.stop_event, self.counter, durable,
+                             bulk_size=250)
+        return stream_to_es.call_args[0]
+
+    def test_prefetch_matches_bulk_size(self):
+        simple_queue, bulk_buffer, stop_event, counter, durable = \
+            self._flush_to_es(True)
+
+        self.connection.SimpleQueue.assert_called_once_with(
+            sink.ELASTICSEARCH_QUEUE)
+        simple_queue.consumer.qos.assert_called_once_with(prefetch_count=250)
+        self.assertEqual(bulk_buffer.max_docs, 250)
+        self.assertIs(stop_event, self.stop_event)
+        self.assertIs(counter, self.counter)
+        self.assertTrue(durable)
+
+    def test_transient_queue_is_not_acknowledged(self):
+        self._flush_to_es(False)
+        self.assertTrue(
+            self.connection.SimpleQueue.call_args[1]['no_ack'])
+
+
+class WhenTestingElasticSearchStreamBulker(unittest.TestCase):
+    def test_pools_are_sized_by_processes(self):
+        bulker = sink.ElasticSearchStreamBulker(
+            bulk_size=50, processes=3, transient=True)
+
+        self.assertEqual(len(bulker.pools), 2)
+        for pool, durable in zip(bulker.pools, (True, False)):
+            self.assertEqual(pool.processes, 3)
+            self.assertEqual(pool.target.keywords,
+                             {'durable': durable, 'bulk_size': 50})
+
+    def test_transient_pool_is_only_run_when_enabled(self):
+        bulker = sink.ElasticSearchStreamBulker(processes=3, transient=False)
+
+        self.assertEqual(len(bulker.pools), 1)
+        self.assertTrue(bulker.pools[0].target.keywords['durable'])
+
+    def test_start_runs_a_process_for_each_pool(self):
+        bulker = sink.ElasticSearchStreamBulker(processes=1, transient=True)
+        with patch.object(sink, 'Process') as process:
+            pool_processes = bulker.start()
+
+        self.assertEqual(len(pool_processes), 2)
+        self.assertEqual(
+            [call[1]['target'] for call in process.call_args_list],
+            [pool.run for pool in bulker.pools])
+
+
+if __name__ == '__main__':
+    unittest.main()
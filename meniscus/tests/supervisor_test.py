@@ -0,0 +1,110 @@
+import os
+import time
+import unittest
+
+from mock import patch
+
+from meniscus.supervisor import ProcessSupervisor
+
+
+def suite():
+
+    suite = unittest.TestSuite()
+    suite.addTest(WhenTestingProcessSupervisor())
+    return suite
+
+
+def _count_until_stopped(stop_event, counter):
+    while not stop_event.is_set():
+        counter.value += 1
+        stop_event.wait(0.01)
+
+
+def _exit_immediately(stop_event, counter):
+    os._exit(1)
+
+
+class WhenTestingProcessSupervisor(unittest.TestCase):
+    def _supervisor(self, target, processes=2):
+        supervisor = ProcessSupervisor(
+            target, processes=processes, restart_backoff=0.01,
+            max_restart_backoff=0.05, check_interval=0.01)
+        self.addCleanup(supervisor.stop, 1.0)
+        return supervisor
+
+    def test_processes_defaults_to_cpu_count(self):
+        with patch('meniscus.supervisor.cpu_count', return_value=3):
+            supervisor = ProcessSupervisor(_count_until_stopped)
+        self.assertEqual(len(supervisor.slots), 3)
+
+    def test_start_runs_every_process(self):
+        supervisor = self._supervisor(_count_until_stopped)
+        supervisor.start()
+
+        pids = [slot.process.pid for slot in supervisor.slots]
+        self.assertEqual(len(set(pids)), 2)
+        self.assertTrue(
+            all(slot.process.is_alive() for slot in supervisor.slots))
+
+    def test_stop_waits_for_processes(self):
+        supervisor = self._supervisor(_count_until_stopped)
+        supervisor.start()
+        supervisor.stop(1.0)
+
+        self.assertFalse(
+            any(slot.process.is_alive() for slot in supervisor.slots))
+        self.assertTrue(
+            all(slot.process.exitcode == 0 for slot in supervisor.slots))
+
+    def test_check_restarts_exited_processes(self):
+        supervisor = self._supervisor(_exit_immediately, processes=1)
+        supervisor.start()
+        slot = supervisor.slots[0]
+        first_pid = slot.process.pid
+        slot.process.join()
+
+        supervisor.check()
+        self.assertEqual(slot.restarts.value, 0)
+        self.assertEqual(slot.failures, 1)
+
+        time.sleep(0.02)
+        supervisor.check()
+        self.assertEqual(slot.restarts.value, 1)
+        self.assertNotEqual(slot.process.pid, first_pid)
+
+    def test_check_backs_off_repeated_failures(self):
+        supervisor = self._supervisor(_exit_immediately, processes=1)
+        supervisor.start()
+        slot = supervisor.slots[0]
+        slot.failures = 2
+        slot.process.join()
+
+        now = time.time()
+        supervisor.check()
+        self.assertAlmostEqual(slot.restart_at - now, 0.04, places=2)
+
+    def test_check_does_not_restart_when_stopping(self):
+        supervisor = self._supervisor(_exit_immediately, processes=1)
+        supervisor.start()
+        supervisor.slots[0].process.join()
+        supervisor.stop_event.set()
+
+        supervisor.check()
+        self.assertIsNone(supervisor.slots[0].restart_at)
+
+    def test_stats_reports_rates(self):
+        supervisor = self._supervisor(_count_until_stopped, processes=1)
+        supervisor.start()
+        supervisor.stats()
+        time.sleep(0.1)
+
+        stats = supervisor.stats()
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]['pid'], supervisor.slots[0].process.pid)
+        self.assertEqual(stats[0]['restarts'], 0)
+        self.assertTrue(stats[0]['count'] > 0)
+        self.assertTrue(stats[0]['rate'] > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
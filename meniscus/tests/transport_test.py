@@ -53,7 +53,7 @@ class WhenTestingZeroMqReceiver(unittest.TestCase):
         with patch('meniscus.transport.zmq', self.zmq_mock):
             self.receiver.connect()
         self.receiver.get()
-        self.socket_mock.recv.assert_called_once()
+        self.socket_mock.recv_multipart.assert_called_once_with()
 
         self.receiver.close()
         with self.assertRaises(transport.zmq.error.ZMQError):
@@ -69,6 +69,68 @@ class WhenTestingZeroMqReceiver(unittest.TestCase):
         self.assertIsNone(self.receiver.socket)
         self.assertFalse(self.receiver.connected)
 
+    def test_connect_sets_rcvhwm(self):
+        receiver = transport.ZeroMQReceiver(
+            self.connect_host_tuples, rcvhwm=50)
+        with patch('meniscus.transport.zmq', self.zmq_mock):
+            receiver.connect()
+        self.socket_mock.setsockopt.assert_called_once_with(
+            self.zmq_mock.RCVHWM, 50)
+
+    def test_get_batch_returns_when_full(self):
+        with patch('meniscus.transport.zmq', self.zmq_mock):
+            self.receiver.connect()
+        self.socket_mock.recv_multipart.side_effect = [
+            ['a'], ['b'], ['c'], ['d']]
+        frames = self.receiver.get_batch(3, 10)
+        self.assertEqual(frames, [['a'], ['b'], ['c']])
+        self.socket_mock.recv_multipart.assert_any_call(copy=False)
+
+    def test_get_batch_returns_when_no_more_messages(self):
+        with patch('meniscus.transport.zmq', self.zmq_mock):
+            self.receiver.connect()
+        self.socket_mock.recv_multipart.side_effect = [
+            ['a'], transport.zmq.Again, ['b'], transport.zmq.Again]
+        self.receiver.poller.poll.side_effect = [[1], []]
+        self.zmq_mock.Again = transport.zmq.Again
+        time_mock = MagicMock()
+        time_mock.time.return_value = 1000.0
+        with patch('meniscus.transport.zmq', self.zmq_mock), \
+                patch('meniscus.transport.time', time_mock):
+            frames = self.receiver.get_batch(10, 100)
+        self.assertEqual(frames, [['a'], ['b']])
+        self.assertEqual(self.receiver.poller.poll.call_count, 2)
+
+    def test_get_batch_returns_when_linger_expires(self):
+        with patch('meniscus.transport.zmq', self.zmq_mock):
+            self.receiver.connect()
+        self.socket_mock.recv_multipart.side_effect = [
+            ['a'], transport.zmq.Again]
+        self.zmq_mock.Again = transport.zmq.Again
+        time_mock = MagicMock()
+        time_mock.time.side_effect = [1000.0, 1000.2]
+        with patch('meniscus.transport.zmq', self.zmq_mock), \
+                patch('meniscus.transport.time', time_mock):
+            frames = self.receiver.get_batch(10, 100)
+        self.assertEqual(frames, [['a']])
+        self.assertFalse(self.receiver.poller.poll.called)
+
+    def test_get_batch_not_connected(self):
+        with self.assertRaises(transport.zmq.error.ZMQError):
+            self.receiver.get_batch(10, 10)
+
+    def test_wait_polls_socket(self):
+        with patch('meniscus.transport.zmq', self.zmq_mock):
+            self.receiver.connect()
+        self.receiver.poller.poll.side_effect = [[1], []]
+        self.assertTrue(self.receiver.wait(50))
+        self.assertFalse(self.receiver.wait(50))
+        self.receiver.poller.poll.assert_called_with(50)
+
+    def test_wait_not_connected(self):
+        with self.assertRaises(transport.zmq.error.ZMQError):
+            self.receiver.wait(10)
+
 
 class WhenTestingReceiverFactory(unittest.TestCase):
 
@@ -95,6 +157,7 @@ class WhenTestingReceiverFactory(unittest.TestCase):
 class WhenTestingZeroMQInputServer(unittest.TestCase):
     def setUp(self):
         self.receiver_mock = MagicMock()
+        self.receiver_mock.codec = transport.JsonCodec()
 
         #create a test class from the base class and override process_msg
         class TestInputServer(transport.ZeroMQInputServer):
@@ -121,11 +184,147 @@ class WhenTestingZeroMQInputServer(unittest.TestCase):
         self.assertTrue(self.server.process_msg_called)
 
     def test_get_msg_returns_dict(self):
-        self.receiver_mock.get.return_value = self.valid_json_msg
+        self.receiver_mock.get.return_value = [self.valid_json_msg]
         msg = self.server._get_msg()
         self.receiver_mock.get.assert_called_once_with()
         self.assertEquals(msg, self.msg)
 
+    def test_get_msg_returns_rest_of_batch(self):
+        codec = transport.JsonCodec()
+        self.receiver_mock.get.return_value = [
+            'json+batch', transport.encode_batch(codec, [{'a': 1}, {'b': 2}])]
+        self.assertEqual(self.server._get_msg(), {'a': 1})
+        self.assertEqual(self.server._get_msg(), {'b': 2})
+        self.receiver_mock.get.assert_called_once_with()
+
+    def test_get_msg_logs_bad_message(self):
+        self.receiver_mock.get.return_value = [self.bad_msg]
+        self.assertIsNone(self.server._get_msg())
+
+    def test_get_batch_returns_decoded_messages(self):
+        good_frame = MagicMock()
+        good_frame.bytes = self.valid_json_msg
+        bad_frame = MagicMock()
+        bad_frame.bytes = self.bad_msg
+        self.receiver_mock.get_batch.return_value = [
+            [good_frame], [bad_frame], [good_frame]]
+        server = transport.ZeroMQInputServer(
+            self.receiver_mock, batch_size=3, batch_linger_ms=5)
+        msgs = server._get_batch()
+        self.receiver_mock.get_batch.assert_called_once_with(3, 5)
+        self.assertEqual(msgs, [self.msg, self.msg])
+
+    def test_start_processes_batches(self):
+        class TestBatchServer(transport.ZeroMQInputServer):
+            def process_batch(self):
+                self.process_batch_called = True
+                self.stop()
+
+        server = TestBatchServer(self.receiver_mock, batch_size=10)
+        server.start()
+        self.assertTrue(server.process_batch_called)
+
+    def test_start_stops_when_stop_event_set(self):
+        stop_event = MagicMock()
+        stop_event.is_set.side_effect = [False, False, True]
+        self.receiver_mock.wait.side_effect = [False, True]
+
+        class TestEventServer(transport.ZeroMQInputServer):
+            processed = 0
+
+            def process_msg(self):
+                self.processed += 1
+
+        server = TestEventServer(self.receiver_mock, stop_event=stop_event)
+        server.start()
+        self.assertEqual(server.processed, 1)
+        self.assertTrue(server._stop)
+        self.receiver_mock.close.assert_called_once_with()
+
+    def test_get_msg_counts_messages(self):
+        counter = MagicMock()
+        counter.value = 0
+        self.receiver_mock.get.return_value = [self.valid_json_msg]
+        server = transport.ZeroMQInputServer(
+            self.receiver_mock, message_counter=counter)
+        server._get_msg()
+        self.assertEqual(counter.value, 1)
+
+    def test_get_batch_counts_messages(self):
+        counter = MagicMock()
+        counter.value = 0
+        frame = MagicMock()
+        frame.bytes = self.valid_json_msg
+        self.receiver_mock.get_batch.return_value = [[frame], [frame]]
+        server = transport.ZeroMQInputServer(
+            self.receiver_mock, batch_size=2, message_counter=counter)
+        server._get_batch()
+        self.assertEqual(counter.value, 2)
+
+
+class WhenTestingCodecs(unittest.TestCase):
+    def setUp(self):
+        self.codec = transport.JsonCodec()
+        self.msgs = [{'key': 'value'}, {'key': 'other value'}]
+
+    def test_json_codec(self):
+        data = self.codec.encode(self.msgs[0])
+        self.assertEqual(self.codec.decode(data), self.msgs[0])
+
+    def test_batch_round_trip(self):
+        payload = transport.encode_batch(self.codec, self.msgs)
+        self.assertEqual(
+            transport.decode_batch(self.codec, payload), self.msgs)
+
+    def test_decode_batch_truncated(self):
+        payload = transport.encode_batch(self.codec, self.msgs)
+        with self.assertRaises(transport.CodecError):
+            transport.decode_batch(self.codec, payload[:-1])
+        with self.assertRaises(transport.CodecError):
+            transport.decode_batch(self.codec, payload[:2])
+
+    def test_get_codec(self):
+        self.assertIsInstance(
+            transport.get_codec('json'), transport.JsonCodec)
+        with self.assertRaises(transport.CodecError):
+            transport.get_codec('xml')
+
+    def test_msgpack_codec_requires_msgpack(self):
+        with patch('meniscus.transport.msgpack', None):
+            with self.assertRaises(transport.CodecError):
+                transport.MsgpackCodec()
+
+    def test_msgpack_codec(self):
+        msgpack = MagicMock()
+        with patch('meniscus.transport.msgpack', msgpack):
+            codec = transport.MsgpackCodec()
+            codec.encode(self.msgs[0])
+            codec.decode('data')
+        msgpack.packb.assert_called_once_with(self.msgs[0])
+        msgpack.unpackb.assert_called_once_with('data')
+
+    def test_decode_message_single_frame(self):
+        frame = MagicMock()
+        frame.bytes = '{"key": "value"}'
+        self.assertEqual(
+            transport.decode_message([frame], self.codec), [self.msgs[0]])
+
+    def test_decode_message_with_codec_frame(self):
+        self.assertEqual(
+            transport.decode_message(
+                ['json', '{"key": "value"}'], MagicMock()),
+            [self.msgs[0]])
+
+    def test_decode_message_batch(self):
+        payload = transport.encode_batch(self.codec, self.msgs)
+        self.assertEqual(
+            transport.decode_message(['json+batch', payload], MagicMock()),
+            self.msgs)
+
+    def test_decode_message_too_many_frames(self):
+        with self.assertRaises(transport.CodecError):
+            transport.decode_message(['json', '{}', '{}'], self.codec)
+
 
 class WhenTestingZeroMqCaster(unittest.TestCase):
 
@@ -177,6 +376,29 @@ class WhenTestingZeroMqCaster(unittest.TestCase):
         with self.assertRaises(transport.zmq.error.ZMQError):
             self.caster.cast(self.msg)
 
+    def test_cast_with_codec(self):
+        caster = transport.ZeroMQCaster(
+            self.bind_host_tuple, codec=transport.JsonCodec())
+        with patch('meniscus.transport.zmq', self.zmq_mock):
+            caster.bind()
+        caster.cast({'key': 'value'})
+        self.socket_mock.send_multipart.assert_called_once_with(
+            ['json', self.msg])
+
+    def test_cast_batch(self):
+        with patch('meniscus.transport.zmq', self.zmq_mock):
+            self.caster.bind()
+        msgs = [{'key': 'value'}, {'key': 'value'}]
+        self.caster.cast_batch(msgs)
+        header, payload = self.socket_mock.send_multipart.call_args[0][0]
+        self.assertEqual(header, 'json+batch')
+        self.assertEqual(
+            transport.decode_batch(transport.JsonCodec(), payload), msgs)
+
+    def test_cast_batch_not_bound(self):
+        with self.assertRaises(transport.zmq.error.ZMQError):
+            self.caster.cast_batch([{'key': 'value'}])
+
     def test_close(self):
         with patch('meniscus.transport.zmq', self.zmq_mock):
             self.caster.bind()
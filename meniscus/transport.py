@@ -2,12 +2,27 @@
 The transport module defines the classes that serve as the transport layer for
 Meniscus when passing log messages between nodes.  ZeroMQ is used as the
 transport mechanism.
+
+A zmq message with a single frame holds one message encoded with the
+receiver's default codec, which is how upstream hosts that send plain JSON
+strings are read. A sender can instead send a two frame message, where the
+first frame names the codec of the second. A codec name ending in "+batch"
+marks a second frame holding many messages, each prefixed by its length as a
+4 byte unsigned big endian integer.
 """
 
+import struct
+import time
+
 from oslo.config import cfg
 import simplejson as json
 import zmq
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 import meniscus.config as config
 from meniscus import env
 
@@ -25,7 +40,27 @@ _ZMQ_OPTS = [
     cfg.ListOpt('zmq_upstream_hosts',
                 default=['127.0.0.1:5000'],
                 help='list of upstream host:port pairs to poll for '
-                     'zmq messages')
+                     'zmq messages'),
+    cfg.IntOpt('batch_size',
+               default=100,
+               help='maximum number of messages received and processed '
+                    'as one batch, 1 processes messages one at a time'),
+    cfg.IntOpt('batch_linger_ms',
+               default=10,
+               help='time in milliseconds to wait for more messages '
+                    'before processing a batch that is not full'),
+    cfg.IntOpt('rcvhwm',
+               default=1000,
+               help='maximum number of messages queued by a receive '
+                    'socket before the upstream host stops sending'),
+    cfg.IntOpt('receiver_processes',
+               default=0,
+               help='number of processes receiving messages from the '
+                    'upstream hosts, 0 runs one process per core'),
+    cfg.StrOpt('codec',
+               default='json',
+               help='codec of messages received without a codec frame, '
+                    'json or msgpack')
 ]
 
 config.get_config().register_opts(_ZMQ_OPTS, group=_ZMQ_GROUP)
@@ -37,6 +72,126 @@ except config.cfg.ConfigFilesNotFoundError as ex:
 
 _CONF = config.get_config()
 
+BATCH_SIZE = _CONF.zmq_in.batch_size
+BATCH_LINGER_MS = _CONF.zmq_in.batch_linger_ms
+RECEIVER_PROCESSES = _CONF.zmq_in.receiver_processes
+CODEC = _CONF.zmq_in.codec
+
+BATCH_SUFFIX = '+batch'
+_LENGTH_PREFIX = struct.Struct('!I')
+
+
+class CodecError(Exception):
+    pass
+
+
+class JsonCodec(object):
+    """
+    Encodes messages as JSON strings
+    """
+    name = 'json'
+
+    def encode(self, msg):
+        return json.dumps(msg)
+
+    def decode(self, data):
+        return json.loads(data)
+
+
+class MsgpackCodec(object):
+    """
+    Encodes messages with msgpack, which is smaller and faster to decode than
+    JSON. The msgpack package is optional and only needed by this codec.
+    """
+    name = 'msgpack'
+
+    def __init__(self):
+        if msgpack is None:
+            raise CodecError('the msgpack codec requires the msgpack package')
+
+    def encode(self, msg):
+        return msgpack.packb(msg)
+
+    def decode(self, data):
+        return msgpack.unpackb(data)
+
+
+_CODECS = {
+    JsonCodec.name: JsonCodec,
+    MsgpackCodec.name: MsgpackCodec
+}
+
+_codec_instances = dict()
+
+
+def get_codec(name):
+    """
+    Returns the codec registered under a name
+    """
+    if name not in _codec_instances:
+        try:
+            _codec_instances[name] = _CODECS[name]()
+        except KeyError:
+            raise CodecError('unknown codec: {0}'.format(name))
+    return _codec_instances[name]
+
+
+def encode_batch(codec, msgs):
+    """
+    Encodes a list of messages as one string of length prefixed messages
+    """
+    encoded = list()
+    for msg in msgs:
+        data = codec.encode(msg)
+        encoded.append(_LENGTH_PREFIX.pack(len(data)))
+        encoded.append(data)
+    return ''.join(encoded)
+
+
+def decode_batch(codec, payload):
+    """
+    Decodes a string of length prefixed messages into a list of messages
+    """
+    msgs = list()
+    offset = 0
+    end = len(payload)
+
+    while offset < end:
+        if offset + _LENGTH_PREFIX.size > end:
+            raise CodecError('truncated message batch')
+        (length,) = _LENGTH_PREFIX.unpack_from(payload, offset)
+        offset += _LENGTH_PREFIX.size
+
+        if offset + length > end:
+            raise CodecError('truncated message batch')
+        msgs.append(codec.decode(payload[offset:offset + length]))
+        offset += length
+
+    return msgs
+
+
+def decode_message(parts, default_codec):
+    """
+    Decodes the frames of a zmq message into a list of messages. A single
+    frame is decoded with the default codec, otherwise the first frame names
+    the codec of the second.
+    """
+    parts = [getattr(part, 'bytes', part) for part in parts]
+
+    if len(parts) == 1:
+        return [default_codec.decode(parts[0])]
+
+    if len(parts) != 2:
+        raise CodecError(
+            'expected 1 or 2 message frames, received {0}'.format(len(parts)))
+
+    header, payload = parts
+    if header.endswith(BATCH_SUFFIX):
+        codec = get_codec(header[:-len(BATCH_SUFFIX)])
+        return decode_batch(codec, payload)
+
+    return [get_codec(header).decode(payload)]
+
 
 class ZeroMQReceiver(object):
     """
@@ -45,19 +200,26 @@ class ZeroMQReceiver(object):
     connect to multiple upstream hosts.
     """
 
-    def __init__(self, connect_host_tuples):
+    def __init__(self, connect_host_tuples, rcvhwm=None, codec=None):
         """
         Creates an instance of the ZeroMQReceiver.
 
         :param connect_host_tuples: [(host, port), (host, port)],
         for example [('127.0.0.1', '5000'), ('127.0.0.1', '5001')]
+        :param rcvhwm: the receive high water mark of the socket, or None to
+        use the zmq default
+        :param codec: the codec of messages received without a codec frame,
+        JSON by default
         """
         self.upstream_hosts = [
             "tcp://{}:{}".format(*host_tuple)
             for host_tuple in connect_host_tuples]
         self.socket_type = zmq.PULL
+        self.rcvhwm = rcvhwm
+        self.codec = codec or JsonCodec()
         self.context = None
         self.socket = None
+        self.poller = None
         self.connected = False
 
     def connect(self):
@@ -69,19 +231,61 @@ class ZeroMQReceiver(object):
         self.context = zmq.Context()
         self.socket = self.context.socket(self.socket_type)
 
+        if self.rcvhwm is not None:
+            self.socket.setsockopt(zmq.RCVHWM, self.rcvhwm)
+
         for host in self.upstream_hosts:
             self.socket.connect(host)
 
+        self.poller = zmq.Poller()
+        self.poller.register(self.socket, zmq.POLLIN)
+
         self.connected = True
 
     def get(self):
         """
-        Read a message form the zmq socket and return
+        Read a message form the zmq socket and return its frames
+        """
+        if not self.connected:
+            raise zmq.error.ZMQError(
+                "ZeroMQReceiver is not connected to a socket")
+        return self.socket.recv_multipart()
+
+    def get_batch(self, max_messages, linger_ms):
+        """
+        Read up to max_messages messages from the zmq socket. The call blocks
+        until a message is received, then waits at most linger_ms
+        milliseconds for the rest of the batch. Each message is returned as a
+        list of zmq frames, so that they are not copied out of zmq before
+        they are decoded.
         """
         if not self.connected:
             raise zmq.error.ZMQError(
                 "ZeroMQReceiver is not connected to a socket")
-        return self.socket.recv()
+
+        frames = [self.socket.recv_multipart(copy=False)]
+        deadline = time.time() + linger_ms / 1000.0
+
+        while len(frames) < max_messages:
+            try:
+                frames.append(
+                    self.socket.recv_multipart(zmq.NOBLOCK, copy=False))
+            except zmq.Again:
+                remaining_ms = (deadline - time.time()) * 1000
+                if remaining_ms <= 0 or not self.poller.poll(remaining_ms):
+                    break
+
+        return frames
+
+    def wait(self, timeout_ms):
+        """
+        Wait at most timeout_ms milliseconds for a message to be ready on the
+        zmq socket. Returns True if a message can be read.
+        """
+        if not self.connected:
+            raise zmq.error.ZMQError(
+                "ZeroMQReceiver is not connected to a socket")
+        return bool(self.poller.poll(timeout_ms))
 
     def close(self):
         """
@@ -92,6 +296,7 @@ class ZeroMQReceiver(object):
             self.context.destroy()
             self.socket = None
             self.context = None
+            self.poller = None
             self.connected = False
 
 
@@ -107,7 +312,8 @@ def new_zmq_receiver():
         for host_port_str in _CONF.zmq_in.zmq_upstream_hosts
     ]
 
-    return ZeroMQReceiver(upstream_hosts)
+    return ZeroMQReceiver(upstream_hosts, rcvhwm=_CONF.zmq_in.rcvhwm,
+                          codec=get_codec(CODEC))
 
 
 class ZeroMQInputServer(object):
@@ -118,14 +324,30 @@ class ZeroMQInputServer(object):
     order to implement the desired behavior.
     """
 
-    def __init__(self, zmq_receiver):
+    #time in milliseconds to wait for a message before checking for a stop
+    STOP_POLL_MS = 500
+
+    def __init__(self, zmq_receiver, batch_size=1, batch_linger_ms=0,
+                 stop_event=None, message_counter=None):
         """
         Creates a new instance of ZeroMQInputServer by setting the receiver to
         be used to pull messages.
 
         :param zmq_receiver: an instance of ZeroMQReceiver
+        :param batch_size: the maximum number of messages passed to
+        process_batch(), or 1 to call process_msg() for each message
+        :param batch_linger_ms: time to wait for a batch to fill
+        :param stop_event: an optional multiprocessing.Event that stops the
+        server when set, used when the server runs in a child process
+        :param message_counter: an optional shared value incremented for
+        each message received
         """
         self.zmq_receiver = zmq_receiver
+        self.batch_size = batch_size
+        self.batch_linger_ms = batch_linger_ms
+        self.stop_event = stop_event
+        self.message_counter = message_counter
+        self._pending = list()
         self._stop = True
 
     def start(self):
@@ -138,8 +360,23 @@ class ZeroMQInputServer(object):
         self.zmq_receiver.connect()
         self._stop = False
 
-        while not self._stop:
-            self.process_msg()
+        process = self.process_msg
+        if self.batch_size > 1:
+            process = self.process_batch
+
+        try:
+            while not self._stop:
+                if self.stop_event is None:
+                    process()
+                    continue
+
+                if self.stop_event.is_set():
+                    self.stop()
+                elif self._pending or self.zmq_receiver.wait(
+                        self.STOP_POLL_MS):
+                    process()
+        finally:
+            self.zmq_receiver.close()
 
     def stop(self):
         """
@@ -147,6 +384,10 @@ class ZeroMQInputServer(object):
         """
         self._stop = True
 
+    def _count(self, count):
+        if self.message_counter is not None:
+            self.message_counter.value += count
+
     def process_msg(self):
         """
         This method should be overridden to implement the desired message
@@ -155,16 +396,60 @@ class ZeroMQInputServer(object):
         """
         pass
 
+    def process_batch(self):
+        """
+        This method should be overridden to implement the desired processing
+        of a batch of messages when the server is created with a batch_size
+        greater than 1. To retrieve the batch for processing you can call:
+        >>>  msgs = self._get_batch()
+        """
+        pass
+
     def _get_msg(self):
         """
-        Pulls a JSON message received over the ZeroMQ socket.  This call will
-        block until a message is received.
+        Pulls a message received over the ZeroMQ socket.  This call will
+        block until a message is received. When a batch of messages is
+        received the rest of the batch is returned by the following calls.
+        """
+        if self._pending:
+            return self._pending.pop()
+
+        try:
+            msgs = decode_message(
+                self.zmq_receiver.get(), self.zmq_receiver.codec)
+        except Exception as ex:
+            _LOG.exception(ex)
+            return None
+
+        self._count(len(msgs))
+        if not msgs:
+            return None
+
+        self._pending = msgs[:0:-1]
+        return msgs[0]
+
+    def _get_batch(self):
+        """
+        Pulls a batch of messages received over the ZeroMQ socket. This call
+        will block until at least one message is received. Messages that can
+        not be decoded are logged and left out of the batch.
         """
         try:
-            msg = self.zmq_receiver.get()
-            return json.loads(msg)
+            frames = self.zmq_receiver.get_batch(
+                self.batch_size, self.batch_linger_ms)
         except Exception as ex:
             _LOG.exception(ex)
+            return list()
+
+        msgs = list()
+        for parts in frames:
+            try:
+                msgs.extend(decode_message(parts, self.zmq_receiver.codec))
+            except Exception as ex:
+                _LOG.exception(ex)
+
+        self._count(len(msgs))
+        return msgs
 
 
 class ZeroMQCaster(object):
@@ -175,15 +460,18 @@ class ZeroMQCaster(object):
     across the clients.
     """
 
-    def __init__(self, bind_host_tuple):
+    def __init__(self, bind_host_tuple, codec=None):
         """
         Creates an instance of the ZeroMQCaster.  A zmq PUSH socket is
         created and is bound to the specified host:port.
 
         :param bind_host_tuple: (host, port), for example ('127.0.0.1', '5000')
+        :param codec: the codec used to encode messages, or None to send
+        messages as strings without a codec frame
         """
 
         self.socket_type = zmq.PUSH
+        self.codec = codec
         self.bind_host = 'tcp://{0}:{1}'.format(*bind_host_tuple)
         self.context = None
         self.socket = None
@@ -202,13 +490,33 @@ class ZeroMQCaster(object):
 
     def cast(self, msg):
         """
-        Sends a message over the zmq PUSH socket
+        Sends a message over the zmq PUSH socket. Without a codec the message
+        must already be a string.
+        """
+        if not self.bound:
+            raise zmq.error.ZMQError(
+                "ZeroMQCaster is not bound to a socket")
+        try:
+            if self.codec is None:
+                self.socket.send(msg)
+            else:
+                self.socket.send_multipart(
+                    [self.codec.name, self.codec.encode(msg)])
+        except Exception as ex:
+            _LOG.exception(ex)
+
+    def cast_batch(self, msgs):
+        """
+        Sends a list of messages over the zmq PUSH socket as a single zmq
+        message, encoded with the caster's codec or JSON if it has none
         """
         if not self.bound:
             raise zmq.error.ZMQError(
                 "ZeroMQCaster is not bound to a socket")
+        codec = self.codec or get_codec(JsonCodec.name)
         try:
-            self.socket.send(msg)
+            self.socket.send_multipart(
+                [codec.name + BATCH_SUFFIX, encode_batch(codec, msgs)])
         except Exception as ex:
             _LOG.exception(ex)
 
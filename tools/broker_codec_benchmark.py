@@ -0,0 +1,153 @@
+"""
+Compares the serialization and compression methods that can be configured in
+the celery group of the meniscus config. For each combination the benchmark
+reports the number of bytes a message occupies on the broker, and how many
+messages per second can be encoded and decoded.
+
+Usage:
+    PYTHONPATH=. python tools/broker_codec_benchmark.py [-n COUNT]
+        [--native-size BYTES] [--messages FILE]
+
+FILE holds one JSON message per line. Without it a correlated syslog message
+is generated, with structured data of about BYTES bytes.
+"""
+
+import argparse
+import json
+import time
+
+from kombu import compression
+from kombu import serialization
+
+from meniscus.openstack.common import timeutils
+#registers lz4 with kombu when the lz4 package is installed
+import meniscus.queue  # noqa
+
+
+SERIALIZERS = ('json', 'msgpack')
+COMPRESSIONS = (None, 'zlib', 'bzip2', 'lz4')
+
+
+def sample_message(native_size):
+    """
+    Builds a correlated syslog message with native structured data of about
+    native_size bytes, with the same value types as the correlator produces
+    """
+    field_count = max(native_size // 32, 1)
+    native = dict(
+        ('field{0:04d}'.format(index), 'value {0:020d}'.format(index))
+        for index in range(field_count))
+
+    return {
+        'host': 'tohru',
+        'pname': 'apache',
+        'pri': '46',
+        'ver': '1',
+        'pid': '234',
+        'msgid': '345',
+        'time': '2013-07-12T14:17:00+00:00',
+        'msg': '127.0.0.1 - - [12/Jul/2013:19:40:58 +0000] '
+               '"GET /test.html HTTP/1.1" 404 466 "-" "curl/7.29.0"',
+        'native': native,
+        'meniscus': {
+            'tenant': '5164b8f4-16fb-4376-9d29-8a6cbaa02fa9',
+            'correlation': {
+                'tenant_name': 'tenant',
+                'ep_id': 432,
+                'pattern': 'apache',
+                'durable': False,
+                'encrypted': False,
+                'sinks': ['elasticsearch'],
+                'destinations': {'elasticsearch': {
+                    'transaction_id': None, 'transaction_time': None}},
+                '@timestamp': timeutils.utcnow().isoformat()
+            }
+        }
+    }
+
+
+def load_messages(path):
+    with open(path) as messages_file:
+        return [json.loads(line) for line in messages_file if line.strip()]
+
+
+def available(serializer, compression_name):
+    """
+    Returns True if the packages needed by a combination are installed
+    """
+    try:
+        content_type, encoding, body = serialization.dumps({}, serializer)
+        if compression_name:
+            compression.compress(body, compression_name)
+    except (serialization.SerializerNotInstalled, KeyError):
+        return False
+    return True
+
+
+def run(messages, count, serializer, compression_name):
+    """
+    Encodes and decodes count messages, returning the average encoded size
+    and the encode and decode rates in messages per second
+    """
+    encoded = list()
+    start = time.time()
+    for index in range(count):
+        content_type, encoding, body = serialization.dumps(
+            messages[index % len(messages)], serializer)
+        compression_type = None
+        if compression_name:
+            body, compression_type = compression.compress(
+                body, compression_name)
+        encoded.append((content_type, encoding, compression_type, body))
+    encode_seconds = time.time() - start
+
+    start = time.time()
+    for content_type, encoding, compression_type, body in encoded:
+        if compression_type:
+            body = compression.decompress(body, compression_type)
+        serialization.loads(body, content_type, encoding)
+    decode_seconds = time.time() - start
+
+    average_bytes = sum(
+        len(entry[3]) for entry in encoded) / float(count)
+    return (average_bytes,
+            count / max(encode_seconds, 1e-9),
+            count / max(decode_seconds, 1e-9))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare broker serialization and compression methods')
+    parser.add_argument('-n', '--count', type=int, default=10000,
+                        help='number of messages encoded by each method')
+    parser.add_argument('--native-size', type=int, default=2048,
+                        help='size in bytes of the generated structured data')
+    parser.add_argument('--messages',
+                        help='file with one JSON message on each line')
+    args = parser.parse_args()
+
+    if args.messages:
+        messages = load_messages(args.messages)
+    else:
+        messages = [sample_message(args.native_size)]
+
+    print '{0:<10} {1:<8} {2:>12} {3:>14} {4:>14}'.format(
+        'serializer', 'compress', 'bytes/msg', 'encode msg/s',
+        'decode msg/s')
+
+    for serializer in SERIALIZERS:
+        for compression_name in COMPRESSIONS:
+            if not available(serializer, compression_name):
+                print '{0:<10} {1:<8} not installed'.format(
+                    serializer, compression_name or 'none')
+                continue
+
+            average_bytes, encode_rate, decode_rate = run(
+                messages, args.count, serializer, compression_name)
+            print '{0:<10} {1:<8} {2:>12.0f} {3:>14.0f} {4:>14.0f}'.format(
+                serializer, compression_name or 'none', average_bytes,
+                encode_rate, decode_rate)
+
+
+if __name__ == '__main__':
+    main()
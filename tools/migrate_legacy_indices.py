@@ -0,0 +1,49 @@
+"""
+Migrates the elasticsearch indices written by earlier versions, which indexed
+the messages of each tenant into a single index named after the tenant. Each
+of these indices is added to the meniscus-{tenant_id} alias that finds the
+tenant's messages in the daily indices, so that old and new messages are
+searched together until the legacy index is deleted.
+
+An index is migrated when its name is the id of a tenant in the tenant
+database. The tool can be run again, indices that already carry the alias are
+aliased again without effect.
+
+Usage:
+    PYTHONPATH=. python tools/migrate_legacy_indices.py [--dry-run]
+"""
+
+import argparse
+
+from meniscus.data.handlers.elasticsearch import mapping_tasks
+from meniscus.data.model import tenant_util
+
+
+def legacy_indices(indices):
+    """
+    Returns the indices of a list of indices that are named after a tenant
+    """
+    return [index for index in indices
+            if mapping_tasks.parse_time_index(index) is None
+            and not index.startswith(mapping_tasks.INDEX_PREFIX)
+            and tenant_util.retrieve_tenant(index) is not None]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Alias the legacy per tenant elasticsearch indices')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='show the indices that would be aliased '
+                             'without aliasing them')
+    args = parser.parse_args()
+
+    es_handler = mapping_tasks._es_handler
+    for index in legacy_indices(es_handler.get_indices()):
+        alias = mapping_tasks.tenant_alias_name(index)
+        print '{0} -> {1}'.format(index, alias)
+        if not args.dry_run:
+            es_handler.put_alias(index, alias)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Migrates the elasticsearch mapping of log messages by replacing the
+meniscus_logs index template with the version in this release, in a single
+template update. The template applies to daily indices created after the
+migration, existing indices keep the mapping they were created with.
+
+Workers install a newer template on their own when they start, this tool
+shows which version is installed and can reinstall the template whatever
+version the cluster has, for instance to roll back a migration.
+
+Usage:
+    PYTHONPATH=. python tools/migrate_log_template.py [--dry-run] [--force]
+"""
+
+import argparse
+import json
+
+from meniscus.data.handlers.elasticsearch import mapping_tasks
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Migrate the elasticsearch log template')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='show the versions and template without '
+                             'installing it')
+    parser.add_argument('--force', action='store_true',
+                        help='install the template even if the same or a '
+                             'newer version is installed')
+    args = parser.parse_args()
+
+    installed = mapping_tasks._es_handler.get_template(
+        mapping_tasks.LOG_TEMPLATE_NAME)
+    print 'installed version: {0}'.format(
+        mapping_tasks.template_version(installed))
+    print 'release version: {0}'.format(mapping_tasks.LOG_TEMPLATE_VERSION)
+
+    if args.dry_run:
+        print json.dumps(mapping_tasks.LOG_TEMPLATE, indent=2, sort_keys=True)
+        return
+
+    if mapping_tasks.install_log_template(force=args.force):
+        print 'template installed'
+    else:
+        print 'template is up to date, use --force to reinstall it'
+
+
+if __name__ == '__main__':
+    main()